@@ -0,0 +1,4 @@
+'''Throughput benchmarks for the analyzers and the index/analyze pipelines.
+
+Run with ``python -m benchmarks --help``.
+'''
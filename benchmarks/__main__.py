@@ -0,0 +1,58 @@
+import argparse
+import json
+
+from . import micro, pipeline, startup
+from .corpus import make_corpus
+
+
+def report(results, as_json=False):
+    for result in results:
+        if as_json:
+            print(json.dumps(result))
+            continue
+        if 'target_seconds' in result:
+            line = '{:<28} {:>12,.1f} ms'.format(result['benchmark'], result['seconds'] * 1000)
+            if result['target_seconds'] is not None:
+                line += '  target {:,.0f} ms{}'.format(
+                    result['target_seconds'] * 1000, '' if result['within_target'] else '  (over)'
+                )
+            print(line)
+            continue
+        line = '{:<28} {:>12,.0f} docs/sec'.format(result['benchmark'], result['docs_per_sec'])
+        if 'peak_rss_kb' in result:
+            line += '  peak RSS {:,} KB (workers {:,} KB)'.format(result['peak_rss_kb'], result['peak_worker_rss_kb'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FCC comment analyzers and pipelines')
+    parser.add_argument('suite', choices=['micro', 'pipeline', 'startup', 'all'], nargs='?', default='all')
+    parser.add_argument('--docs', type=int, default=None, help='Corpus size (default: 5000 micro, 1000 startup, 20000 pipeline)')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes per microbenchmark; the best one counts')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=100)
+    parser.add_argument('--slices', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None, help='Tagging processes for the analyze pipeline')
+    parser.add_argument('--concurrency', type=int, default=1, help='ECFS pages in flight for the index pipeline')
+    parser.add_argument('--engine', choices=['process', 'async'], default='process', help='Engine for the index pipeline')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per benchmark')
+    args = parser.parse_args()
+
+    if args.suite in ('micro', 'all'):
+        corpus = make_corpus(args.docs or 5000)
+        report(micro.run(corpus, repeat=args.repeat, batch_size=args.batch_size), as_json=args.json)
+
+    if args.suite in ('startup', 'all'):
+        corpus = make_corpus(args.docs or 1000)
+        report(startup.run(corpus, repeat=args.repeat, workers=args.workers), as_json=args.json)
+
+    if args.suite in ('pipeline', 'all'):
+        results = pipeline.run(
+            args.docs or 20000,
+            analyze_options={'batch_size': args.batch_size, 'slices': args.slices, 'workers': args.workers},
+            index_options={'concurrency': args.concurrency, 'engine': args.engine},
+        )
+        report(results, as_json=args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''A synthetic corpus that looks roughly like the real 17-108 docket.'''
+import random
+
+from fcc_analysis.analyzers import SOURCE_RULES
+from fcc_analysis.matching import PREFIX
+
+FIRST_NAMES = ['Chris', 'Amanda', 'Ben', 'Maria', 'James', 'Linda', 'Robert', 'Patricia', 'Wei', 'Fatima']
+LAST_NAMES = ['Smith', 'Johnson', 'Kaufman', 'Garcia', 'Nguyen', 'Brown', 'Davis', 'Miller', 'Wilson', 'Moore']
+CITIES = [('Las Vegas', 'NV', '89108'), ('Chicago', 'IL', '60601'), ('Austin', 'TX', '78701'), ('Portland', 'OR', '97201')]
+STREETS = ['Main St', 'Jadestone Ave', 'Oak Dr', 'Maple Ln', 'Washington Blvd']
+
+FILLER = (
+    'The internet is key to freedom of speech and to leading our daily lives. '
+    'Cable companies should not be able to pick winners and losers online. '
+    'Small businesses depend on a level playing field to reach their customers. '
+    'Please listen to the people and not to the lobbyists. '
+)
+
+OLIVER_VARIANTS = [
+    'I support strong net neutrality backed by title 2 oversight of isps',
+    'I specifically support strong Net Neutrality, backed by Title II oversight of ISP\'s.',
+    'i strongly support Net Neutrality backed by TItle II oversight.',
+    'I strongly urge the FCC to maintain strong net neutrality rules backed by Title II.',
+]
+
+RECURSIVE_TEMPLATE = (
+    "To the FCC: I want to {verb} Ajit Pai to reverse {person}'s plan to control broadband. "
+    'Americans, not Washington bureaucrats, should select whatever applications we want. '
+    'It {broke} a {kind} {policy} that {worked} very smoothly for {time} with {who} consensus.'
+)
+
+FREE_TEXT = [
+    'I support net neutrality. ' + FILLER,
+    'Please roll back the Title II regulations. ' + FILLER,
+    'Keep the Internet fair! Keep net neutrality!! ' + FILLER,
+    FILLER * 2,
+    'Do not repeal net neutrality, the internet is a basic right!',
+]
+
+# Roughly the mix of the real docket: mostly form letters, then John Oliver, then everything else.
+MIX = [('form', 0.6), ('oliver', 0.15), ('recursive', 0.05), ('free', 0.2)]
+
+
+def form_letter(generator):
+    kind, needle, _ = generator.choice(SOURCE_RULES)
+    if kind == PREFIX:
+        return needle + '. ' + FILLER
+    return FILLER + needle + ' ' + FILLER
+
+
+def recursive_bot(generator):
+    return RECURSIVE_TEMPLATE.format(
+        verb=generator.choice(['advocate', 'implore', 'urge']),
+        person=generator.choice(['Barack Obama', 'Tom Wheeler']),
+        broke=generator.choice(['undid', 'broke', 'disrupted']),
+        kind=generator.choice(['market-based', 'light-touch', 'free-market']),
+        policy=generator.choice(['policy', 'approach', 'framework']),
+        worked=generator.choice(['performed', 'functioned', 'worked']),
+        time=generator.choice(['many years', 'two decades', 'decades']),
+        who=generator.choice(['bipartisan', 'Republican and Democrat']),
+    )
+
+
+def comment_text(generator):
+    roll = generator.random()
+    for kind, share in MIX:
+        if roll < share:
+            break
+        roll -= share
+
+    if kind == 'form':
+        return form_letter(generator)
+    if kind == 'oliver':
+        return generator.choice(OLIVER_VARIANTS)
+    if kind == 'recursive':
+        return recursive_bot(generator)
+    text = generator.choice(FREE_TEXT)
+    # Free text is mostly unique, unlike form letters.
+    return '{} {}'.format(text, generator.randint(0, 1000000))
+
+
+def make_filing(generator, number):
+    first, last = generator.choice(FIRST_NAMES), generator.choice(LAST_NAMES)
+    city, state, zip_code = generator.choice(CITIES)
+    email = '{}.{}{}@example.com'.format(first, last, generator.randint(1, 99))
+    filing = {
+        'id_submission': str(10000000000 + number),
+        'date_received': '2017-{:02d}-{:02d}T12:00:00.000Z'.format(generator.randint(4, 8), generator.randint(1, 28)),
+        'filers': [{'name': '{} {}'.format(first, last)}],
+        'text_data': comment_text(generator),
+        'contact_email': email.upper() if generator.random() < 0.2 else email,
+        'addressentity': {
+            'address_line_1': '{} {}'.format(generator.randint(1, 9999), generator.choice(STREETS)),
+            'city': city,
+            'state': state,
+            'zip_code': zip_code,
+        },
+        'proceedings': [{'name': '17-108', 'id_proceeding': 301759}],
+    }
+    if generator.random() < 0.3:
+        filing['browser'] = 'OpenCSV'
+    if generator.random() < 0.1:
+        filing['proceedings'][0]['_index'] = 'ecfs'
+    if generator.random() < 0.05:
+        del filing['addressentity']['address_line_1']
+    return filing
+
+
+def make_corpus(count, seed=0):
+    generator = random.Random(seed)
+    return [make_filing(generator, number) for number in range(count)]
@@ -0,0 +1,45 @@
+'''Per-function microbenchmarks for the analyzers.'''
+import time
+
+from fcc_analysis import analyzers
+
+FUNCTIONS = ['source', 'titleii', 'fingerprint', 'simhash', 'proceeding_keys', 'analyze']
+
+
+def bench_function(function, corpus, repeat=3):
+    '''Returns the best docs/sec over ``repeat`` passes through the corpus.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for comment in corpus:
+            function(comment)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best
+
+
+def bench_batch(corpus, batch_size=100, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(corpus), batch_size):
+            analyzers.analyze_batch(corpus[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best
+
+
+def run(corpus, repeat=3, batch_size=100):
+    results = []
+    for name in FUNCTIONS:
+        results.append({
+            'benchmark': 'micro.{}'.format(name),
+            'docs': len(corpus),
+            'docs_per_sec': bench_function(getattr(analyzers, name), corpus, repeat=repeat),
+        })
+    results.append({
+        'benchmark': 'micro.analyze_batch',
+        'docs': len(corpus),
+        'docs_per_sec': bench_batch(corpus, batch_size=batch_size, repeat=repeat),
+    })
+    return results
@@ -0,0 +1,91 @@
+'''End-to-end benchmarks for CommentIndexer.run and CommentAnalyzer.run.
+
+The fake ECFS and Elasticsearch servers run in their own process, and each
+benchmark runs in a fresh process too, so the reported peak RSS only covers
+the pipeline itself (the driver process and its workers).
+'''
+import multiprocessing
+import resource
+import time
+
+from fcc_analysis.aio import AsyncCommentIndexer
+from fcc_analysis.analyze import CommentAnalyzer
+from fcc_analysis.index import CommentIndexer
+from fcc_analysis.tests.fakes import FakeECFS, FakeElasticsearch
+
+from .corpus import make_corpus
+
+
+def serve(docs, with_ecfs, with_documents, conn):
+    corpus = make_corpus(docs)
+    documents = {filing['id_submission']: filing for filing in corpus} if with_documents else {}
+    servers = [FakeElasticsearch(documents)]
+    if with_ecfs:
+        servers.append(FakeECFS(corpus))
+    for server in servers:
+        server.__enter__()
+    conn.send([server.url for server in servers])
+    conn.recv()
+    for server in servers:
+        server.__exit__()
+
+
+def measure(docs, with_ecfs, with_documents, make_runner, results):
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(docs, with_ecfs, with_documents, child))
+    server.start()
+    urls = parent.recv()
+
+    start = time.perf_counter()
+    make_runner(*urls).run()
+    elapsed = time.perf_counter() - start
+
+    # Read before stopping the server, so it isn't counted as one of our children.
+    results.put({
+        'docs': docs,
+        'seconds': elapsed,
+        'docs_per_sec': docs / elapsed,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_worker_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    })
+    parent.send(None)
+    server.join()
+
+
+def in_process(name, *args):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=args + (results,))
+    process.start()
+    result = results.get()
+    process.join()
+    result['benchmark'] = name
+    return result
+
+
+class AnalyzeRunner:
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __call__(self, es_url):
+        return CommentAnalyzer(endpoint=es_url, **self.kwargs)
+
+
+class IndexRunner:
+
+    def __init__(self, engine='process', **kwargs):
+        self.engine = engine
+        self.kwargs = kwargs
+
+    def __call__(self, es_url, ecfs_url):
+        indexer_class = AsyncCommentIndexer if self.engine == 'async' else CommentIndexer
+        return indexer_class(endpoint=es_url, fcc_endpoint=ecfs_url, **self.kwargs)
+
+
+def run(docs, analyze_options=None, index_options=None):
+    analyze_options = analyze_options or {}
+    index_options = index_options or {}
+    return [
+        in_process('pipeline.analyze', docs, False, True, AnalyzeRunner(**analyze_options)),
+        in_process('pipeline.index', docs, True, False, IndexRunner(**index_options)),
+    ]
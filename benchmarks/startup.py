@@ -0,0 +1,82 @@
+'''Startup benchmarks: how long short ``fcc`` runs take before doing any work.
+
+Each one starts a fresh interpreter, like cron does, and keeps the best of
+``repeat`` runs. ``startup.first_document`` is the time from launching
+``fcc analyze --input`` to its first analysis coming out.
+'''
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Startup costs each benchmark should stay under, in seconds.
+TARGETS = {
+    'startup.python': None,
+    'startup.fcc_help': 0.15,
+    'startup.analyze_help': 0.15,
+    'startup.first_document': 1.0,
+}
+
+FCC = 'import sys; from fcc_analysis.bin import main; sys.argv[0] = "fcc"; main()'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def command(*args):
+    return [sys.executable, '-c', FCC] + list(args)
+
+
+def time_run(args, repeat=3):
+    '''Returns the best wall time of running a command to completion.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_first_line(args, repeat=3):
+    '''Returns the best wall time from starting a command to its first line of output.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(args, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            if not process.stdout.readline():
+                raise Exception('{} exited without any output'.format(args))
+            elapsed = time.perf_counter() - start
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(corpus, repeat=3, workers=None):
+    path = os.path.join(tempfile.mkdtemp(), 'filings.jsonl')
+    with open(path, 'w') as f:
+        for filing in corpus:
+            f.write(json.dumps(filing))
+            f.write('\n')
+
+    timings = [
+        ('startup.python', time_run([sys.executable, '-c', 'pass'], repeat=repeat)),
+        ('startup.fcc_help', time_run(command('--help'), repeat=repeat)),
+        ('startup.analyze_help', time_run(command('analyze', '--help'), repeat=repeat)),
+        ('startup.first_document', time_first_line(
+            command('analyze', '--input', path, '-w', str(workers if workers is not None else 1)), repeat=repeat
+        )),
+    ]
+    os.remove(path)
+
+    results = []
+    for name, seconds in timings:
+        result = {'benchmark': name, 'seconds': seconds, 'target_seconds': TARGETS[name]}
+        if TARGETS[name] is not None:
+            result['within_target'] = seconds <= TARGETS[name]
+        results.append(result)
+    return results
@@ -0,0 +1,399 @@
+'''An asyncio engine for ``fcc index``.
+
+Fetching pages from ECFS and posting them to Elasticsearch both happen on a
+single event loop, instead of in a crawler process plus a bulk indexing
+process. HTTP goes through aiohttp when it's installed; otherwise blocking
+``requests`` calls are run on a small thread pool, which still overlaps the
+two without a second process.
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import math
+import threading
+import warnings
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+from . import codec
+from .bulk import RETRY_STATUSES, item_status
+from .checkpoint import CheckpointMark
+from .index import CommentIndexer
+from .metrics import METRICS, SIZE_BUCKETS
+from .storage import create_lines, ElasticsearchBackend
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class ExecutorTransport:
+    '''Runs blocking ``requests`` calls on a thread pool.'''
+
+    def __init__(self, concurrency=1, verify=True):
+        self.verify = verify
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def request(self, method, url, **kwargs):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            response = self.session.request(method, url, verify=self.verify, **kwargs)
+        return response.status_code, response.content
+
+    async def get(self, url, params=None):
+        '''Returns the ``(status, body bytes)`` of the response.'''
+        call = functools.partial(self.request, 'GET', url, params=params)
+        return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+
+    async def post(self, url, data, headers=None):
+        call = functools.partial(self.request, 'POST', url, data=data, headers=headers)
+        return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+class AiohttpTransport:
+
+    def __init__(self, concurrency=1, verify=True):
+        connector = aiohttp.TCPConnector(limit=concurrency, ssl=None if verify else False)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def get(self, url, params=None):
+        async with self.session.get(url, params=params) as response:
+            return response.status, await response.read()
+
+    async def post(self, url, data, headers=None):
+        async with self.session.post(url, data=data, headers=headers) as response:
+            return response.status, await response.read()
+
+    async def close(self):
+        await self.session.close()
+
+
+def open_transport(concurrency=1, verify=True):
+    if aiohttp is not None:
+        return AiohttpTransport(concurrency, verify=verify)
+    return ExecutorTransport(concurrency, verify=verify)
+
+
+class AsyncBulkWriter:
+    '''The coroutine counterpart of BulkWriter, with the same batching, retries and ``after_pending()``.'''
+
+    def __init__(self, transport, url, max_bytes=8 * 1024 * 1024, max_docs=None, concurrency=2,
+                 retries=7, backoff=1, on_items=None):
+        self.transport = transport
+        self.url = url
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.retries = retries
+        self.backoff = backoff
+        self.on_items = on_items
+
+        self.slots = asyncio.Semaphore(max(concurrency, 1))
+        self.tasks = set()
+        self.errors = []
+
+        self.buffer = []
+        self.buffer_size = 0
+
+        # As in BulkWriter: ``watermark`` is the highest request number such
+        # that it and every request before it are done.
+        self.submitted = 0
+        self.finished = set()
+        self.watermark = -1
+        self.callbacks = []
+
+    async def add(self, action, source=None):
+        lines = codec.dumps(action) + b'\n'
+        if source is not None:
+            lines += codec.dumps(source) + b'\n'
+        await self.add_lines(lines)
+
+    async def add_lines(self, lines):
+        '''Adds one pre-serialized action (and its source line, if any), as UTF-8 bytes.'''
+        self.raise_errors()
+        self.buffer.append(lines)
+        self.buffer_size += len(lines)
+        if self.buffer_size >= self.max_bytes or (self.max_docs and len(self.buffer) >= self.max_docs):
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer, self.buffer_size = self.buffer, [], 0
+
+        await self.slots.acquire()
+        number = self.submitted
+        self.submitted += 1
+        task = asyncio.ensure_future(self.post(lines))
+        self.tasks.add(task)
+        task.add_done_callback(lambda task: self.done(number, task))
+
+    def after_pending(self, callback):
+        '''Calls ``callback`` once everything added so far has been written.'''
+        needed = self.submitted if self.buffer else self.submitted - 1
+        if needed <= self.watermark:
+            callback()
+        else:
+            self.callbacks.append((needed, callback))
+
+    async def close(self):
+        await self.flush()
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+        self.raise_errors()
+
+    def raise_errors(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def done(self, number, task):
+        self.slots.release()
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors.append(task.exception())
+
+        self.finished.add(number)
+        while self.watermark + 1 in self.finished:
+            self.watermark += 1
+            self.finished.remove(self.watermark)
+
+        ready = [callback for needed, callback in self.callbacks if needed <= self.watermark]
+        self.callbacks = [(needed, callback) for needed, callback in self.callbacks if needed > self.watermark]
+        try:
+            for callback in ready:
+                callback()
+        except Exception as e:
+            self.errors.append(e)
+
+    async def post(self, lines):
+        items = []
+        for attempt in range(self.retries):
+            data = b''.join(lines)
+            METRICS.observe('fcc_bulk_request_bytes', len(data), buckets=SIZE_BUCKETS)
+            with METRICS.timer('fcc_bulk_request_seconds'):
+                status, body = await self.transport.post(
+                    self.url, data=data, headers={'Content-Type': 'application/x-ndjson'}
+                )
+
+            if status == 413:
+                raise Exception('Too large!')
+
+            if status in RETRY_STATUSES:
+                retry = lines
+            else:
+                try:
+                    response_items = codec.loads(body)['items'] if status == 200 else None
+                except (ValueError, KeyError):
+                    response_items = None
+                if response_items is None:
+                    raise Exception('Bulk request failed ({}): {}'.format(status, body[:1000].decode('utf-8', 'replace')))
+
+                retry = []
+                for item, item_lines in zip(response_items, lines):
+                    if item_status(item) in RETRY_STATUSES:
+                        retry.append(item_lines)
+                    else:
+                        items.append(item)
+
+            if not retry:
+                break
+            METRICS.incr('fcc_bulk_retried_items', len(retry))
+            lines = retry
+            await asyncio.sleep(self.backoff * math.pow(2, attempt))
+        else:
+            raise Exception('Gave up on {} bulk items after {} attempts'.format(len(lines), self.retries))
+
+        METRICS.incr('fcc_bulk_items', len(items))
+        if self.on_items is not None:
+            self.on_items(items)
+        return items
+
+
+class AsyncDocumentWriter:
+    '''Adapts a backend's (blocking) document writer, for backends that write locally.'''
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def add(self, document):
+        self.writer.add(document)
+
+    async def add_encoded(self, id_submission, source):
+        self.writer.add_encoded(id_submission, source)
+
+    def after_pending(self, callback):
+        self.writer.after_pending(callback)
+
+    async def close(self):
+        self.writer.close()
+
+
+class AsyncElasticsearchDocumentWriter:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def add(self, document):
+        await self.writer.add({'create': {'_id': document['id_submission']}}, document)
+
+    async def add_encoded(self, id_submission, source):
+        '''Adds a document that's already been encoded, without decoding it again.'''
+        await self.writer.add_lines(create_lines(id_submission, source))
+
+    def after_pending(self, callback):
+        self.writer.after_pending(callback)
+
+    async def close(self):
+        await self.writer.close()
+
+
+class AsyncCommentIndexer(CommentIndexer):
+    '''Crawls ECFS into the backend on one event loop; takes the same options as CommentIndexer.
+
+    Planning checkpoint windows still uses blocking requests, on a thread, as
+    it's a one-off before the crawl starts.
+    '''
+
+    def run(self):
+        self.start_metrics('index')
+        try:
+            asyncio.run(self.crawl())
+        finally:
+            METRICS.stop()
+
+    async def crawl(self):
+        loop = asyncio.get_event_loop()
+        self.caught_up = threading.Event()
+        self.created = False
+
+        self.transport = open_transport(self.concurrency + self.bulk_concurrency, verify=self.verify)
+        try:
+            total = None
+            if self.checkpoint_path:
+                self.checkpoint = await loop.run_in_executor(None, self.load_checkpoint)
+                total = self.checkpoint.remaining
+            if total is None:
+                total = await self.get_total_async()
+            if not total:
+                print('error loading document total; using estimate')
+                total = 5000000
+            progress = tqdm(total=total)
+
+            writer = self.async_document_writer()
+            try:
+                async for filings, mark in self.iter_marked_pages_async():
+                    # The same encoded pass-through as the bulk indexing process.
+                    for id_submission, source in self.encode_page(filings):
+                        await writer.add_encoded(id_submission, source)
+                    progress.update(len(filings))
+                    if mark is not None:
+                        writer.after_pending(functools.partial(self.commit_marks, [mark]))
+                    if self.caught_up.is_set():
+                        break
+            finally:
+                await writer.close()
+                progress.close()
+        finally:
+            await self.transport.close()
+        return self.created
+
+    def async_document_writer(self):
+        if isinstance(self.backend, ElasticsearchBackend):
+            writer = AsyncBulkWriter(
+                self.transport, self.backend.bulk_url, concurrency=self.bulk_concurrency,
+                backoff=self.backoff, on_items=self.check_created
+            )
+            return AsyncElasticsearchDocumentWriter(writer)
+        return AsyncDocumentWriter(self.backend.document_writer(on_items=self.check_created))
+
+    async def get_total_async(self, gte=None, lte=None):
+        query = self.build_query(gte=gte, lte=lte)
+        query['limit'] = 1
+        await asyncio.sleep(self.rate_limiter.reserve(self.fcc_endpoint))
+        status, body = await self.transport.get(self.fcc_endpoint, params=query)
+        try:
+            return self.parse_total(codec.loads(body), query)
+        except ValueError:
+            return None
+
+    async def fetch_page_async(self, query, page):
+        query = dict(query, limit=self.limit, offset=page * self.limit)
+        for i in range(7):
+            await asyncio.sleep(self.rate_limiter.reserve(self.fcc_endpoint))
+            with METRICS.timer('fcc_ecfs_fetch_seconds'):
+                status, body = await self.transport.get(self.fcc_endpoint, params=query)
+
+            try:
+                filings = codec.loads(body).get('filings', [])
+                METRICS.incr('fcc_filings_fetched', len(filings))
+                return filings
+            except ValueError:
+                METRICS.incr('fcc_ecfs_retries')
+                # Exponentially wait--sometimes the API goes down.
+                await asyncio.sleep(self.backoff * math.pow(2, i))
+        raise Exception('Couldn\'t load filings at offset {}'.format(query['offset']))
+
+    async def iter_pages_async(self, query=None, start_page=0):
+        '''Yields pages of filings with up to ``concurrency`` fetches in flight, like ``iter_pages()``.'''
+        if query is None:
+            query = self.build_query()
+
+        pending = {}
+        next_page = start_page
+        last_page = None  # The first page that came back short
+        try:
+            while True:
+                while len(pending) < max(self.concurrency, 1) and (last_page is None or next_page <= last_page):
+                    pending[asyncio.ensure_future(self.fetch_page_async(query, next_page))] = next_page
+                    next_page += 1
+                if not pending:
+                    break
+
+                if self.ordered:
+                    done = [min(pending, key=pending.get)]
+                    await asyncio.wait(done)
+                else:
+                    done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in sorted(done, key=pending.get):
+                    page = pending.pop(task)
+                    filings = task.result()
+                    if len(filings) != self.limit and (last_page is None or page < last_page):
+                        last_page = page
+                    if last_page is not None and page > last_page:
+                        continue
+                    yield filings
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def iter_marked_pages_async(self):
+        '''The coroutine counterpart of ``iter_marked_pages()``.'''
+        if self.checkpoint is None:
+            async for filings in self.iter_pages_async():
+                yield filings, None
+            return
+
+        for position, window in self.checkpoint.pending():
+            query = self.build_query(gte=window['gte'], lte=window['lte'])
+            start_page = window['offset'] // self.limit
+            offset = window['offset']
+            page = start_page
+            async for filings in self.iter_pages_async(query=query, start_page=start_page):
+                mark = None
+                if self.ordered:
+                    offset = (page + 1) * self.limit
+                    mark = CheckpointMark(position, offset, False)
+                page += 1
+                yield filings, mark
+            yield [], CheckpointMark(position, offset, True)
@@ -1,135 +1,291 @@
-import json
 import multiprocessing
-from tqdm import tqdm
-import requests
-import warnings
-import io
+from queue import Full
+import signal
 
-from .analyzers import analyze
+from . import codec
+from .analyzers import analysis_version, analyze_batch, ANALYZED_FIELDS, FINGERPRINTS, warm
+from .cache import AnalysisCache
+from .lookup import comment_keys, LookupBuilder
+from .metrics import METRICS, queue_depth, time_analyzers
+from .neardup import LSHIndex, SimHashIndex
+from .pool import WorkerPool, default_workers
+from .records import Comment
+from .reuse import REUSE_FIELDS, ReuseSketch
+from .storage import ElasticsearchBackend, LocalBackend
+from .transport import SharedSlots
+
+# Set in each tagging process, so the analyzer is sent once per process instead of once per batch.
+_worker_analyzer = None
+
+
+def init_worker(analyzer):
+    global _worker_analyzer
+    _worker_analyzer = analyzer
+    analyzer.start_metrics('tagger')
+    warm()
+
+
+def tag_encoded_batch(handle):
+    return _worker_analyzer.tag_encoded_batch(handle)
 
 
 class CommentAnalyzer:
 
-    def __init__(self, endpoint='http://localhost:9200/', verify=True):
+    def __init__(self, endpoint='http://localhost:9200/', verify=True, batch_size=100, neardup=False, bulk_concurrency=2,
+                 slices=1, page_size=1000, incremental=False, store=None, compression='gzip', backend=None,
+                 cache_size=100000, cache=None, workers=None, autoscale=False,
+                 metrics=None, metrics_format='jsonl', profile=None, analyzer_sample=100, shared_memory=True,
+                 fingerprint='string', lookup=None, reuse=False):
+        if neardup and slices > 1:
+            raise ValueError('Near-duplicate clustering needs a single reader, so it can\'t be used with slices')
+        if lookup and slices > 1:
+            raise ValueError('Lookup indexes are built by a single writer, so they can\'t be used with slices')
+        if fingerprint not in FINGERPRINTS:
+            raise ValueError('Unknown fingerprint: {}'.format(fingerprint))
+        if backend is None and store:
+            backend = LocalBackend(store, compression=compression)
+        elif backend is None:
+            backend = ElasticsearchBackend(endpoint, verify=verify, bulk_concurrency=bulk_concurrency)
+        self.backend = backend
         self.endpoint = endpoint
         self.verify = verify
+        self.batch_size = batch_size
+        self.bulk_concurrency = bulk_concurrency
+        self.slices = slices
+        self.page_size = page_size
+        self.incremental = incremental
+        self.workers = workers or default_workers()
+        self.autoscale = autoscale
+        self.metrics = metrics
+        self.metrics_format = metrics_format
+        self.profile = profile
+        # Every this many batches, each analyzer function is timed on its own.
+        self.analyzer_sample = analyzer_sample
+        self.batches_tagged = 0
+        self.shared_memory = shared_memory
+        self.inputs = None
+        self.outputs = None
+        self.fingerprint = fingerprint
+        # The tagging workers compute LSH band keys; the single index worker owns
+        # the buckets, so cluster ids are consistent across the whole run.
+        # Without a string fingerprint, near duplicates are found by SimHash.
+        self.lsh = None
+        if neardup:
+            self.lsh = SimHashIndex() if fingerprint == 'simhash' else LSHIndex()
+        # A directory for lookup.LookupBuilder, whose keys come from the tagging workers.
+        self.lookup = lookup
+        # Counted in a first pass over every comment by run(), and read by the
+        # tagging (or slice) processes it forks. True makes a default-sized one.
+        self.reuse = ReuseSketch() if reuse is True else reuse or None
+        self.cache_size = cache_size
+        self.cache_path = cache
+        self._cache = None
+
+    def start_metrics(self, role):
+        METRICS.start(role, path=self.metrics, format=self.metrics_format, profile=self.profile)
+
+    @property
+    def cache(self):
+        # Created lazily, so every worker process gets its own.
+        if self._cache is None and (self.cache_size or self.cache_path):
+            self._cache = AnalysisCache(maxsize=self.cache_size, path=self.cache_path, fingerprint=self.fingerprint)
+        return self._cache
 
     def run(self):
-        in_queue = multiprocessing.Queue(maxsize=1000)
-        out_queue = multiprocessing.Queue()
-        tagging_processes = []
+        self.start_metrics('analyze')
+        try:
+            if self.reuse is not None:
+                self.count_submitters()
+            if self.slices > 1:
+                self.run_sliced()
+            else:
+                self.run_pool()
+            self.backend.compact_analyses()
+        finally:
+            METRICS.stop()
 
-        for _ in range(5):
-            process = multiprocessing.Process(target=self.tagging_worker, args=(in_queue, out_queue))
-            process.start()
-            tagging_processes.append(process)
+    def count_submitters(self):
+        '''The first pass of ``reuse``: counts the submitter fields of every comment, stale or not.'''
+        with METRICS.timer('fcc_reuse_pass_seconds'):
+            for filing in self.backend.iter_comments(fields=list(REUSE_FIELDS), size=self.page_size):
+                self.reuse.add(filing)
+
+    def run_pool(self):
+        # The queue carries whole batches, so keep roughly the same number of comments in flight.
+        queue_size = max(1000 // self.batch_size, 10)
+        out_queue = multiprocessing.Queue(maxsize=queue_size)
+
+        # Batches travel between processes encoded, in shared memory, with
+        # just their handles going through the pool and the queue. There's a
+        # slot for every batch that can be in flight at once.
+        slots = 2 * self.workers + 2 if self.shared_memory else 0
+        slot_size = max(self.batch_size * 4096, 1 << 16)
+        self.inputs = SharedSlots(slots, slot_size)
+        self.outputs = SharedSlots(slots + queue_size if slots else 0, slot_size)
 
         index_process = multiprocessing.Process(target=self.index_worker, args=(out_queue,))
         index_process.start()
 
+        pool = WorkerPool(tag_encoded_batch, workers=self.workers, initializer=init_worker, initargs=(self,))
         try:
-            for comment in self.iter_comments(size=100):
-                in_queue.put(comment)
+            try:
+                batches = self.iter_encoded_batches(self.iter_comments(size=self.page_size))
+                for results in pool.map(batches):
+                    depth = queue_depth(out_queue)
+                    METRICS.gauge('fcc_queue_depth', depth, queue='out')
+                    METRICS.gauge('fcc_batches_in_flight', len(pool.pending))
+                    METRICS.gauge('fcc_workers', pool.size)
+                    self.put_results(out_queue, results, index_process)
+                    if self.autoscale and depth is not None:
+                        pool.scale(depth / queue_size)
+            except KeyboardInterrupt:
+                # Stop reading, but write out everything that was already tagged.
+                print('Interrupted, finishing {} batches in flight...'.format(len(pool.pending)))
+                for results in pool.drain():
+                    self.put_results(out_queue, results, index_process)
+        finally:
+            pool.shutdown(cancel=True)
+            if index_process.is_alive():
+                out_queue.put(None)
+            index_process.join()
+            self.inputs.close()
+            self.outputs.close()
+
+        if index_process.exitcode:
+            raise Exception('Index worker failed (exit code {})'.format(index_process.exitcode))
+
+    def put_results(self, queue, handles, index_process):
+        batch_handle, results_handle = handles
+        # The batch's slot is only freed here, so a batch can be resubmitted if its worker dies.
+        self.inputs.release(batch_handle)
+
+        # Never block forever on a writer that has died.
+        while True:
+            try:
+                with METRICS.timer('fcc_queue_put_seconds', queue='out'):
+                    queue.put(results_handle, timeout=1)
+                return
+            except Full:
+                if not index_process.is_alive():
+                    raise Exception('Index worker failed (exit code {})'.format(index_process.exitcode))
+
+    def run_sliced(self):
+        '''Runs one process per scroll slice, each reading, analyzing and writing on its own.'''
+        processes = []
+        for slice_id in range(self.slices):
+            process = multiprocessing.Process(target=self.slice_worker, args=(slice_id,))
+            process.start()
+            processes.append(process)
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+
+        failed = [process.exitcode for process in processes if process.exitcode]
+        if failed:
+            raise Exception('{} slice workers failed (exit codes {})'.format(len(failed), failed))
+
+    def slice_worker(self, slice_id):
+        self.start_metrics('slice')
+        warm()
+        writer = self.backend.analysis_writer()
+        comments = self.iter_comments(size=self.page_size, slice_id=slice_id)
+        try:
+            for batch in self.iter_batches(comments):
+                for comment, analysis in zip(batch, self.analyze_batch(batch)):
+                    writer.add(comment.id_submission, analysis)
         except KeyboardInterrupt:
             pass
+        writer.close()
 
-        for _ in range(5):
-            in_queue.put(None)
+    def tag_batch(self, batch):
+        '''Returns an ``(id, analysis, LSH band keys, lookup keys)`` tuple for each comment in the batch.'''
+        analyses = self.analyze_batch(batch)
 
-        for p in tagging_processes:
-            p.join()
+        results = []
+        band_keys = {}
+        for comment, analysis in zip(batch, analyses):
+            keys = None
+            if self.lsh is not None:
+                value = analysis[self.lsh.field]
+                if value not in band_keys:
+                    band_keys[value] = self.lsh.band_keys(value)
+                keys = band_keys[value]
+            lookup_keys = comment_keys(comment, analysis) if self.lookup else None
+            results.append((comment.id_submission, analysis, keys, lookup_keys))
+        return results
 
-        out_queue.put(None)
+    def iter_encoded_batches(self, comments):
+        '''Yields handles to batches, encoded as the rows of their records.'''
+        for batch in self.iter_batches(comments):
+            yield self.inputs.put(codec.dumps([comment.to_row() for comment in batch]))
 
-        index_process.join()
+    def tag_encoded_batch(self, handle):
+        '''Tags an encoded batch, returning its handle along with a handle to the encoded results.'''
+        batch = [Comment.from_row(row) for row in codec.loads(self.inputs.read(handle))]
+        results = self.tag_batch(batch)
+        return handle, self.outputs.put(codec.dumps(results))
 
-    def tagging_worker(self, in_queue, out_queue):
+    def analyze_batch(self, batch):
+        if METRICS.active and self.analyzer_sample and self.batches_tagged % self.analyzer_sample == 0:
+            time_analyzers(batch)
+        self.batches_tagged += 1
 
-        while True:
-            comment = in_queue.get()
-            if comment is None:
-                break
-            analysis = analyze(comment)
-            out_queue.put((comment['id_submission'], analysis))
+        with METRICS.timer('fcc_analyze_batch_seconds'):
+            analyses = analyze_batch(batch, cache=self.cache, fingerprint=self.fingerprint)
+            if self.reuse is not None:
+                for comment, analysis in zip(batch, analyses):
+                    analysis.update(self.reuse.signals(comment))
+        METRICS.incr('fcc_comments_analyzed', len(batch))
+        return analyses
+
+    def iter_batches(self, comments):
+        '''Yields lists of ``batch_size`` records, made from the filings in ``comments``.'''
+        batch = []
+        for comment in comments:
+            batch.append(Comment.from_filing(comment))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
     def index_worker(self, queue, size=250):
+        # The parent handles Ctrl-C, and tells us when everything has been sent.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.start_metrics('writer')
 
-        url = '{}{}/filing/{}'.format(
-            self.endpoint,
-            'fcc-comments',
-            '_bulk'
-        )
+        writer = self.backend.analysis_writer(size=size)
+        lookup = LookupBuilder(self.lookup, incremental=self.incremental) if self.lookup else None
+        for id_submission, analysis, keys, lookup_keys in self.iter_results(queue):
+            if self.lsh is not None:
+                analysis['cluster'] = self.lsh.assign(id_submission, keys)
+            writer.add(id_submission, analysis)
+            if lookup is not None:
+                lookup.add(id_submission, lookup_keys)
+        writer.close()
+        if lookup is not None:
+            with METRICS.timer('fcc_lookup_build_seconds'):
+                lookup.close()
 
-        payload = io.StringIO()
-        counter = 0
+    def iter_results(self, queue):
         while True:
-            item = queue.get()
-            if item is None:
+            handle = queue.get()
+            if handle is None:
                 print('exiting...')
                 break
-            id_submission, analysis = item
-
-            index = {"update": {"_id": id_submission}}
-            payload.write(json.dumps(index))
-            payload.write('\n')
-            payload.write(json.dumps({'doc': {'analysis': analysis}}))
-            payload.write('\n')
-
-            counter += 1
-            if counter % size == 0:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    response = requests.post(url, data=payload.getvalue(), verify=self.verify)
-                    if 'items' not in response.json():
-                        print(response.json())
-                    else:
-                        for item in response.json()['items']:
-                            if 'update' in item and item['update'].get('result') not in ('updated', 'noop'):
-                                print(json.dumps(item, indent=2))
-                                raise Exception('Failure!')
-                    if response.status_code != 200:
-                        print(response.text)
-                        return
-                payload = io.StringIO()
-                counter = 0
-
-    def iter_comments(self, timeout='5m', size=100, progress=True):
-        start_url = '{}fcc-comments/filing/_search?scroll={}'.format(
-            self.endpoint, timeout
-        )
-        scroll_url = '{}_search/scroll'.format(self.endpoint)
-        headers={'Content-Type': 'application/json'}
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            response = requests.post(start_url, verify=self.verify, headers=headers, data=json.dumps({
-                'size': size,
-                'query': {
-                    'match_all': {}
-                },
-                'sort': [
-                    '_doc'
-                ]
-            }))
-        scroll_id = response.json()['_scroll_id']
-        progress = tqdm(total=response.json()['hits']['total'])
-        hits = response.json()['hits']['hits']
-
-        while hits:
-
-            for hit in hits:
-                yield hit['_source']
-                progress.update(1)
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                response = requests.post(scroll_url, headers=headers, verify=self.verify, data=json.dumps({
-                    'scroll': timeout,
-                    'scroll_id': scroll_id
-                }))
-
-            scroll_id = response.json()['_scroll_id']
-            hits = response.json()['hits']['hits']
-
-        progress.close()
+            for item in codec.loads(self.outputs.take(handle)):
+                yield item
 
+    def iter_comments(self, size=1000, progress=True, slice_id=None):
+        return self.backend.iter_comments(
+            fields=['id_submission'] + list(ANALYZED_FIELDS) + (['filers'] if self.reuse is not None else []),
+            stale_version=analysis_version(self.fingerprint) if self.incremental else None,
+            slice_id=slice_id,
+            slices=self.slices,
+            size=size,
+            progress=progress
+        )
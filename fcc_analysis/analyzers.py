@@ -1,227 +1,382 @@
+import functools
+import hashlib
 import re
 
+from .matching import SourceMatcher, PatternSet, PREFIX, CONTAINS, ICONTAINS
+from .neardup import SimHasher
+from .records import Comment, as_comment
+
+# The only filing fields analyze() looks at.
+ANALYZED_FIELDS = ('text_data', 'contact_email', 'addressentity', 'proceedings', 'browser')
+
 WORDSPLIT_PATTERN = re.compile("['-]+", re.UNICODE)
 NON_CHAR_PATTERN = re.compile('[^a-z ]+', re.UNICODE)
+# The same words as the string fingerprint, once apostrophes and dashes are dropped.
+WORD_PATTERN = re.compile('[a-z]+', re.UNICODE)
+WORDSPLIT_CHARACTERS = str.maketrans('', '', "'-")
+
+# What text_analysis() fingerprints text with: the ``fingerprint`` string of
+# sorted words, the ``fingerprint_hash`` and ``simhash`` integers, or all three.
+FINGERPRINTS = ('string', 'simhash', 'both')
+SIMHASHER = SimHasher()
 
 
 # I know...now I have two problems...
+# The rule tables are plain ``(pattern, flags)`` data, compiled by
+# compiled_rules() the first time a comment is analyzed in each process.
 OLIVER_PATTERNS = [
-    re.compile('(strong )?net neutrality( rules)? backed by title (ii|2|two|ll)', flags=re.IGNORECASE),
-    re.compile('i( specifically| strongly)? support( strong)? net neutrality backed by title', flags=re.IGNORECASE),
-    re.compile('i( specifically| strongly)? support( strong)? net neutrality,?( oversight)?( backed)? by title (ii|2|two|ll) oversight', flags=re.IGNORECASE),
+    ('(strong )?net neutrality( rules)? backed by title (ii|2|two|ll)', re.IGNORECASE),
+    ('i( specifically| strongly)? support( strong)? net neutrality backed by title', re.IGNORECASE),
+    ('i( specifically| strongly)? support( strong)? net neutrality,?( oversight)?( backed)? by title (ii|2|two|ll) oversight', re.IGNORECASE),
 ]
 
 PRO_TITLE_II_PATTERNS = [
-    re.compile('(preserve|keep|maintain|uphold|continue|protect)( net)? neutral(ity)?', flags=re.IGNORECASE),
-    re.compile('(preserve|keep|maintain|uphold|continue|protect) title (ii|2|two|ll)?', flags=re.IGNORECASE),
-    re.compile('I( strongly)? support title (2|ii|two|ll)', flags=re.IGNORECASE),
-    re.compile('I( strongly| specifically)? support( strong)? net neutrality', flags=re.IGNORECASE),
-    re.compile('(strongly|specifically) support (net neutrality|title (ii|2|two|ll))', flags=re.IGNORECASE),
-    re.compile('do not (repeal|revoke|remove)', flags=re.IGNORECASE)
+    ('(preserve|keep|maintain|uphold|continue|protect)( net)? neutral(ity)?', re.IGNORECASE),
+    ('(preserve|keep|maintain|uphold|continue|protect) title (ii|2|two|ll)?', re.IGNORECASE),
+    ('I( strongly)? support title (2|ii|two|ll)', re.IGNORECASE),
+    ('I( strongly| specifically)? support( strong)? net neutrality', re.IGNORECASE),
+    ('(strongly|specifically) support (net neutrality|title (ii|2|two|ll))', re.IGNORECASE),
+    ('do not (repeal|revoke|remove)', re.IGNORECASE)
 ]
 
 ANTI_TITLE_II_PATTERNS = [
-    re.compile('obama\'?s internet takeover', flags=re.IGNORECASE),
-    re.compile('please reverse the (2014|2015)', flags=re.IGNORECASE),
-    re.compile('please roll ?back', flags=re.IGNORECASE),
+    ('obama\'?s internet takeover', re.IGNORECASE),
+    ('please reverse the (2014|2015)', re.IGNORECASE),
+    ('please roll ?back', re.IGNORECASE),
 ]
 
 SMART_BOT_PATTERNS = [
-    re.compile("It (undid|broke|disrupted|stopped|reversed|ended) a (market-based|pro-consumer|free-market|hands-off|light-touch) (policy|approach|system|framework) that (performed|functioned|worked) (fabulously|exceptionally|very, very|very|supremely|remarkably) (smoothly|successfully|well) for (many years|a long time|two decades|decades) with (Republican and Democrat|bipartisan|both parties'|nearly universal|broad bipartisan) (consensus|approval|backing|support)")
+    ("It (undid|broke|disrupted|stopped|reversed|ended) a (market-based|pro-consumer|free-market|hands-off|light-touch) (policy|approach|system|framework) that (performed|functioned|worked) (fabulously|exceptionally|very, very|very|supremely|remarkably) (smoothly|successfully|well) for (many years|a long time|two decades|decades) with (Republican and Democrat|bipartisan|both parties'|nearly universal|broad bipartisan) (consensus|approval|backing|support)", 0),
 ]
 
+# Known form letters and bots, in order of precedence. The first rule that
+# matches wins, so more specific templates should come first.
+SOURCE_RULES = [
+    (PREFIX, 'The unprecedented regulatory power the Obama Administration imposed on the internet', 'bot.unprecedented'),
+    (PREFIX, 'I was outraged by the Obama/Wheeler FCC', 'bot.outraged'),
+    # This one is interesting, because it appends the Submitter's first name to the text_data, making the fingerprint unreliable...
+    (PREFIX, 'The FCC Open Internet Rules (net neutrality rules) are extremely important to me', 'form.battleforthenet'),
+    (CONTAINS, 'my understanding that the FCC Chairman intends to reverse net neutrality rules', 'reddit.technology'),
+    (ICONTAINS, 'i support the existing net neutrality rules, which classify internet service providers under the title i', 'blog.venturebeat'),
+    (PREFIX, 'Obama’s Title II order has diminished broadband investment', 'form.diminished-investment'),
+    (ICONTAINS, 'passed rules treating the internet as a government regulated public utility for the first time in history', 'form.freeourinternet'),
+    (PREFIX, 'In 2015, wealthy leftist billionaires and powerful Silicon Valley monopolies took the internet', 'form.freeourinternet'),
+    (CONTAINS, 'Dear Express Restoring Internet Freedom,', 'form.fwact'),
+    (PREFIX, 'Obama\'s Federal Communications Commission (FCC) forced regulations on the internet that put the government', 'form.tpa'),
+    (CONTAINS, 'These rules have cost taxpayers, slowed down broadband infrastructure investment, and hindered competition and choice for Americans', 'form.tpa'),
+    (CONTAINS, "The FCC should throw out Chairman Ajit Pai's proposal to give the ISP monopolies", 'bot.internetuser'),
+    (CONTAINS, 'The FCC needs to stand up for Internet users like me and keep the net neutrality rules that are already in effect.', 'form.dearfcc'),
+    (PREFIX, 'This illogically named "restoring internet freedom" filing is aimed squarely at the freedom of the internet', 'bot.illogically-named'),
+    (PREFIX, 'Don\'t kill net neutrality. We deserve a free and open Internet', 'form.signforgood'),
+    (PREFIX, 'Net Neutrality is not negotiable', 'form.freepress'),
+    (PREFIX, 'A free and open internet is critical for Americans to connect with their friends and family, exercise their freedom of speech', 'form.demandprogress'),
+]
 
-def ingestion_method(comment):
+# Sources that tell us where the commenter stands on Title II.
+SOURCE_TITLEII = {
+    'bot.unprecedented': False,
+    'bot.outraged': False,
+    'form.diminished-investment': False,
+    'form.freeourinternet': False,
+    'form.fwact': False,
+    'form.tpa': False,
+    'bot.recursive'
+
+    'johnoliver': True,
+    'form.battleforthenet': True,
+    'reddit.technology': True,
+    'blog.venturebeat': True,
+    'form.dearfcc': True,
+    'form.signforgood': True,
+    'form.demandprogress': True
+}
+
+# Bump this when an analyzer function changes in a way the rule tables above
+# don't capture, so that `fcc analyze --incremental` re-tags everything.
+ANALYZER_REVISION = 1
+
+
+def rules_version():
+    '''Returns a short hash of everything that determines an analysis.'''
+    patterns = OLIVER_PATTERNS + PRO_TITLE_II_PATTERNS + ANTI_TITLE_II_PATTERNS + SMART_BOT_PATTERNS
+    definition = repr((
+        ANALYZER_REVISION,
+        SOURCE_RULES,
+        sorted(SOURCE_TITLEII.items()),
+        # The flags a compiled pattern reports, which always include re.UNICODE,
+        # so versions match the ones hashed when the tables held compiled patterns.
+        [(pattern, int(flags | re.UNICODE)) for pattern, flags in patterns],
+    ))
+    return hashlib.sha1(definition.encode('utf-8')).hexdigest()[:12]
+
+
+ANALYZER_VERSION = rules_version()
+
+
+def analysis_version(fingerprint='string'):
+    '''Returns the ``analysis.version`` of analyses made with a fingerprint mode.
+
+    The mode decides which fingerprint fields an analysis has, so switching
+    modes makes `fcc analyze --incremental` re-tag everything too.
+    '''
+    if fingerprint == 'string':
+        return ANALYZER_VERSION
+    return '{}-{}'.format(ANALYZER_VERSION, fingerprint)
 
-    if comment.get('browser', '').startswith('OpenCSV'):
-        return 'csv'
 
-    for proceeding in comment['proceedings']:
-        if '_index' in proceeding:
-            return 'direct'
+def compile_patterns(patterns):
+    return [re.compile(pattern, flags=flags) for pattern, flags in patterns]
 
-    return 'api'
 
+class CompiledRules:
+    '''The rule tables, compiled for matching.
 
-def source(comment):
-    '''Returns a string identifying the "source" of this comment, if possible.
+    The Oliver and Title II pattern lists are PatternSets, searched together
+    over one lowercased copy of the text. The smart bot patterns are anchored
+    to the last sentence, so they stay a plain list.
+    '''
 
-    For example:
+    def __init__(self):
+        self.source = SourceMatcher(SOURCE_RULES)
+        self.smart_bot = compile_patterns(SMART_BOT_PATTERNS)
+        self.oliver = PatternSet([('johnoliver', compile_patterns(OLIVER_PATTERNS))])
+        self.titleii = PatternSet([
+            (True, compile_patterns(PRO_TITLE_II_PATTERNS)),
+            (False, compile_patterns(ANTI_TITLE_II_PATTERNS)),
+        ])
 
-      - bot.unprecedented
-      - johnoliver
-      - form.battleforthenet
 
+@functools.lru_cache(maxsize=None)
+def compiled_rules():
+    '''Returns the CompiledRules, compiling them on the first call in each process.
+
+    After changing a rule table, ``compiled_rules.cache_clear()`` picks up the change.
     '''
-    if 'text_data' not in comment:
-        return
+    return CompiledRules()
 
-    if comment['text_data'].startswith('The unprecedented regulatory power the Obama Administration imposed on the internet'):
-        return 'bot.unprecedented'
 
-    if comment['text_data'].startswith('I was outraged by the Obama/Wheeler FCC'):
-        return 'bot.outraged'
+def warm():
+    '''Compiles everything that's compiled lazily, so the first comment a worker analyzes isn't slower.'''
+    compiled_rules()
 
-    # This one is interesting, because it appends the Submitter's first name to the text_data, making the fingerprint unreliable...
-    if comment['text_data'].startswith('The FCC Open Internet Rules (net neutrality rules) are extremely important to me'):
-        return 'form.battleforthenet'
 
-    if 'my understanding that the FCC Chairman intends to reverse net neutrality rules' in comment['text_data']:
-        return 'reddit.technology'
+# The analyzer functions below take either a filing dict or a records.Comment.
 
-    if 'i support the existing net neutrality rules, which classify internet service providers under the title i' in comment['text_data'].lower():
-        return 'blog.venturebeat'
 
-    if comment['text_data'].startswith('Obama’s Title II order has diminished broadband investment'):
-        return 'form.diminished-investment'
+def text_data(comment):
+    if isinstance(comment, Comment):
+        return comment.text_data
+    return comment.get('text_data')
 
-    if 'passed rules treating the internet as a government regulated public utility for the first time in history' in comment['text_data'].lower():
-        return 'form.freeourinternet'
 
-    if comment['text_data'].startswith('In 2015, wealthy leftist billionaires and powerful Silicon Valley monopolies took the internet'):
-        return 'form.freeourinternet'
+def ingestion_method(comment):
+    comment = as_comment(comment)
 
-    if 'Dear Express Restoring Internet Freedom,' in comment['text_data']:
-        return 'form.fwact'
+    if comment.browser is not None and comment.browser.startswith('OpenCSV'):
+        return 'csv'
 
-    if comment['text_data'].startswith('Obama\'s Federal Communications Commission (FCC) forced regulations on the internet that put the government'):
-        return 'form.tpa'
+    if onsite(comment):
+        return 'direct'
 
-    if 'These rules have cost taxpayers, slowed down broadband infrastructure investment, and hindered competition and choice for Americans' in comment['text_data']:
-        return 'form.tpa'
+    return 'api'
 
-    if "The FCC should throw out Chairman Ajit Pai's proposal to give the ISP monopolies" in comment['text_data']:
-        return 'bot.internetuser'
 
-    if 'The FCC needs to stand up for Internet users like me and keep the net neutrality rules that are already in effect.' in comment['text_data']:
-        return 'form.dearfcc'
+def source(comment):
+    '''Returns a string identifying the "source" of this comment, if possible.
 
-    if comment['text_data'].startswith('This illogically named "restoring internet freedom" filing is aimed squarely at the freedom of the internet'):
-        return 'bot.illogically-named'
+    For example:
 
-    if comment['text_data'].startswith('Don\'t kill net neutrality. We deserve a free and open Internet'):
-        return 'form.signforgood'
+      - bot.unprecedented
+      - johnoliver
+      - form.battleforthenet
+
+    '''
+    text = text_data(comment)
+    if text is None:
+        return
 
-    if comment['text_data'].startswith('Net Neutrality is not negotiable'):
-        return 'form.freepress'
+    return _source(text)
 
-    if comment['text_data'].startswith('A free and open internet is critical for Americans to connect with their friends and family, exercise their freedom of speech'):
-        return 'form.demandprogress'
+
+def _source(text, lowered=None):
+    rules = compiled_rules()
+    label = rules.source.match(text, lowered=lowered)
+    if label is not None:
+        return label
 
     try:
-        last_sentence = comment['text_data'].split('.')[-2].strip()
+        last_sentence = text.split('.')[-2].strip()
     except IndexError:
         pass
     else:
-        for pattern in SMART_BOT_PATTERNS:
+        for pattern in rules.smart_bot:
             if pattern.match(last_sentence):
                 return 'bot.recursive'
 
     # This is the text that John Oliver suggested. Many people seemed to follow his suggestion.
-    for pattern in OLIVER_PATTERNS:
-        if pattern.search(comment['text_data']):
-            return 'johnoliver'
-
-    return 'unknown'
+    return rules.oliver.search(text, lowered=lowered) or 'unknown'
 
 
 def titleii(comment):
 
-    if 'text_data' not in comment:
+    text = text_data(comment)
+    if text is None:
         return None
 
-    for pattern in PRO_TITLE_II_PATTERNS:
-        if pattern.search(comment['text_data']):
-            return True
+    return _titleii(text)
 
-    for pattern in ANTI_TITLE_II_PATTERNS:
-        if pattern.search(comment['text_data']):
-            return False
 
-    return None
+def _titleii(text, lowered=None):
+    # Pro patterns take precedence over anti patterns.
+    return compiled_rules().titleii.search(text, lowered=lowered)
 
 
 def capsemail(comment):
-    if comment.get('contact_email'):
-        return comment['contact_email'] == comment['contact_email'].upper()
+    email = as_comment(comment).contact_email
+    if email:
+        return email == email.upper()
 
 
 def fulladdress(comment):
-
-    address = comment.get('addressentity', {})
-    for key in ('address_line_1', 'city', 'state', 'zip_code'):
-        if not address.get(key):
-            return False
-    return True
+    address = as_comment(comment).address
+    return address is not None and all(address)
 
 
 def fingerprint(comment):
     '''Get a text fingerprint--useful for looking for duplicate text'''
 
-    text = comment.get('text_data', '').lower()
-    text = WORDSPLIT_PATTERN.sub('', text)
+    return _fingerprint((text_data(comment) or '').lower())
+
+
+def _fingerprint(lowered):
+    text = WORDSPLIT_PATTERN.sub('', lowered)
     text = NON_CHAR_PATTERN.sub(' ', text)
     words = list(set(text.split()))
     words.sort()
     return " ".join(words)[:1000]  # Some people are assholes...
 
 
+def simhash(comment):
+    '''Returns a 64-bit SimHash of the words in the text, as a signed integer.
+
+    Texts with mostly the same words get SimHashes a few bits apart; see
+    ``neardup.hamming()`` and ``neardup.SimHashIndex``.
+    '''
+    return _simhash((text_data(comment) or '').lower())[1]
+
+
+def _simhash(lowered):
+    '''Returns ``(fingerprint_hash, simhash)`` for the lowercased text.'''
+    return SIMHASHER.hashes(set(WORD_PATTERN.findall(lowered.translate(WORDSPLIT_CHARACTERS))))
+
+
 def proceeding_keys(comment):
-    if 'proceedings' not in comment:
+    proceedings = as_comment(comment).proceedings
+    if proceedings is None:
         return
-    keys = []
-    for proceeding in comment['proceedings']:
-        sorted_keys = sorted(list(proceeding.keys()))
-        keys.extend(sorted_keys)
-    return ' '.join(keys)
+    return ' '.join(key for keys in proceedings for key in keys)
 
 
 def onsite(comment):
-    if 'proceedings' not in comment:
+    proceedings = as_comment(comment).proceedings
+    if proceedings is None:
         return
-    for proceeding in comment['proceedings']:
-        if '_index' in proceeding:
+    for keys in proceedings:
+        if '_index' in keys:
             return True
     return False
 
 
-def analyze(comment):
+def text_analysis(text, fingerprint='string'):
+    '''Returns the analysis fields that only depend on the comment text.
+
+    ``text`` may be None for comments without any ``text_data``.
+    ``fingerprint`` is one of FINGERPRINTS.
+    '''
+    lowered = text.lower() if text is not None else ''
+    analysis = {}
+    if fingerprint != 'simhash':
+        analysis['fingerprint'] = _fingerprint(lowered)
+    if fingerprint != 'string':
+        analysis['fingerprint_hash'], analysis['simhash'] = _simhash(lowered)
+
+    if text is None:
+        analysis['source'] = None
+        return analysis
+
+    analysis['source'] = _source(text, lowered=lowered)
+
+    if analysis['source'] in SOURCE_TITLEII:
+        analysis['titleii'] = SOURCE_TITLEII[analysis['source']]
+    else:
+        titleii_sent = _titleii(text, lowered=lowered)
+        if titleii_sent is not None:
+            analysis['titleii'] = titleii_sent
+
+    return analysis
 
-    analysis = {
-        'fingerprint': fingerprint(comment),
+
+def comment_analysis(comment):
+    '''Returns the analysis fields that depend on the rest of the filing.'''
+    comment = as_comment(comment)
+
+    return {
         'fulladdress': fulladdress(comment),
         'capsemail': capsemail(comment),
-        # 'titleii': titleii(comment),
-        'source': source(comment),
         'proceedings_keys': proceeding_keys(comment),
         'onsite': onsite(comment),
         'ingestion_method': ingestion_method(comment)
     }
 
-    source_mapping = {
-        'bot.unprecedented': False,
-        'bot.outraged': False,
-        'form.diminished-investment': False,
-        'form.freeourinternet': False,
-        'form.fwact': False,
-        'form.tpa': False,
-        'bot.recursive'
-
-        'johnoliver': True,
-        'form.battleforthenet': True,
-        'reddit.technology': True,
-        'blog.venturebeat': True,
-        'form.dearfcc': True,
-        'form.signforgood': True,
-        'form.demandprogress': True
-    }
-    if analysis['source'] in source_mapping:
-        analysis['titleii'] = source_mapping[analysis['source']]
 
-    if 'titleii' not in analysis:
-
-        titleii_sent = titleii(comment)
-        if titleii_sent is not None:
-            analysis['titleii'] = titleii_sent
+def analyze(comment, fingerprint='string'):
+    comment = as_comment(comment)
 
+    analysis = comment_analysis(comment)
+    analysis.update(text_analysis(comment.text_data, fingerprint=fingerprint))
+    analysis['version'] = analysis_version(fingerprint)
     return analysis
+
+
+def iter_rows(comments):
+    '''Yields comment dicts from either a list of comments or a columnar batch.
+
+    A columnar batch is a dict mapping field names (``text_data``,
+    ``contact_email``, ``addressentity``, ``proceedings``, ...) to equal-length
+    lists. None values are treated as missing fields.
+    '''
+    if not isinstance(comments, dict):
+        for comment in comments:
+            yield comment
+        return
+
+    fields = list(comments.keys())
+    for values in zip(*[comments[field] for field in fields]):
+        yield {field: value for field, value in zip(fields, values) if value is not None}
+
+
+def analyze_batch(comments, cache=None, fingerprint='string'):
+    '''Analyzes a batch of comments, returning a list of analyses in order.
+
+    Accepts anything ``iter_rows()`` does, or a list of records.Comment. The
+    text-derived fields are only computed once per distinct ``text_data`` in
+    the batch, which saves most of the work since the bulk of the corpus is
+    form letters. Pass an ``AnalysisCache`` to reuse them across batches too;
+    it fingerprints as it was configured to, rather than by ``fingerprint``.
+    '''
+    comments = [as_comment(comment) for comment in iter_rows(comments)]
+    distinct = set(comment.text_data for comment in comments)
+    if cache is None:
+        texts = {text: text_analysis(text, fingerprint=fingerprint) for text in distinct}
+    else:
+        texts = cache.analyze_texts(distinct)
+        fingerprint = cache.fingerprint
+    version = analysis_version(fingerprint)
+
+    analyses = []
+    for comment in comments:
+        analysis = comment_analysis(comment)
+        analysis.update(texts[comment.text_data])
+        analysis['version'] = version
+        analyses.append(analysis)
+    return analyses
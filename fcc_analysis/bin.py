@@ -1,8 +1,9 @@
 import os
+import sys
 import argparse
 
-from .index import CommentIndexer
-from .analyze import CommentAnalyzer
+# Each command imports what it runs, so `fcc --help` and short cron runs
+# don't pay for requests, tqdm, asyncio and multiprocessing they never use.
 
 
 def index_command(args):
@@ -25,13 +26,85 @@ def index_command(args):
         const=False
     )
     parser.add_argument(
-        '--fast-out', dest='fastout', nargs='?',
-        help='Quit when we see a comment that we\'ve already ingested', default=True,
-        const=False
+        '--fast-out', dest='fastout', action='store_true',
+        help='Quit when we see a comment that we\'ve already ingested'
+    )
+    parser.add_argument(
+        '-c', '--concurrency', dest='concurrency', type=int, default=1,
+        help='Number of ECFS pages to fetch at once'
+    )
+    parser.add_argument(
+        '--rate', dest='rate', type=float, default=None,
+        help='Maximum number of ECFS requests per second'
+    )
+    parser.add_argument(
+        '--unordered', dest='ordered', action='store_false',
+        help='Index pages as they arrive, rather than in offset order'
+    )
+    parser.add_argument(
+        '--checkpoint', dest='checkpoint',
+        help='Crawl in date windows, recording progress to this file'
+    )
+    parser.add_argument(
+        '--resume', dest='resume', action='store_true',
+        help='Continue from the last committed window in the checkpoint file'
+    )
+    parser.add_argument(
+        '--max-window', dest='max_window', type=int, default=10000,
+        help='Split date windows until each has at most this many filings'
+    )
+    parser.add_argument(
+        '--bulk-concurrency', dest='bulk_concurrency', type=int, default=2,
+        help='Number of _bulk requests to keep in flight'
+    )
+    parser.add_argument(
+        '--store', dest='store',
+        help='Use a local directory of compressed JSON lines instead of Elasticsearch'
+    )
+    parser.add_argument(
+        '--compression', dest='compression', choices=['gzip', 'zstd', 'none'], default='gzip',
+        help='Compression for new local stores'
+    )
+    parser.add_argument(
+        '--engine', dest='engine', choices=['process', 'async'], default='process',
+        help='Crawl and write from one asyncio event loop, instead of a crawler and a bulk indexing process'
+    )
+    parser.add_argument(
+        '--from-file', dest='from_file', nargs='+',
+        help='Index JSON array or JSON lines exports (optionally .gz, .bz2 or .zst) instead of crawling ECFS'
+    )
+    parser.add_argument(
+        '--readers', dest='readers', type=int, default=None,
+        help='Number of processes reading --from-file exports (defaults to one less than the number of cores)'
+    )
+    parser.add_argument(
+        '--metrics', dest='metrics',
+        help='Export pipeline metrics every 10 seconds: a JSON lines file, or a directory for --metrics-format=prometheus'
+    )
+    parser.add_argument(
+        '--metrics-format', dest='metrics_format', choices=['jsonl', 'prometheus'], default='jsonl'
+    )
+    parser.add_argument(
+        '--profile', dest='profile',
+        help='Directory to write a cProfile dump to for each process'
     )
     command_args = parser.parse_args(args=args)
 
-    indexer = CommentIndexer(**vars(command_args))
+    command_args = vars(command_args)
+    engine = command_args.pop('engine')
+    paths = command_args.pop('from_file')
+    readers = command_args.pop('readers')
+    if paths:
+        if engine == 'async':
+            parser.error('--from-file reads with processes, so it can\'t be used with --engine=async')
+        from .exports import ExportIndexer
+        indexer = ExportIndexer(paths, readers=readers, **command_args)
+    elif engine == 'async':
+        from .aio import AsyncCommentIndexer
+        indexer = AsyncCommentIndexer(**command_args)
+    else:
+        from .index import CommentIndexer
+        indexer = CommentIndexer(**command_args)
     indexer.run()
 
 
@@ -46,14 +119,224 @@ def analyze_command(args):
         help='Don\'t verify SSL certs', default=True,
         const=False
     )
-    command_args = parser.parse_args(args=args)
-    analyzer = CommentAnalyzer(**vars(command_args))
+    parser.add_argument(
+        '--batch-size', dest='batch_size', type=int, default=100,
+        help='Number of comments to hand to each tagging worker at a time'
+    )
+    parser.add_argument(
+        '-w', '--workers', dest='workers', type=int, default=None,
+        help='Number of tagging processes (defaults to one less than the number of cores)'
+    )
+    parser.add_argument(
+        '--autoscale', dest='autoscale', action='store_true',
+        help='Run fewer tagging processes while the writer is falling behind, and more once it catches up'
+    )
+    parser.add_argument(
+        '--no-shared-memory', dest='shared_memory', action='store_false',
+        help='Send batches between processes through pipes, instead of shared memory'
+    )
+    parser.add_argument(
+        '--near-duplicates', dest='neardup', action='store_true',
+        help='Assign MinHash/LSH (or, with --fingerprint=simhash, SimHash) near-duplicate cluster ids to analysis.cluster'
+    )
+    parser.add_argument(
+        '--fingerprint', dest='fingerprint', choices=['string', 'simhash', 'both'], default='string',
+        help='Write the sorted-words fingerprint string, 64-bit fingerprint_hash and simhash integers, or both'
+    )
+    parser.add_argument(
+        '--slices', dest='slices', type=int, default=1,
+        help='Read with a sliced scroll, one analyzing process per slice'
+    )
+    parser.add_argument(
+        '--page-size', dest='page_size', type=int, default=1000,
+        help='Number of documents to fetch per scroll request'
+    )
+    parser.add_argument(
+        '--incremental', dest='incremental', action='store_true',
+        help='Only analyze documents that are unanalyzed or were analyzed by older rules'
+    )
+    parser.add_argument(
+        '--cache-size', dest='cache_size', type=int, default=100000,
+        help='Number of distinct texts each worker keeps analyses for (0 to disable)'
+    )
+    parser.add_argument(
+        '--cache', dest='cache',
+        help='SQLite file to share cached text analyses between workers and runs'
+    )
+    parser.add_argument(
+        '--bulk-concurrency', dest='bulk_concurrency', type=int, default=2,
+        help='Number of _bulk requests to keep in flight'
+    )
+    parser.add_argument(
+        '--store', dest='store',
+        help='Use a local directory of compressed JSON lines instead of Elasticsearch'
+    )
+    parser.add_argument(
+        '--compression', dest='compression', choices=['gzip', 'zstd', 'none'], default='gzip',
+        help='Compression for new local stores'
+    )
+    parser.add_argument(
+        '--metrics', dest='metrics',
+        help='Export pipeline metrics every 10 seconds: a JSON lines file, or a directory for --metrics-format=prometheus'
+    )
+    parser.add_argument(
+        '--metrics-format', dest='metrics_format', choices=['jsonl', 'prometheus'], default='jsonl'
+    )
+    parser.add_argument(
+        '--profile', dest='profile',
+        help='Directory to write a cProfile dump to for each process'
+    )
+    parser.add_argument(
+        '--lookup', dest='lookup',
+        help='Directory to build indexes from fingerprint, source, email and address to comment ids in'
+    )
+    parser.add_argument(
+        '--reuse', dest='reuse', action='store_true',
+        help='Count addresses, names and emails across all comments first, and add how often each is reused'
+    )
+    parser.add_argument(
+        '--input', dest='input',
+        help='Analyze a JSON array or JSON lines file of filings, instead of an index or store'
+    )
+    parser.add_argument(
+        '--output', dest='output', default='-',
+        help='Where to write the analyses of --input, as JSON lines (.gz to compress; defaults to stdout)'
+    )
+    parser.add_argument(
+        '--unordered', dest='ordered', action='store_false',
+        help='Write the analyses of --input as they finish, rather than in input order'
+    )
+    command_args = vars(parser.parse_args(args=args))
+    path = command_args.pop('input')
+    output = command_args.pop('output')
+    ordered = command_args.pop('ordered')
+    if path:
+        # These only mean something when reading from, and writing back to, an index or store.
+        for option, dest in (('--endpoint', 'endpoint'), ('--no-verify', 'verify'), ('--autoscale', 'autoscale'),
+                             ('--no-shared-memory', 'shared_memory'), ('--near-duplicates', 'neardup'),
+                             ('--slices', 'slices'), ('--page-size', 'page_size'), ('--incremental', 'incremental'),
+                             ('--bulk-concurrency', 'bulk_concurrency'), ('--store', 'store'),
+                             ('--compression', 'compression'), ('--metrics', 'metrics'),
+                             ('--metrics-format', 'metrics_format'), ('--profile', 'profile'),
+                             ('--lookup', 'lookup'), ('--reuse', 'reuse')):
+            if command_args[dest] != parser.get_default(dest):
+                parser.error('{} can\'t be used with --input'.format(option))
+
+        from .exports import iter_file
+        from .stream import analyze_stream, write_analyses
+        analyses = analyze_stream(
+            iter_file(path), workers=command_args['workers'], chunksize=command_args['batch_size'], ordered=ordered,
+            cache_size=command_args['cache_size'], cache_path=command_args['cache'],
+            fingerprint=command_args['fingerprint']
+        )
+        if output == '-':
+            write_analyses(analyses, sys.stdout.buffer)
+        else:
+            import gzip
+            with (gzip.open if output.endswith('.gz') else open)(output, 'wb') as f:
+                write_analyses(analyses, f)
+        return
+
+    from .analyze import CommentAnalyzer
+    analyzer = CommentAnalyzer(**command_args)
     analyzer.run()
 
 
+def stats_command(args):
+    parser = argparse.ArgumentParser(description='Summarize analyzed FCC comments, without writing anything back')
+    parser.add_argument(
+        '--endpoint', dest='endpoint',
+        default=os.environ.get('ES_ENDPOINT', 'http://127.0.0.1:9200/')
+    )
+    parser.add_argument(
+        '--no-verify', dest='verify', nargs='?',
+        help='Don\'t verify SSL certs', default=True,
+        const=False
+    )
+    parser.add_argument(
+        '--store', dest='store',
+        help='Read from a local directory of compressed JSON lines instead of Elasticsearch'
+    )
+    parser.add_argument(
+        '--slices', dest='slices', type=int, default=1,
+        help='Number of processes to read and summarize with, each reading its own slice'
+    )
+    parser.add_argument(
+        '--page-size', dest='page_size', type=int, default=1000,
+        help='Number of documents to fetch per scroll request'
+    )
+    parser.add_argument(
+        '--top', dest='top', type=int, default=100,
+        help='Number of most common fingerprints to report'
+    )
+    parser.add_argument(
+        '--format', dest='format', choices=['json', 'csv'], default='json'
+    )
+    parser.add_argument(
+        '-o', '--output', dest='output',
+        help='File to write the report to (defaults to stdout)'
+    )
+    command_args = vars(parser.parse_args(args=args))
+    output_format = command_args.pop('format')
+    output = command_args.pop('output')
+
+    from .stats import StatsRunner
+    stats = StatsRunner(**command_args).run()
+    write = stats.write_csv if output_format == 'csv' else stats.write_json
+    if output:
+        with open(output, 'w', newline='') as f:
+            write(f)
+    else:
+        write(sys.stdout)
+
+
+def lookup_command(args):
+    from .lookup import FIELDS, LookupIndex
+    parser = argparse.ArgumentParser(description='Query the indexes built by fcc analyze --lookup')
+    parser.add_argument('path', help='The --lookup directory')
+    parser.add_argument('field', choices=FIELDS)
+    parser.add_argument(
+        'key', nargs='?',
+        help='List the ids of comments with this key (for addresses, the four fields separated by " | ")'
+    )
+    parser.add_argument(
+        '--min-count', dest='min_count', type=int, default=1,
+        help='Without a key, list the keys with at least this many comments, and their counts'
+    )
+    parser.add_argument(
+        '--count', dest='count', action='store_true',
+        help='Print the number of comments with the key, instead of their ids'
+    )
+    parser.add_argument(
+        '--distance', dest='distance', type=int, default=None,
+        help='For a simhash, list comments whose SimHash is within this many bits of it, nearest first'
+    )
+    command_args = parser.parse_args(args=args)
+    if command_args.distance is not None and (command_args.field != 'simhash' or command_args.key is None):
+        parser.error('--distance needs the simhash field and a key')
+
+    with LookupIndex(command_args.path) as index:
+        if command_args.distance is not None:
+            near = index.near(command_args.key, command_args.distance)
+            ids = [id_submission for _, ids in near for id_submission in ids]
+            if command_args.count:
+                print(len(ids))
+            else:
+                for id_submission in ids:
+                    print(id_submission)
+        elif command_args.key is None:
+            for key, count in index.groups(command_args.field, min_count=command_args.min_count):
+                print('{}\t{}'.format(count, key))
+        elif command_args.count:
+            print(index.count(command_args.field, command_args.key))
+        else:
+            for id_submission in index.ids(command_args.field, command_args.key):
+                print(id_submission)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Run commands to index and analyze FCC comments')
-    parser.add_argument('command', choices=['index', 'analyze'])
+    parser.add_argument('command', choices=['index', 'analyze', 'stats', 'lookup'])
     parser.add_argument('args', nargs=argparse.REMAINDER)
 
     args = parser.parse_args()
@@ -61,4 +344,6 @@ def main():
     {
         'index': index_command,
         'analyze': analyze_command,
+        'stats': stats_command,
+        'lookup': lookup_command,
     }[args.command](args.args)
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+import threading
+import time
+import warnings
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import codec
+from .metrics import METRICS, SIZE_BUCKETS
+
+RETRY_STATUSES = (429, 503)
+
+
+def item_status(item):
+    '''Returns the status of one item from a ``_bulk`` response.'''
+    return list(item.values())[0].get('status')
+
+
+class BulkWriter:
+    '''Writes actions to an Elasticsearch ``_bulk`` endpoint.
+
+    Actions are buffered until the payload reaches ``max_bytes`` or
+    ``max_docs``, then posted on a background thread. At most ``concurrency``
+    requests are in flight; ``add()`` blocks once that many are outstanding,
+    which pushes back on whoever is feeding us (and on their queue, if it's
+    bounded).
+
+    Items rejected with 429 or 503 are retried on their own, with exponential
+    backoff. Every other item is handed to ``on_items`` once its request is
+    done, so callers can check for failures. Exceptions raised there, or by a
+    request, are re-raised from the next ``add()`` or ``close()``.
+    '''
+
+    def __init__(self, url, verify=True, max_bytes=8 * 1024 * 1024, max_docs=None, concurrency=2,
+                 retries=7, backoff=1, on_items=None, session=None):
+        self.url = url
+        self.verify = verify
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.concurrency = max(concurrency, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.on_items = on_items
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.slots = threading.Semaphore(self.concurrency)
+        self.lock = threading.Lock()
+        self.errors = []
+
+        self.buffer = []
+        self.buffer_size = 0
+
+        # Requests are numbered as they're submitted. ``watermark`` is the
+        # highest number such that it and every request before it are done.
+        self.submitted = 0
+        self.finished = set()
+        self.watermark = -1
+        self.callbacks = []
+
+    def add(self, action, source=None):
+        lines = codec.dumps(action) + b'\n'
+        if source is not None:
+            lines += codec.dumps(source) + b'\n'
+        self.add_lines(lines)
+
+    def add_lines(self, lines):
+        '''Adds one pre-serialized action (and its source line, if any), as UTF-8 bytes.'''
+        self.raise_errors()
+        self.buffer.append(lines)
+        self.buffer_size += len(lines)
+        if self.buffer_size >= self.max_bytes or (self.max_docs and len(self.buffer) >= self.max_docs):
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer, self.buffer_size = self.buffer, [], 0
+
+        self.slots.acquire()
+        with self.lock:
+            number = self.submitted
+            self.submitted += 1
+        future = self.executor.submit(self.post, lines)
+        future.add_done_callback(lambda future: self.done(number, future))
+
+    def after_pending(self, callback):
+        '''Calls ``callback`` once everything added so far has been written.'''
+        with self.lock:
+            # The current buffer will go out as request number ``submitted``.
+            needed = self.submitted if self.buffer else self.submitted - 1
+            if needed <= self.watermark:
+                callback()
+            else:
+                self.callbacks.append((needed, callback))
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.raise_errors()
+
+    def raise_errors(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def done(self, number, future):
+        self.slots.release()
+        with self.lock:
+            if future.exception() is not None:
+                self.errors.append(future.exception())
+            self.finished.add(number)
+            while self.watermark + 1 in self.finished:
+                self.watermark += 1
+                self.finished.remove(self.watermark)
+
+            ready = [callback for needed, callback in self.callbacks if needed <= self.watermark]
+            self.callbacks = [(needed, callback) for needed, callback in self.callbacks if needed > self.watermark]
+            try:
+                for callback in ready:
+                    callback()
+            except Exception as e:
+                self.errors.append(e)
+
+    def post(self, lines):
+        items = []
+        for attempt in range(self.retries):
+            data = b''.join(lines)
+            METRICS.observe('fcc_bulk_request_bytes', len(data), buckets=SIZE_BUCKETS)
+            with warnings.catch_warnings(), METRICS.timer('fcc_bulk_request_seconds'):
+                warnings.simplefilter('ignore')
+                response = self.session.post(
+                    self.url, data=data, verify=self.verify,
+                    headers={'Content-Type': 'application/x-ndjson'}
+                )
+
+            if response.status_code == 413:
+                raise Exception('Too large!')
+
+            if response.status_code in RETRY_STATUSES:
+                retry = lines
+            else:
+                try:
+                    response_items = codec.loads(response.content)['items'] if response.status_code == 200 else None
+                except (ValueError, KeyError):
+                    response_items = None
+                if response_items is None:
+                    raise Exception('Bulk request failed ({}): {}'.format(response.status_code, response.text[:1000]))
+
+                retry = []
+                for item, item_lines in zip(response_items, lines):
+                    if item_status(item) in RETRY_STATUSES:
+                        retry.append(item_lines)
+                    else:
+                        items.append(item)
+
+            if not retry:
+                break
+            METRICS.incr('fcc_bulk_retried_items', len(retry))
+            lines = retry
+            time.sleep(self.backoff * math.pow(2, attempt))
+        else:
+            raise Exception('Gave up on {} bulk items after {} attempts'.format(len(lines), self.retries))
+
+        METRICS.incr('fcc_bulk_items', len(items))
+        if self.on_items is not None:
+            self.on_items(items)
+        return items
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+import hashlib
+import sqlite3
+
+from . import codec
+from .analyzers import text_analysis, ANALYZER_VERSION
+
+
+def text_key(text, fingerprint='string'):
+    '''A content hash of the text, and of the rules and fingerprint it was analyzed with.'''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(ANALYZER_VERSION.encode('utf-8'))
+    if fingerprint != 'string':
+        digest.update(fingerprint.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self.items[key]
+        except KeyError:
+            return None
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SQLiteCache:
+    '''An on-disk cache that survives between runs, and can be shared by processes.'''
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+
+    @property
+    def connection(self):
+        # Connections can't cross processes, so each one opens its own.
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, analysis TEXT)')
+            self._connection.commit()
+        return self._connection
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        # Stay well under SQLite's limit on query parameters.
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.connection.execute(
+                'SELECT key, analysis FROM analyses WHERE key IN ({})'.format(','.join('?' * len(chunk))), chunk
+            )
+            for key, analysis in rows:
+                found[key] = codec.loads(analysis)
+        return found
+
+    def put_many(self, items):
+        if not items:
+            return
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO analyses (key, analysis) VALUES (?, ?)',
+                [(key, codec.dumps(analysis)) for key, analysis in items.items()]
+            )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+
+class AnalysisCache:
+    '''Caches ``text_analysis()`` results by a hash of the text.
+
+    Most of the corpus is form letters, so most texts have been seen before.
+    Lookups go to an in-process LRU of ``maxsize`` entries first, then to the
+    optional SQLite file at ``path``.
+    '''
+
+    def __init__(self, maxsize=100000, path=None, fingerprint='string'):
+        self.fingerprint = fingerprint
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(path) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    def analyze_texts(self, texts):
+        '''Returns a dict mapping each of ``texts`` to its text analysis.'''
+        results = {}
+        keys = {}
+        for text in texts:
+            if text is None:
+                results[text] = text_analysis(text, fingerprint=self.fingerprint)
+                continue
+            key = text_key(text, fingerprint=self.fingerprint)
+            analysis = self.memory.get(key)
+            if analysis is None:
+                keys[key] = text
+            else:
+                results[text] = analysis
+                self.hits += 1
+
+        if keys and self.disk is not None:
+            for key, analysis in self.disk.get_many(keys).items():
+                self.memory.put(key, analysis)
+                results[keys.pop(key)] = analysis
+                self.hits += 1
+
+        self.misses += len(keys)
+
+        computed = {}
+        for key, text in keys.items():
+            analysis = text_analysis(text, fingerprint=self.fingerprint)
+            self.memory.put(key, analysis)
+            computed[key] = analysis
+            results[text] = analysis
+
+        if self.disk is not None:
+            self.disk.put_many(computed)
+
+        return results
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,67 @@
+from collections import namedtuple
+from datetime import datetime
+import json
+import os
+
+DATE_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+# Sent down the index queue after the filings of a page. Once everything
+# queued before it has been written, the window's progress can be committed.
+CheckpointMark = namedtuple('CheckpointMark', ['window', 'offset', 'done'])
+
+
+def parse_date(value):
+    value = value.rstrip('Z')
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError('Unrecognized date: {}'.format(value))
+
+
+def split_window(gte, lte):
+    '''Splits a date window in half, returning None if it's too small to split.'''
+    start, end = parse_date(gte), parse_date(lte)
+    if (end - start).total_seconds() < 120:
+        return None
+    middle = (start + (end - start) / 2).replace(microsecond=0).isoformat()
+    return (gte, middle), (middle, lte)
+
+
+class Checkpoint:
+    '''Tracks crawl progress through a list of ``date_received`` windows.
+
+    Each window is a dict with ``gte``, ``lte``, ``total``, the ``offset`` of
+    the next page to fetch, and whether it's ``done``. The file is rewritten
+    atomically, so a crash never leaves a half-written checkpoint behind.
+    '''
+
+    def __init__(self, path, windows=None):
+        self.path = path
+        self.windows = windows or []
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls(path, json.load(f)['windows'])
+
+    def save(self):
+        temp_path = '{}.tmp'.format(self.path)
+        with open(temp_path, 'w') as f:
+            json.dump({'windows': self.windows}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def commit(self, mark):
+        window = self.windows[mark.window]
+        window['offset'] = max(window['offset'], mark.offset)
+        window['done'] = window['done'] or mark.done
+
+    def pending(self):
+        for position, window in enumerate(self.windows):
+            if not window['done']:
+                yield position, window
+
+    @property
+    def remaining(self):
+        return sum(max((window['total'] or 0) - window['offset'], 0) for _, window in self.pending())
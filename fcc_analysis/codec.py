@@ -0,0 +1,39 @@
+'''JSON encoding and decoding, with the fastest library that's installed.
+
+orjson (or ujson) are several times faster than the standard library at
+both, and JSON is most of the work of moving filings between ECFS,
+Elasticsearch and the local store. ``dumps()`` always returns compact UTF-8
+bytes and ``loads()`` accepts bytes or str, whichever library is used.
+Decoding errors are all ValueErrors.
+'''
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+if orjson is not None:
+    NAME = 'orjson'
+    loads = orjson.loads
+    dumps = orjson.dumps
+
+elif ujson is not None:
+    NAME = 'ujson'
+    loads = ujson.loads
+
+    def dumps(value):
+        return ujson.dumps(value, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+else:
+    NAME = 'json'
+    loads = json.loads
+
+    def dumps(value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,339 @@
+'''Indexing filings from files: ECFS bulk exports, and our own crawl archives.
+
+A file is either a JSON array of filings or JSON lines, optionally gzip, bz2
+or zstd compressed (by extension). Both are parsed incrementally, so memory
+doesn't depend on the size of the file.
+
+Uncompressed files are split into byte ranges, one per reader process. A
+range boundary is moved forward to the start of the next filing, the same
+way by the reader on either side of it, so every filing is read exactly
+once. Compressed files can't be split, so each one is a single range.
+'''
+import bz2
+import codecs
+import gzip
+import io
+import json
+import multiprocessing
+import os
+from queue import Full
+import re
+
+from tqdm import tqdm
+
+from . import codec
+from .index import CommentIndexer
+from .metrics import METRICS
+from .pool import default_workers
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.zst')
+
+# Between filings in an array: whitespace, commas and the brackets themselves.
+ARRAY_SEPARATOR = re.compile(r'[\s,\[\]]*')
+# Where an element of an array might start, in an uncompressed file.
+ARRAY_ELEMENT = re.compile(rb'[\[,]\s*({)\s*"')
+
+
+def open_export(path):
+    '''Opens a file for reading as bytes, decompressing it if its extension says to.'''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('Reading {} needs the zstandard package'.format(path))
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True))
+    return open(path, 'rb')
+
+
+def is_array(path):
+    '''Returns True if the file holds a JSON array, rather than JSON lines.'''
+    with open_export(path) as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return False
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped.startswith(b'[')
+
+
+class LimitedReader(io.RawIOBase):
+    '''Reads a file from where it's positioned, up to ``length`` bytes.'''
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.f.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def find_boundary(f, offset, array):
+    '''Returns the offset of the first filing that starts at or after ``offset``.
+
+    A line starts at ``offset`` if the byte before it is a newline. In an
+    array, nested objects and strings can look like the start of an element,
+    so a candidate only counts if a filing, with an ``id_submission``, can be
+    parsed from it.
+    '''
+    size = os.fstat(f.fileno()).st_size
+    if offset <= 0:
+        return 0
+    if offset >= size:
+        return size
+
+    if not array:
+        f.seek(offset - 1)
+        f.readline()
+        return f.tell()
+
+    # Read from a little earlier, to see the separator before a filing at ``offset``.
+    start = max(offset - 64, 0)
+    while start < size:
+        f.seek(start)
+        data = f.read(1 << 20)
+        for match in ARRAY_ELEMENT.finditer(data):
+            position = start + match.start(1)
+            if position >= offset and is_filing_at(f, position):
+                return position
+        # Overlap, for a separator that spans two reads.
+        start += max(len(data) - 64, 1)
+    return size
+
+
+def is_filing_at(f, position):
+    decoder = json.JSONDecoder()
+    f.seek(position)
+    data = b''
+    size = 1 << 16
+    while True:
+        chunk = f.read(size)
+        data += chunk
+        text = data.decode('utf-8', 'replace')
+        try:
+            value, _ = decoder.raw_decode(text)
+        except json.JSONDecodeError as e:
+            if not chunk or not is_truncated(e, text):
+                return False
+            size *= 2
+            continue
+        return isinstance(value, dict) and 'id_submission' in value
+
+
+def is_truncated(error, text):
+    '''Returns True if a decoding error could just be the text ending too soon.'''
+    return error.msg.startswith('Unterminated string') or error.pos >= len(text) - 8
+
+
+def plan_ranges(paths, readers):
+    '''Splits files into at most about ``readers`` ranges of ``(path, start, end, array)``.
+
+    ``end`` is None for compressed files, which are always read whole.
+    '''
+    sizes = {path: os.path.getsize(path) for path in paths}
+    splittable = [path for path in paths if not path.endswith(COMPRESSED_EXTENSIONS)]
+    total = sum(sizes[path] for path in splittable)
+
+    ranges = []
+    for path in paths:
+        array = is_array(path)
+        if path not in splittable:
+            ranges.append((path, 0, None, array))
+            continue
+
+        # Readers not needed for compressed files are shared out by size.
+        shares = max(readers - (len(paths) - len(splittable)), 1)
+        parts = max(round(shares * sizes[path] / total), 1) if total else 1
+        with open(path, 'rb') as f:
+            boundaries = sorted(set(
+                find_boundary(f, sizes[path] * part // parts, array) for part in range(parts)
+            )) + [sizes[path]]
+        for start, end in zip(boundaries, boundaries[1:]):
+            if start < end:
+                ranges.append((path, start, end, array))
+    return ranges
+
+
+def iter_lines(stream):
+    for line in stream:
+        if line.strip():
+            yield codec.loads(line)
+
+
+def iter_array(stream, chunk_size=1 << 20):
+    '''Yields the values of a JSON array, reading ``chunk_size`` bytes at a time.
+
+    Any run of brackets and commas between values is skipped, so a range of
+    an array that doesn't start or end at the array's ends reads the same way.
+    '''
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        position = ARRAY_SEPARATOR.match(buffer, position).end()
+        if position < len(buffer):
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Read more if the value is just cut off at the end of the buffer.
+                if eof or not is_truncated(e, buffer):
+                    raise
+            else:
+                yield value
+                continue
+        elif eof:
+            return
+
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk, final=eof)
+        position = 0
+
+
+def iter_range(path, start=0, end=None, array=False):
+    '''Yields the filings in one range from ``plan_ranges()``.'''
+    with open_export(path) as f:
+        stream = f
+        if end is not None:
+            f.seek(start)
+            stream = io.BufferedReader(LimitedReader(f, end - start), buffer_size=1 << 20)
+        filings = iter_array(stream) if array else iter_lines(stream)
+        for filing in filings:
+            yield filing
+
+
+def iter_file(path):
+    '''Yields every filing in a file, in order.'''
+    return iter_range(path, array=is_array(path))
+
+
+class ExportIndexer(CommentIndexer):
+    '''Indexes filings from files instead of the ECFS API.
+
+    ``readers`` processes parse ranges of the files and hand pages of encoded
+    filings to the same bulk indexing process as a crawl. ``gte`` and ``lte``
+    filter on ``date_received``; the rest of the options are CommentIndexer's.
+    '''
+
+    def __init__(self, paths, readers=None, **kwargs):
+        if kwargs.get('checkpoint') or kwargs.get('resume'):
+            raise ValueError('Checkpoints are only for crawls; files are read start to finish')
+        super().__init__(**kwargs)
+        self.paths = paths
+        self.readers = readers or default_workers()
+
+    def run(self):
+        self.start_metrics('index')
+        index_queue = multiprocessing.Queue(maxsize=max(self.queue_size // self.limit, 2))
+        self.caught_up = multiprocessing.Event()
+        # Set when the bulk indexer dies, so readers stop waiting to put pages.
+        self.writer_failed = multiprocessing.Event()
+
+        bulk_index_process = multiprocessing.Process(target=self.bulk_index, args=(index_queue,))
+        bulk_index_process.start()
+
+        ranges = plan_ranges(self.paths, self.readers)
+        processes = []
+        finished = []
+        try:
+            for position, file_range in enumerate(ranges):
+                if self.writer_failed.is_set():
+                    break
+                process = multiprocessing.Process(target=self.read_range, args=(index_queue, file_range, position))
+                process.start()
+                processes.append(process)
+                # Start more readers only as earlier ones finish.
+                if len(processes) >= self.readers:
+                    finished.append(processes.pop(0))
+                    self.join_reader(finished[-1], bulk_index_process)
+
+            for process in processes:
+                self.join_reader(process, bulk_index_process)
+        finally:
+            if bulk_index_process.is_alive():
+                self.put_index(index_queue, None, bulk_index_process)
+            bulk_index_process.join()
+            METRICS.stop()
+
+        if bulk_index_process.exitcode:
+            index_queue.cancel_join_thread()
+            raise Exception('Bulk indexing failed (exit code {})'.format(bulk_index_process.exitcode))
+        failed = [process.exitcode for process in finished + processes if process.exitcode]
+        if failed:
+            raise Exception('{} readers failed (exit codes {})'.format(len(failed), failed))
+
+    def join_reader(self, process, bulk_index_process):
+        '''Waits for a reader, telling the readers to give up if the bulk indexer dies meanwhile.'''
+        while True:
+            process.join(timeout=1)
+            if process.exitcode is not None:
+                return
+            if not bulk_index_process.is_alive():
+                self.writer_failed.set()
+
+    def read_range(self, queue, file_range, position=0):
+        self.start_metrics('reader')
+        path, start, end, array = file_range
+        progress = tqdm(desc=os.path.basename(path), position=position % self.readers, unit=' filings')
+
+        page = []
+        for filing in iter_range(path, start, end, array):
+            if not self.wanted(filing):
+                METRICS.incr('fcc_export_skipped')
+                continue
+            page.append(filing)
+            if len(page) == self.limit:
+                self.put_page(queue, page)
+                progress.update(len(page))
+                page = []
+            if self.caught_up.is_set():
+                page = []
+                break
+        if page:
+            self.put_page(queue, page)
+            progress.update(len(page))
+        progress.close()
+        METRICS.stop()
+
+    def put_page(self, queue, page):
+        METRICS.incr('fcc_filings_read', len(page))
+        encoded = self.encode_page(page)
+        with METRICS.timer('fcc_queue_put_seconds', queue='index'):
+            while True:
+                try:
+                    queue.put(encoded, timeout=1)
+                    return
+                except Full:
+                    if self.writer_failed.is_set():
+                        # Nothing will read what's still buffered, so don't wait to flush it at exit.
+                        queue.cancel_join_thread()
+                        raise Exception('Bulk indexing failed, so there\'s nothing to read for')
+
+    def wanted(self, filing):
+        if not isinstance(filing, dict) or 'id_submission' not in filing:
+            return False
+        if self.gte or self.lte:
+            received = filing.get('date_received') or ''
+            if self.gte and received < self.gte:
+                return False
+            if self.lte and received > self.lte:
+                return False
+        return True
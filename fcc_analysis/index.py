@@ -1,20 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-import io
+import functools
 import itertools
-import json
 import math
+import os
 import time
-import warnings
 import multiprocessing
+from queue import Full
 from tqdm import tqdm
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from . import codec
+from .checkpoint import Checkpoint, CheckpointMark, split_window
+from .metrics import METRICS, queue_depth
+from .ratelimit import RateLimiter
+from .storage import ElasticsearchBackend, LocalBackend
+
+
+DEFAULT_CHECKPOINT = 'fcc-index.checkpoint.json'
 
 
 class CommentIndexer:
 
-    def __init__(self, lte=None, gte=None, limit=250, sort='date_disseminated,DESC', fastout=False, verify=True, endpoint='http://127.0.0.1/'):
-        if gte and not lte:
+    def __init__(self, lte=None, gte=None, limit=250, sort='date_disseminated,DESC', fastout=False, verify=True, endpoint='http://127.0.0.1/',
+                 concurrency=1, rate=None, ordered=True, fcc_endpoint='https://ecfsapi.fcc.gov/filings', backoff=1,
+                 checkpoint=None, resume=False, max_window=10000, bulk_concurrency=2, queue_size=10000,
+                 store=None, compression='gzip', backend=None, metrics=None, metrics_format='jsonl', profile=None):
+        if resume and not checkpoint:
+            checkpoint = DEFAULT_CHECKPOINT
+        if (gte or checkpoint) and not lte:
             lte = datetime.now().isoformat()
         if lte and not gte:
             gte = '2000-01-01'
@@ -25,127 +41,288 @@ class CommentIndexer:
         self.fastout = fastout
         self.verify = verify
         self.endpoint = endpoint
-        self.fcc_endpoint = 'https://ecfsapi.fcc.gov/filings'
+        self.fcc_endpoint = fcc_endpoint
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate)
+        self._session = None
+        self.checkpoint_path = checkpoint
+        self.resume = resume
+        self.max_window = max_window
+        self.checkpoint = None
+        self.caught_up = None
+        self.bulk_concurrency = bulk_concurrency
+        self.queue_size = queue_size
+        if backend is None and store:
+            backend = LocalBackend(store, compression=compression)
+        elif backend is None:
+            backend = ElasticsearchBackend(endpoint, verify=verify, bulk_concurrency=bulk_concurrency)
+        self.backend = backend
+        self.metrics = metrics
+        self.metrics_format = metrics_format
+        self.profile = profile
+
+    def start_metrics(self, role):
+        METRICS.start(role, path=self.metrics, format=self.metrics_format, profile=self.profile)
+
+    @property
+    def session(self):
+        # Created lazily, so each process gets its own connection pool.
+        if self._session is None:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.concurrency, 1))
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_session'] = None
+        return state
 
     def run(self):
-        index_queue = multiprocessing.Queue()
+        self.start_metrics('index')
+        # Bounded, so a slow Elasticsearch holds up the crawl instead of filling memory.
+        # The queue carries whole pages, but ``queue_size`` is in filings.
+        index_queue = multiprocessing.Queue(maxsize=max(self.queue_size // self.limit, 2))
+        self.caught_up = multiprocessing.Event()
+
+        total = None
+        if self.checkpoint_path:
+            self.checkpoint = self.load_checkpoint()
+            total = self.checkpoint.remaining
 
         bulk_index_process = multiprocessing.Process(
             target=self.bulk_index, args=(index_queue,),
         )
         bulk_index_process.start()
-        total = self.get_total()
+        if total is None:
+            total = self.get_total()
         if not total:
             print('error loading document total; using estimate')
             total = 5000000
         progress = tqdm(total=total)
 
-        for comment in self.iter_comments():
-            index_queue.put(comment)
-            progress.update(1)
+        try:
+            for filings, mark in self.iter_marked_pages():
+                METRICS.gauge('fcc_queue_depth', queue_depth(index_queue), queue='index')
+                with METRICS.timer('fcc_queue_put_seconds', queue='index'):
+                    if filings:
+                        self.put_index(index_queue, self.encode_page(filings), bulk_index_process)
+                        progress.update(len(filings))
+                    if mark is not None:
+                        self.put_index(index_queue, mark, bulk_index_process)
+                if self.caught_up.is_set():
+                    break
+        finally:
+            if bulk_index_process.is_alive():
+                self.put_index(index_queue, None, bulk_index_process)
+            bulk_index_process.join()
+            progress.close()
+            METRICS.stop()
+
+        if bulk_index_process.exitcode:
+            index_queue.cancel_join_thread()
+            raise Exception('Bulk indexing failed (exit code {})'.format(bulk_index_process.exitcode))
 
-        index_queue.put(None)
-        bulk_index_process.join()
-        progress.close()
+    def put_index(self, queue, item, bulk_index_process):
+        '''Puts a page or mark on the index queue, never blocking forever on a bulk indexer that has died.'''
+        while True:
+            try:
+                queue.put(item, timeout=1)
+                return
+            except Full:
+                if not bulk_index_process.is_alive():
+                    # Nothing will read what's still buffered, so don't wait to flush it at exit.
+                    queue.cancel_join_thread()
+                    raise Exception('Bulk indexing failed (exit code {})'.format(bulk_index_process.exitcode))
+
+    def load_checkpoint(self):
+        if self.resume and os.path.exists(self.checkpoint_path):
+            return Checkpoint.load(self.checkpoint_path)
+        checkpoint = Checkpoint(self.checkpoint_path, self.plan_windows())
+        checkpoint.save()
+        return checkpoint
+
+    def plan_windows(self):
+        '''Splits the date range into windows with at most ``max_window`` filings each.
+
+        Deep offsets are the slowest (and flakiest) pages on the ECFS API, so it's
+        much cheaper to crawl lots of small windows. Windows are returned newest
+        first, to match the default sort.
+        '''
+        windows = []
+        stack = [(self.gte, self.lte)]
+        while stack:
+            gte, lte = stack.pop()
+            total = self.get_total(gte=gte, lte=lte)
+            halves = None
+            if total and total > self.max_window:
+                halves = split_window(gte, lte)
+            if halves:
+                stack.extend(halves)
+            else:
+                windows.append({'gte': gte, 'lte': lte, 'total': total, 'offset': 0, 'done': total == 0})
+        return windows
 
-    def build_query(self):
+    def iter_marked_pages(self):
+        '''Yields ``(filings, mark)`` pairs; ``mark`` records progress if we're checkpointing.'''
+        if self.checkpoint is None:
+            for filings in self.iter_pages():
+                yield filings, None
+            return
+
+        for position, window in self.checkpoint.pending():
+            query = self.build_query(gte=window['gte'], lte=window['lte'])
+            start_page = window['offset'] // self.limit
+            offset = window['offset']
+            for page, filings in enumerate(self.iter_pages(query=query, start_page=start_page), start_page):
+                mark = None
+                # Pages can arrive out of order, in which case we only record whole windows.
+                if self.ordered:
+                    offset = (page + 1) * self.limit
+                    mark = CheckpointMark(position, offset, False)
+                yield filings, mark
+            yield [], CheckpointMark(position, offset, True)
+
+    def build_query(self, gte=None, lte=None):
+        gte = gte or self.gte
+        lte = lte or self.lte
         query = {
             'proceedings.name': '17-108',
             'sort': self.sort
         }
-        if self.lte and self.gte:
+        if lte and gte:
             query['date_received'] = '[gte]{gte}[lte]{lte}'.format(
-                gte=self.gte,
-                lte=self.lte
+                gte=gte,
+                lte=lte
             )
         return query
 
-    def get_total(self):
-        query = self.build_query()
+    def get_total(self, gte=None, lte=None):
+        query = self.build_query(gte=gte, lte=lte)
         query['limit'] = 1
-        response = requests.get(self.fcc_endpoint, params=query)
+        self.rate_limiter.wait(self.fcc_endpoint)
+        response = self.session.get(self.fcc_endpoint, params=query)
         try:
-            agg = response.json().get('aggregations', {})
-            if not agg:
-                return None
-            for bucket in agg.get('proceedings_name', {}).get('buckets', []):
-                if bucket['key'] == query['proceedings.name']:
-                    return bucket['doc_count']
-        except json.decoder.JSONDecodeError:
+            return self.parse_total(codec.loads(response.content), query)
+        except ValueError:
             return None
+
+    def parse_total(self, data, query):
+        agg = data.get('aggregations', {})
+        if not agg:
+            return None
+        for bucket in agg.get('proceedings_name', {}).get('buckets', []):
+            if bucket['key'] == query['proceedings.name']:
+                return bucket['doc_count']
         return None
 
+    def fetch_page(self, query, page):
+        query = dict(query, limit=self.limit, offset=page * self.limit)
+        for i in range(7):
+            self.rate_limiter.wait(self.fcc_endpoint)
+            with METRICS.timer('fcc_ecfs_fetch_seconds'):
+                response = self.session.get(self.fcc_endpoint, params=query)
 
-    def iter_comments(self, page=0):
-        query = self.build_query()
-        for page in itertools.count(0):
-            query.update({
-                'limit': self.limit,
-                'offset': page * self.limit,
-            })
-            for i in range(7):
-                response = requests.get(self.fcc_endpoint, params=query)
-
-                try:
-                    filings = response.json().get('filings', [])
-                except json.decoder.JSONDecodeError:
-                    # Exponentially wait--sometimes the API goes down.
-                    time.sleep(math.pow(2, i))
-                    continue
-                else:
+            try:
+                filings = codec.loads(response.content).get('filings', [])
+                METRICS.incr('fcc_filings_fetched', len(filings))
+                return filings
+            except ValueError:
+                METRICS.incr('fcc_ecfs_retries')
+                # Exponentially wait--sometimes the API goes down.
+                time.sleep(self.backoff * math.pow(2, i))
+        raise Exception('Couldn\'t load filings at offset {}'.format(query['offset']))
+
+    def iter_pages(self, query=None, start_page=0):
+        if query is None:
+            query = self.build_query()
+
+        if self.concurrency <= 1:
+            for page in itertools.count(start_page):
+                filings = self.fetch_page(query, page)
+                yield filings
+                if len(filings) != self.limit:
+                    break
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {}
+            next_page = start_page
+            last_page = None  # The first page that came back short
+
+            while True:
+                while len(pending) < self.concurrency and (last_page is None or next_page <= last_page):
+                    pending[executor.submit(self.fetch_page, query, next_page)] = next_page
+                    next_page += 1
+                if not pending:
                     break
+
+                if self.ordered:
+                    done = [min(pending, key=pending.get)]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    page = pending.pop(future)
+                    filings = future.result()
+                    if len(filings) != self.limit and (last_page is None or page < last_page):
+                        last_page = page
+                    if last_page is not None and page > last_page:
+                        continue
+                    yield filings
+
+    def iter_comments(self):
+        for filings in self.iter_pages():
             for filing in filings:
                 yield filing
 
-            if len(filings) != self.limit:
-                break
+    def encode_page(self, filings):
+        '''Encodes a page of filings, once, into ``(id, JSON bytes)`` pairs.
 
-    def bulk_index(self, queue):
-        endpoint = '{}{}/filing/{}'.format(
-            self.endpoint,
-            'fcc-comments',
-            '_bulk'
-        )
+        The bulk indexing process writes the bytes as they are, so filings are
+        never pickled through the queue or decoded again.
+        '''
+        page = []
+        for filing in filings:
+            filing.pop('_index', None)
+            page.append((filing['id_submission'], codec.dumps(filing)))
+        return page
 
-        payload = io.StringIO()
-        payload_size = 0
-        created = False
+    def bulk_index(self, queue):
+        self.start_metrics('writer')
+        self.created = False
+        writer = self.backend.document_writer(on_items=self.check_created)
 
         while True:
+            # Either a CheckpointMark, or a page from encode_page().
             document = queue.get()
             if document is None:
                 break
 
-            try:
-                del document['_index']
-            except KeyError:
-                pass
-
-            index = {"create": {"_id": document['id_submission']}}
-            payload_size += payload.write(json.dumps(index))
-            payload_size += payload.write('\n')
-            payload_size += payload.write(json.dumps(document))
-            payload_size += payload.write('\n')
-
-            if payload_size > 8 * 1024 * 1024:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    response = requests.post(endpoint, data=payload.getvalue(), verify=self.verify)
-                    if response == 413:
-                        raise Exception('Too large!')
-                    payload = io.StringIO()
-                    payload_size = 0
-                    for item in response.json()['items']:
-                        if item['create']['status'] == 201:
-                            created = True
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            response = requests.post(endpoint, data=payload.getvalue(), verify=self.verify)
-            payload = io.StringIO()
-            payload_size = 0
-            for item in response.json()['items']:
-                if item['create']['status'] == 201:
-                    created = True
-
-        return created
+            if isinstance(document, CheckpointMark):
+                writer.after_pending(functools.partial(self.commit_marks, [document]))
+                continue
+
+            for id_submission, source in document:
+                writer.add_encoded(id_submission, source)
+
+        writer.close()
+        return self.created
+
+    def check_created(self, items):
+        for item in items:
+            if item['create']['status'] == 201:
+                self.created = True
+            elif item['create']['status'] == 409 and self.fastout and self.caught_up is not None:
+                # We've reached comments from a previous crawl.
+                self.caught_up.set()
+
+    def commit_marks(self, marks):
+        if self.checkpoint is None or not marks:
+            return
+        for mark in marks:
+            self.checkpoint.commit(mark)
+        self.checkpoint.save()
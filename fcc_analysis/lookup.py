@@ -0,0 +1,422 @@
+'''On-disk indexes from a comment's fingerprint, source, email and address to its id.
+
+``fcc analyze --lookup=DIR`` builds, for each of FIELDS, a sorted index from
+a normalized key to the ``id_submission`` of every comment with that key:
+
+- ``fingerprint``: ``analysis.fingerprint`` (or ``fingerprint_hash``, without the string)
+- ``source``: ``analysis.source``
+- ``email``: ``contact_email``, trimmed and lowercased
+- ``address``: the four address fields of a full address, lowercased, with whitespace collapsed
+- ``simhash``: ``analysis.simhash``, for comments analyzed with ``--fingerprint=simhash`` or ``both``
+
+SimHashes can also be looked up by Hamming distance. The 64 bits are cut into
+``simhash_distance + 1`` blocks, as in neardup.SimHashIndex, and the
+``simhash_blocks`` field indexes each distinct SimHash under the value of
+each of its blocks, so only SimHashes that share a block are compared.
+
+Layout::
+
+    <dir>/manifest.json
+    <dir>/<field>.groups   (key hash, first entry, count, key offset) per key, sorted by hash
+    <dir>/<field>.entries  (key hash, id offset) per comment, sorted by hash and id
+    <dir>/<field>.keys     newline-terminated keys
+    <dir>/<field>.ids      newline-terminated ids
+
+Files are read through mmap, so opening an index costs nothing and a point
+lookup is a binary search over the groups. Builds sort in bounded memory, by
+spilling sorted runs to disk and merging them. An incremental build merges
+into the existing index, replacing what it had for the comments it saw.
+'''
+import heapq
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+
+from . import codec
+from .analyzers import ANALYZER_VERSION
+from .neardup import hamming, MASK64, simhash_blocks
+from .sketches import hash64
+
+FIELDS = ('fingerprint', 'source', 'email', 'address', 'simhash')
+# Fields that are stored, but not looked up by key: SimHashes by block.
+STORED_FIELDS = FIELDS + ('simhash_blocks',)
+
+GROUP = struct.Struct('<QQQQ')
+ENTRY = struct.Struct('<QQ')
+KINDS = ('groups', 'entries', 'keys', 'ids')
+# Entries per line of a spilled run, and per write of a field's files.
+RUN_LINE = 1000
+
+WHITESPACE = re.compile(r'\s+', re.UNICODE)
+
+
+def normalize(field, value):
+    '''Returns the key for a value of ``field``, or None if it shouldn't be indexed.
+
+    Addresses may be given as a records.Comment address tuple, or a string
+    with the parts separated by `` | ``; only full addresses are indexed.
+    '''
+    if value is None:
+        return None
+    if field == 'address' and not isinstance(value, str):
+        if not all(value):
+            return None
+        value = ' | '.join(str(part) for part in value)
+    value = WHITESPACE.sub(' ', str(value)).strip()
+    if field in ('email', 'address'):
+        value = value.lower()
+    return value or None
+
+
+def block_keys(simhash, distance):
+    '''Returns the ``simhash_blocks`` keys of a SimHash, signed or not.'''
+    simhash = int(simhash) & MASK64
+    return ['{}:{}'.format(block, simhash >> shift & mask)
+            for block, (shift, mask) in enumerate(simhash_blocks(distance))]
+
+
+def comment_keys(comment, analysis):
+    '''Returns the key of a records.Comment for each of FIELDS, in order.'''
+    fingerprint = analysis.get('fingerprint') or analysis.get('fingerprint_hash')
+    values = (fingerprint, analysis.get('source'), comment.contact_email, comment.address, analysis.get('simhash'))
+    return [normalize(field, value) for field, value in zip(FIELDS, values)]
+
+
+class LookupIndex:
+    '''Reads an index written by LookupBuilder.'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.files = {}
+
+    def mapped(self, field, kind):
+        if field not in STORED_FIELDS:
+            raise ValueError('Unknown field: {}'.format(field))
+        if field not in self.manifest['fields']:
+            raise ValueError('The index has no {} field; rebuild it to add one'.format(field))
+        if (field, kind) not in self.files:
+            with open(os.path.join(self.path, '{}.{}'.format(field, kind)), 'rb') as f:
+                # Empty files can't be mapped.
+                data = b''
+                if os.fstat(f.fileno()).st_size:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.files[field, kind] = data
+        return self.files[field, kind]
+
+    def line(self, field, kind, offset):
+        data = self.mapped(field, kind)
+        return data[offset:data.find(b'\n', offset)].decode('utf-8')
+
+    def group(self, field, key):
+        '''Returns the ``(key hash, first entry, count, key offset)`` of a key, or None.'''
+        key = normalize(field, key)
+        if key is None:
+            return None
+        hashed = hash64(key)
+
+        groups = self.mapped(field, 'groups')
+        low, high = 0, len(groups) // GROUP.size
+        while low < high:
+            middle = (low + high) // 2
+            if GROUP.unpack_from(groups, middle * GROUP.size)[0] < hashed:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(groups) // GROUP.size:
+            return None
+        group = GROUP.unpack_from(groups, low * GROUP.size)
+        if group[0] != hashed or self.line(field, 'keys', group[3]) != key:
+            return None
+        return group
+
+    def count(self, field, key):
+        '''Returns the number of comments with a key.'''
+        group = self.group(field, key)
+        return group[2] if group else 0
+
+    def ids(self, field, key):
+        '''Returns the ids of the comments with a key, in order.'''
+        group = self.group(field, key)
+        if group is None:
+            return []
+        entries = self.mapped(field, 'entries')
+        return [
+            self.line(field, 'ids', ENTRY.unpack_from(entries, entry * ENTRY.size)[1])
+            for entry in range(group[1], group[1] + group[2])
+        ]
+
+    def near(self, simhash, distance=None):
+        '''Returns ``(SimHash, ids)`` for each SimHash within ``distance`` bits of ``simhash``, nearest first.
+
+        ``distance`` defaults to, and can't be more than, the one the index was built for.
+        '''
+        built = self.manifest['simhash_distance']
+        if distance is None:
+            distance = built
+        if distance > built:
+            raise ValueError('The index was built for distances of up to {} bits'.format(built))
+
+        simhash = int(simhash)
+        candidates = set()
+        for key in block_keys(simhash, built):
+            candidates.update(self.ids('simhash_blocks', key))
+
+        found = []
+        for candidate in candidates:
+            bits = hamming(simhash, int(candidate))
+            if bits <= distance:
+                # Incremental builds leave SimHashes behind that no comment has any more.
+                ids = self.ids('simhash', candidate)
+                if ids:
+                    found.append((bits, int(candidate), ids))
+        return [(candidate, ids) for _, candidate, ids in sorted(found)]
+
+    def groups(self, field, min_count=1):
+        '''Yields ``(key, count)`` for each key with at least ``min_count`` comments, in hash order.'''
+        for _, _, count, key_offset in GROUP.iter_unpack(self.mapped(field, 'groups')):
+            if count >= min_count:
+                yield self.line(field, 'keys', key_offset), count
+
+    def iter_entries(self, field):
+        '''Yields ``(key hash, id, key)`` for every entry, in the order they're stored.'''
+        entries = self.mapped(field, 'entries')
+        for hashed, first, count, key_offset in GROUP.iter_unpack(self.mapped(field, 'groups')):
+            key = self.line(field, 'keys', key_offset)
+            for entry in range(first, first + count):
+                yield hashed, self.line(field, 'ids', ENTRY.unpack_from(entries, entry * ENTRY.size)[1]), key
+
+    def close(self):
+        for data in self.files.values():
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LookupBuilder:
+    '''Builds (or, with ``incremental``, updates) the index in the ``path`` directory.
+
+    Entries are buffered, ``buffer_size`` at a time, and spilled to sorted
+    runs on disk. ``close()`` merges the runs, and the existing index for an
+    incremental build, into new files that replace the old ones. An
+    incremental build spills the ids it was given with each run too, and
+    drops their old entries by sorting the existing ones by id, again in
+    runs, and merging them with the ids. SimHashes can be looked up within ``simhash_distance``
+    bits of each other.
+    '''
+
+    def __init__(self, path, incremental=False, buffer_size=500000, simhash_distance=6):
+        self.path = path
+        self.incremental = incremental
+        self.buffer_size = buffer_size
+        self.simhash_distance = simhash_distance
+        manifest_path = os.path.join(path, 'manifest.json')
+        if incremental and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                built = json.load(f).get('simhash_distance', simhash_distance)
+            if built != simhash_distance:
+                raise ValueError('The index was built with a SimHash distance of {}, not {}'.format(
+                    built, simhash_distance
+                ))
+        os.makedirs(path, exist_ok=True)
+        # In the index directory, so finished files can be moved into place.
+        self.directory = tempfile.mkdtemp(prefix='.build-', dir=path)
+        self.entries = {field: [] for field in STORED_FIELDS}
+        self.hashes = {}
+        self.simhashes = set()
+        self.buffered = 0
+        self.runs = []
+        self.run_files = 0
+        self.seen = [] if incremental else None
+
+    def add(self, id_submission, keys):
+        '''Adds a comment, given its ``comment_keys()``.'''
+        hashes = self.hashes
+        for field, key in zip(FIELDS, keys):
+            if key is not None:
+                # Sources and campaign fingerprints repeat a lot, so hash each key once per run.
+                hashed = hashes.get(key)
+                if hashed is None:
+                    hashed = hashes[key] = hash64(key)
+                self.entries[field].append((hashed, id_submission, key))
+                self.buffered += 1
+
+        simhash = keys[FIELDS.index('simhash')]
+        if simhash is not None and simhash not in self.simhashes:
+            # Blocks are indexed once per distinct SimHash, with the SimHash in place of an id.
+            self.simhashes.add(simhash)
+            for key in block_keys(simhash, self.simhash_distance):
+                hashed = hashes.get(key)
+                if hashed is None:
+                    hashed = hashes[key] = hash64(key)
+                self.entries['simhash_blocks'].append((hashed, simhash, key))
+                self.buffered += 1
+        if self.seen is not None:
+            self.seen.append(id_submission)
+            self.buffered += 1
+        if self.buffered >= self.buffer_size:
+            self.spill()
+
+    def spill(self):
+        run = {}
+        for field, entries in self.entries.items():
+            entries.sort()
+            run[field] = self.write_run(field, entries)
+        if self.seen is not None:
+            run['seen'] = self.write_run('seen', [(id_submission,) for id_submission in sorted(set(self.seen))])
+            self.seen = []
+        self.runs.append(run)
+        self.entries = {field: [] for field in STORED_FIELDS}
+        self.hashes = {}
+        self.simhashes = set()
+        self.buffered = 0
+
+    def write_run(self, name, entries):
+        '''Writes sorted tuples to a new run file, returning its path.'''
+        path = os.path.join(self.directory, '{}-{}.run'.format(name, self.run_files))
+        self.run_files += 1
+        with open(path, 'wb') as f:
+            for start in range(0, len(entries), RUN_LINE):
+                f.write(codec.dumps(entries[start:start + RUN_LINE]))
+                f.write(b'\n')
+        return path
+
+    def unseen(self, entries):
+        '''Returns the sorted entries of an existing field, less those of the ids added in this build.'''
+        # Sort by id, in runs, so the ids that were added can be dropped in one merge.
+        by_id = [
+            self.write_run('existing', sorted((id_submission, hashed, key) for hashed, id_submission, key in chunk))
+            for chunk in iter_chunks(entries, self.buffer_size)
+        ]
+        seen = heapq.merge(*[iter_run(run['seen']) for run in self.runs])
+        next_seen = next(seen, None)
+
+        kept = []
+        runs = []
+        for id_submission, hashed, key in heapq.merge(*[iter_run(path) for path in by_id]):
+            while next_seen is not None and next_seen[0] < id_submission:
+                next_seen = next(seen, None)
+            if next_seen is not None and next_seen[0] == id_submission:
+                continue
+            kept.append((hashed, id_submission, key))
+            if len(kept) >= self.buffer_size:
+                kept.sort()
+                runs.append(self.write_run('kept', kept))
+                kept = []
+        kept.sort()
+        runs.append(self.write_run('kept', kept))
+        return heapq.merge(*[iter_run(path) for path in runs])
+
+    def close(self):
+        if self.buffered or not self.runs:
+            self.spill()
+
+        existing = None
+        if self.incremental and os.path.exists(os.path.join(self.path, 'manifest.json')):
+            existing = LookupIndex(self.path)
+
+        manifest = {'fields': list(STORED_FIELDS), 'analyzer_version': ANALYZER_VERSION,
+                    'simhash_distance': self.simhash_distance, 'entries': {}, 'keys': {}}
+        try:
+            for field in STORED_FIELDS:
+                streams = [iter_run(run[field]) for run in self.runs]
+                # Indexes built before a field was added don't have it yet.
+                if existing is not None and field in existing.manifest['fields']:
+                    entries = existing.iter_entries(field)
+                    # The ids of SimHash blocks are SimHashes, which stay put.
+                    if field != 'simhash_blocks':
+                        entries = self.unseen(entries)
+                    streams.append(entries)
+                manifest['entries'][field], manifest['keys'][field] = write_field(
+                    self.directory, field, heapq.merge(*streams)
+                )
+        finally:
+            if existing is not None:
+                existing.close()
+
+        for field in STORED_FIELDS:
+            for kind in KINDS:
+                name = '{}.{}'.format(field, kind)
+                os.replace(os.path.join(self.directory, name), os.path.join(self.path, name))
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(self.directory, 'manifest.json'), os.path.join(self.path, 'manifest.json'))
+        shutil.rmtree(self.directory)
+
+
+def iter_chunks(entries, size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_run(path):
+    with open(path, 'rb') as f:
+        for line in f:
+            for entry in codec.loads(line):
+                yield tuple(entry)
+
+
+def write_field(directory, field, entries):
+    '''Writes sorted ``(key hash, id, key)`` entries as a field's files; returns the entry and key counts.'''
+    files = {kind: open(os.path.join(directory, '{}.{}'.format(field, kind)), 'wb') for kind in KINDS}
+    chunks = {kind: [] for kind in KINDS}
+
+    def flush():
+        for kind, chunk in chunks.items():
+            files[kind].write(b''.join(chunk))
+            chunk.clear()
+
+    try:
+        count = 0
+        keys = 0
+        id_offset = 0
+        key_offset = 0
+        group = None
+        previous = None
+        for hashed, id_submission, key in entries:
+            if (hashed, id_submission) == previous:
+                continue
+            previous = (hashed, id_submission)
+
+            if group is None or group[0] != hashed:
+                if group is not None:
+                    chunks['groups'].append(GROUP.pack(*group))
+                group = [hashed, count, 0, key_offset]
+                line = key.encode('utf-8') + b'\n'
+                chunks['keys'].append(line)
+                key_offset += len(line)
+                keys += 1
+            group[2] += 1
+
+            line = id_submission.encode('utf-8') + b'\n'
+            chunks['entries'].append(ENTRY.pack(hashed, id_offset))
+            chunks['ids'].append(line)
+            id_offset += len(line)
+            count += 1
+            if count % RUN_LINE == 0:
+                flush()
+
+        if group is not None:
+            chunks['groups'].append(GROUP.pack(*group))
+        flush()
+    finally:
+        for f in files.values():
+            f.close()
+    return count, keys
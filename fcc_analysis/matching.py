@@ -0,0 +1,179 @@
+import re
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+PREFIX = 'prefix'
+CONTAINS = 'contains'
+ICONTAINS = 'icontains'
+
+RULE_KINDS = (PREFIX, CONTAINS, ICONTAINS)
+
+
+class SourceMatcher:
+    '''Matches text against an ordered table of literal rules in one pass.
+
+    Each rule is a ``(kind, needle, label)`` tuple, where kind is one of:
+
+      - prefix: the text starts with needle
+      - contains: needle appears anywhere in the text
+      - icontains: needle appears anywhere in the text, ignoring case
+
+    ``match()`` returns the label of the first rule in the table that matches,
+    exactly as if the rules were checked one after another.
+
+    Prefix rules are bucketed by their first few characters, so a text only
+    gets checked against the prefixes that could possibly match it. Substring
+    rules stay as plain ``in`` checks (CPython's substring search beats any
+    automaton we could write in Python), sharing a single lowercased copy of
+    the text.
+    '''
+
+    def __init__(self, rules, lead=8):
+        self.rules = []
+        for kind, needle, label in rules:
+            if kind not in RULE_KINDS:
+                raise ValueError('Unknown rule kind: {}'.format(kind))
+            if kind == ICONTAINS:
+                needle = needle.lower()
+            self.rules.append((kind, needle, label))
+
+        prefixes = [needle for kind, needle, _ in self.rules if kind == PREFIX]
+        self.lead = min([lead] + [len(needle) for needle in prefixes])
+
+        self.prefixes = {}
+        self.substrings = []
+        for position, (kind, needle, label) in enumerate(self.rules):
+            if kind == PREFIX:
+                bucket = self.prefixes.setdefault(needle[:self.lead], [])
+                bucket.append((position, needle, label))
+            else:
+                self.substrings.append((position, kind == ICONTAINS, needle, label))
+
+    def match(self, text, lowered=None):
+        '''Returns the label of the first matching rule, or None.
+
+        Pass ``lowered`` if the caller already has ``text.lower()`` around.
+        '''
+        best = len(self.rules)
+        result = None
+
+        for position, needle, label in self.prefixes.get(text[:self.lead], ()):
+            if text.startswith(needle):
+                best, result = position, label
+                break
+
+        for position, ignorecase, needle, label in self.substrings:
+            if position > best:
+                break
+            if ignorecase:
+                if lowered is None:
+                    lowered = text.lower()
+                if needle in lowered:
+                    return label
+            elif needle in text:
+                return label
+
+        return result
+
+
+class PatternSet:
+    '''Searches text for several families of regular expressions at once.
+
+    ``families`` is a list of ``(name, patterns)`` in order of precedence, where
+    ``patterns`` are compiled regexes. ``search()`` returns the name of the
+    first family with a pattern that matches anywhere in the text (or None),
+    exactly like searching each pattern in turn.
+
+    Case-insensitive matching is several times slower than plain matching in
+    the ``re`` module, and a merged alternation is slower still. So with
+    ``re``, case-insensitive patterns are lowercased and searched in a single
+    lowercased copy of the text, shared across every pattern (and with the
+    caller, via ``lowered``). That's only equivalent to ``re.IGNORECASE`` for
+    ASCII, so other text goes through the original patterns.
+
+    When the ``re2`` module is installed, all the patterns are instead merged
+    into one alternation of named groups, which re2 matches in linear time.
+    '''
+
+    def __init__(self, families):
+        self.names = [name for name, _ in families]
+        self.families = [[(pattern, fold(pattern)) for pattern in patterns] for _, patterns in families]
+        self.combined = None
+        if re2 is not None:
+            try:
+                self.compile_combined()
+            except Exception:
+                self.combined = None
+
+    def compile_combined(self):
+        self.groups = {}
+        alternatives = []
+        for family, patterns in enumerate(self.families):
+            family_alternatives = []
+            for position, (pattern, _) in enumerate(patterns):
+                group = 'f{}_{}'.format(family, position)
+                self.groups[group] = family
+                flags = '(?i)' if pattern.flags & re.IGNORECASE else ''
+                family_alternatives.append('(?P<{}>{}{})'.format(group, flags, pattern.pattern))
+            alternatives.append(family_alternatives)
+
+        self.combined = re2.compile('|'.join(sum(alternatives, [])))
+        # higher[i] matches any family with precedence over family i.
+        self.higher = [
+            re2.compile('|'.join(sum(alternatives[:family], []))) if family else None
+            for family in range(len(alternatives))
+        ]
+
+    def family(self, match):
+        for group, value in match.groupdict().items():
+            if value is not None:
+                return self.groups[group]
+
+    def search(self, text, lowered=None):
+        if self.combined is not None:
+            return self.search_combined(text)
+
+        ascii = text.isascii()
+        if ascii and lowered is None:
+            lowered = text.lower()
+
+        for name, patterns in zip(self.names, self.families):
+            for pattern, folded in patterns:
+                if folded is not None and ascii:
+                    match = folded.search(lowered)
+                else:
+                    match = pattern.search(text)
+                if match is not None:
+                    return name
+        return None
+
+    def search_combined(self, text):
+        match = self.combined.search(text)
+        if match is None:
+            return None
+
+        family = self.family(match)
+        # Anything that beats this family has to start further right, because
+        # the alternation tries higher-precedence families first at each position.
+        while family:
+            better = self.higher[family].search(text, match.start() + 1)
+            if better is None:
+                break
+            match, family = better, self.family(better)
+        return self.names[family]
+
+
+def fold(pattern):
+    '''Returns a case-sensitive, lowercase version of a case-insensitive pattern.
+
+    Returns None for patterns that aren't case-insensitive, or that have
+    escapes or extensions that lowercasing would change the meaning of.
+    '''
+    if not pattern.flags & re.IGNORECASE:
+        return None
+    if re.search(r'\\[A-Za-z]|\(\?', pattern.pattern):
+        return None
+    return re.compile(pattern.pattern.lower(), flags=pattern.flags & ~re.IGNORECASE)
@@ -0,0 +1,262 @@
+'''Counters, gauges and histograms for the index and analyze pipelines.
+
+Every process has its own registry, ``METRICS``, which does nothing until
+``start()`` is called in that process. Once started, a background thread
+exports a snapshot every ``interval`` seconds (and once more at exit), as
+either:
+
+- ``jsonl``: a JSON object per line, appended to one file shared by every process
+- ``prometheus``: a ``.prom`` file per process in a directory, for the node
+  exporter's textfile collector
+
+Values are cumulative since the process started; each snapshot is labelled
+with the process's role and pid.
+'''
+from bisect import bisect_left
+from contextlib import contextmanager
+import cProfile
+import json
+import multiprocessing.util
+import os
+import threading
+import time
+
+# Seconds, and bytes.
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(1 << shift for shift in range(10, 26, 2))
+
+FORMATS = ('jsonl', 'prometheus')
+
+# Timed one by one on a sample of batches; see ``time_analyzers()``.
+ANALYZER_FUNCTIONS = (
+    'fingerprint', 'source', 'titleii', 'fulladdress', 'capsemail', 'proceeding_keys', 'onsite', 'ingestion_method'
+)
+
+
+class Histogram:
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''``(upper bound, count of observations at or under it)`` pairs, ending with ``+Inf``.'''
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def metric_key(name, labels):
+    if not labels:
+        return name
+    return '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(key, value) for key, value in sorted(labels.items())))
+
+
+class Metrics:
+
+    def __init__(self):
+        self.active = False
+        self.role = 'main'
+        self.pid = None
+        self.exporter = None
+        self.profiler = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def incr(self, name, value=1, **labels):
+        if not self.active:
+            return
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        if not self.active or value is None:
+            return
+        with self.lock:
+            self.gauges[metric_key(name, labels)] = value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        if not self.active:
+            return
+        key = metric_key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'time': time.time(),
+                'role': self.role,
+                'pid': os.getpid(),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {
+                    key: {'buckets': histogram.cumulative(), 'sum': histogram.sum, 'count': histogram.count}
+                    for key, histogram in self.histograms.items()
+                },
+            }
+
+    def start(self, role, path=None, format='jsonl', interval=10, profile=None):
+        '''Starts collecting in this process, exporting to ``path`` and profiling into the ``profile`` directory.
+
+        Neither threads nor profilers survive a fork, so every worker process
+        calls this for itself.
+        '''
+        if self.pid != os.getpid():
+            # Inherited from the parent by a fork; that's the parent's to export.
+            if self.profiler is not None:
+                self.profiler.disable()
+            self.exporter = self.profiler = None
+        self.stop()
+        self.reset()
+        # The parent's lock may have been held by its exporter when we forked.
+        self.lock = threading.Lock()
+        self.role = role
+        self.pid = os.getpid()
+        if path:
+            if format not in FORMATS:
+                raise ValueError('Unknown metrics format: {}'.format(format))
+            self.active = True
+            self.exporter = Exporter(self, path, format, interval)
+            self.exporter.start()
+        if profile:
+            os.makedirs(profile, exist_ok=True)
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.profile_path = os.path.join(profile, '{}-{}.prof'.format(role, os.getpid()))
+
+        # Multiprocessing runs these as a worker exits, where atexit hooks don't run.
+        multiprocessing.util.Finalize(self, self.stop, exitpriority=10)
+
+    def stop(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+            self.exporter = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            self.profiler = None
+        self.active = False
+
+
+class Exporter(threading.Thread):
+
+    def __init__(self, metrics, path, format, interval):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.export()
+
+    def export(self):
+        snapshot = self.metrics.snapshot()
+        if self.format == 'jsonl':
+            # One write per line, so lines from different processes don't interleave.
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(snapshot) + '\n')
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, 'fcc-{}-{}.prom'.format(snapshot['role'], snapshot['pid']))
+        with open(path + '.tmp', 'w') as f:
+            f.write(to_prometheus(snapshot))
+        os.replace(path + '.tmp', path)
+
+
+def with_labels(key, labels):
+    name, _, existing = key.partition('{')
+    existing = existing.rstrip('}')
+    return '{}{{{}}}'.format(name, ','.join(part for part in (existing, labels) if part))
+
+
+def to_prometheus(snapshot):
+    '''Formats a snapshot in the Prometheus text exposition format.'''
+    process = 'role="{}",pid="{}"'.format(snapshot['role'], snapshot['pid'])
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        # Each family gets one TYPE line, however many label sets it has.
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+    for kind, values in (('counter', snapshot['counters']), ('gauge', snapshot['gauges'])):
+        for key, value in sorted(values.items()):
+            declare(key.partition('{')[0], kind)
+            lines.append('{} {}'.format(with_labels(key, process), value))
+
+    for key, histogram in sorted(snapshot['histograms'].items()):
+        name, _, labels = key.partition('{')
+        labels = labels.rstrip('}')
+        declare(name, 'histogram')
+        for bound, count in histogram['buckets']:
+            bucket_labels = ','.join(part for part in (labels, process, 'le="{}"'.format(bound)) if part)
+            lines.append('{}_bucket{{{}}} {}'.format(name, bucket_labels, count))
+        lines.append('{} {}'.format(with_labels(name + '_sum{' + labels + '}', process), histogram['sum']))
+        lines.append('{} {}'.format(with_labels(name + '_count{' + labels + '}', process), histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def queue_depth(queue):
+    '''The approximate size of a multiprocessing queue, or None where the platform can't tell.'''
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return None
+
+
+def time_analyzers(comments):
+    '''Times each analyzer function over ``comments``, one function at a time.
+
+    This repeats all of the work ``analyze()`` does, so callers only do it for
+    a sample of batches.
+    '''
+    from . import analyzers
+
+    for name in ANALYZER_FUNCTIONS:
+        function = getattr(analyzers, name)
+        start = time.perf_counter()
+        for comment in comments:
+            function(comment)
+        elapsed = time.perf_counter() - start
+        METRICS.observe('fcc_analyzer_seconds', elapsed / max(len(comments), 1), function=name)
+
+
+METRICS = Metrics()
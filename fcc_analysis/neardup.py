@@ -0,0 +1,259 @@
+from collections import OrderedDict
+import random
+import zlib
+
+from .sketches import hash64
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+MASK64 = (1 << 64) - 1
+# SimHash bit counts are kept in 32-bit lanes of one big integer; see SimHasher.
+LANE_BITS = 32
+LANE_ONES = sum(1 << (LANE_BITS * bit) for bit in range(64))
+LANE_TOPS = LANE_ONES << (LANE_BITS - 1)
+LANE_TOP_BITS = bytes.maketrans(b'\x00\x80', b'01')
+BINARY_DIGITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def to_signed(value):
+    '''Maps an unsigned 64-bit value onto Elasticsearch's (signed) ``long``.'''
+    return value - (1 << 64) if value >> 63 else value
+
+
+def hamming(a, b):
+    '''The number of bits two 64-bit values (signed or not) differ in.'''
+    return bin((a ^ b) & MASK64).count('1')
+
+
+def simhash_blocks(distance):
+    '''Cuts 64 bits into ``distance + 1`` blocks, returned as ``(shift, mask)`` pairs.
+
+    Two SimHashes that differ in at most ``distance`` bits must agree exactly
+    on at least one of the blocks.
+    '''
+    blocks = distance + 1
+    cuts = []
+    start = 0
+    for block in range(blocks):
+        width = 64 // blocks + (1 if block < 64 % blocks else 0)
+        cuts.append((start, (1 << width) - 1))
+        start += width
+    return cuts
+
+
+class MinHasher:
+    '''Computes MinHash signatures over the words of a fingerprint.
+
+    The permutations are derived from a fixed seed and the words are hashed
+    with crc32, so every process computes the same signature for the same text.
+    '''
+
+    def __init__(self, num_perm=64, seed=1):
+        generator = random.Random(seed)
+        self.permutations = [
+            (generator.randint(1, MERSENNE_PRIME - 1), generator.randint(0, MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, fingerprint):
+        hashes = [zlib.crc32(word.encode('utf-8')) for word in set(fingerprint.split())]
+        if not hashes:
+            return None
+        return tuple(
+            min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+            for a, b in self.permutations
+        )
+
+
+class SimHasher:
+    '''Computes a 64-bit SimHash, and an exact hash, of a set of words.
+
+    Each bit of the SimHash is set if it is set in the hashes of more than half
+    of the words, so texts that share most of their words get SimHashes that
+    differ in only a few bits. The exact hash is the sum of the word hashes,
+    which, like the string fingerprint, doesn't depend on word order.
+
+    To avoid counting 64 bits one at a time per word, each word's hash is also
+    kept "spread out", one bit at the bottom of each of 64 lanes of a big
+    integer; adding up the spread hashes counts every bit position at once.
+    Both are cached for up to ``cache_size`` words; the vocabulary of the
+    corpus is small, so the cache is simply emptied when it fills up.
+    '''
+
+    def __init__(self, cache_size=100000):
+        self.cache_size = cache_size
+        self.words = {}
+
+    def word_hashes(self, word):
+        hashes = self.words.get(word)
+        if hashes is None:
+            if len(self.words) >= self.cache_size:
+                self.words.clear()
+            hashed = hash64(word)
+            lanes = bytearray(LANE_BITS * 8)
+            lanes[::LANE_BITS // 8] = format(hashed, '064b')[::-1].encode('ascii').translate(BINARY_DIGITS)
+            hashes = self.words[word] = (hashed, int.from_bytes(lanes, 'little'))
+        return hashes
+
+    def hashes(self, words):
+        '''Returns ``(exact hash, SimHash)`` as signed 64-bit integers, or ``(None, None)`` for no words.'''
+        if not words:
+            return None, None
+
+        exact = 0
+        counts = 0
+        cached = self.words.get
+        for word in words:
+            hashes = cached(word) or self.word_hashes(word)
+            exact += hashes[0]
+            counts += hashes[1]
+
+        # Bias every lane so its top bit ends up set exactly where the count is
+        # over half, then read the top bits back out, most significant first.
+        counts = (counts + LANE_ONES * ((1 << (LANE_BITS - 1)) - 1 - len(words) // 2)) & LANE_TOPS
+        tops = counts.to_bytes(LANE_BITS * 8, 'little')[LANE_BITS // 8 - 1::LANE_BITS // 8]
+        simhash = int(tops.translate(LANE_TOP_BITS)[::-1], 2)
+        return to_signed(exact & MASK64), to_signed(simhash)
+
+
+class LSHIndex:
+    '''A streaming, banded LSH index that assigns near-duplicate cluster ids.
+
+    Signatures are cut into ``bands`` bands of ``rows`` rows each. Two comments
+    end up in the same cluster if any of their bands collide, which happens with
+    high probability once their Jaccard similarity is above roughly
+    ``(1 / bands) ** (1 / rows)``.
+
+    The cluster id is the id of the first comment seen in the cluster. Only the
+    ``max_buckets`` most recently used buckets are kept, so memory stays
+    bounded; active campaigns stay hot while one-off comments age out.
+    '''
+
+    # The analysis field the index works from.
+    field = 'fingerprint'
+
+    def __init__(self, bands=16, rows=4, max_buckets=2000000, seed=1):
+        self.bands = bands
+        self.rows = rows
+        self.max_buckets = max_buckets
+        self.hasher = MinHasher(num_perm=bands * rows, seed=seed)
+        self.buckets = OrderedDict()
+
+    def band_keys(self, fingerprint):
+        '''Returns the bucket keys for a fingerprint, or None if it is empty.
+
+        This is the expensive part, so it can run in the tagging workers and the
+        (cheap) keys can be handed to a single process calling ``assign()``.
+        '''
+        signature = self.hasher.signature(fingerprint)
+        if signature is None:
+            return None
+        # Tuples of ints hash the same in every process, unlike strings.
+        return [
+            hash((band,) + signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def assign(self, id_submission, keys):
+        '''Returns the cluster id for a comment, given its band keys.'''
+        if not keys:
+            return id_submission
+
+        cluster = None
+        for key in keys:
+            if key in self.buckets:
+                cluster = self.buckets[key]
+                break
+        if cluster is None:
+            cluster = id_submission
+
+        for key in keys:
+            self.buckets.setdefault(key, cluster)
+            self.buckets.move_to_end(key)
+
+        while len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+
+        return cluster
+
+    def cluster(self, id_submission, fingerprint):
+        return self.assign(id_submission, self.band_keys(fingerprint))
+
+
+class SimHashIndex:
+    '''A streaming index that clusters SimHashes within ``distance`` bits of each other.
+
+    It has the same interface as LSHIndex, but works from ``analysis.simhash``.
+    The 64 bits are cut into ``distance + 1`` blocks. Two SimHashes that differ
+    in at most ``distance`` bits must agree exactly on at least one block, so
+    only SimHashes sharing a block are compared. Comments are short, so a
+    couple of words' difference can flip a few bits; variants of the same form
+    letter are usually within the default of 6. Each bucket remembers its
+    ``bucket_size`` most recent SimHashes, and only the ``max_buckets`` most
+    recently used buckets are kept.
+
+    The index only lives as long as the process that builds it; to query
+    SimHashes after a run, build a lookup index (``fcc analyze --lookup``).
+    '''
+
+    field = 'simhash'
+
+    def __init__(self, distance=6, max_buckets=2000000, bucket_size=8):
+        self.distance = distance
+        self.max_buckets = max_buckets
+        self.bucket_size = bucket_size
+        self.buckets = OrderedDict()
+        self.blocks = simhash_blocks(distance)
+
+    def block_keys(self, simhash):
+        simhash &= MASK64
+        return [(block, simhash >> shift & mask) for block, (shift, mask) in enumerate(self.blocks)]
+
+    def band_keys(self, simhash):
+        '''Returns the keys to pass to ``assign()``: just the SimHash, as the blocks are cheap to cut.'''
+        if simhash is None:
+            return None
+        return [simhash]
+
+    def near(self, simhash):
+        '''Returns the ``(SimHash, cluster id)`` of each indexed SimHash within ``distance`` bits.'''
+        found = {}
+        for key in self.block_keys(simhash):
+            for other, cluster in self.buckets.get(key, ()):
+                if hamming(simhash, other) <= self.distance:
+                    found[other] = cluster
+        return list(found.items())
+
+    def assign(self, id_submission, keys):
+        '''Returns the cluster id for a comment, given its band keys.'''
+        if not keys:
+            return id_submission
+        simhash = keys[0]
+
+        cluster = None
+        block_keys = self.block_keys(simhash)
+        for key in block_keys:
+            for other, other_cluster in self.buckets.get(key, ()):
+                if hamming(simhash, other) <= self.distance:
+                    cluster = other_cluster
+                    break
+            if cluster is not None:
+                break
+        if cluster is None:
+            cluster = id_submission
+
+        for key in block_keys:
+            bucket = self.buckets.setdefault(key, [])
+            if not any(other == simhash for other, _ in bucket):
+                bucket.append((simhash, cluster))
+                del bucket[:-self.bucket_size]
+            self.buckets.move_to_end(key)
+
+        while len(self.buckets) > self.max_buckets:
+            self.buckets.popitem(last=False)
+
+        return cluster
+
+    def cluster(self, id_submission, simhash):
+        return self.assign(id_submission, self.band_keys(simhash))
@@ -0,0 +1,150 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import os
+import signal
+import time
+
+
+def default_workers():
+    '''One worker per core, leaving one for the reader and writer.'''
+    return max((os.cpu_count() or 2) - 1, 1)
+
+
+def ignore_interrupts(initializer=None, *initargs):
+    # Ctrl-C goes to the whole process group; only the parent should act on it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class WorkerPool:
+    '''Maps a function over batches with a pool of worker processes.
+
+    Results come back in the order the batches went in or, if ``ordered`` is
+    False, as they finish. ``size`` of up to ``workers`` processes run at a
+    time, with at most ``limit`` batches in flight, which bounds memory.
+    ``scale()`` changes the size, trading tagging throughput for CPU for the
+    stages around the pool.
+
+    If a worker process dies, the pool is rebuilt and the batches that were in
+    flight are resubmitted, up to ``max_restarts`` times. An exception raised
+    by ``function`` is re-raised from ``map()``.
+    '''
+
+    def __init__(self, function, workers=None, initializer=None, initargs=(), max_restarts=3, ordered=True,
+                 resize_interval=5):
+        self.function = function
+        self.ordered = ordered
+        self.workers = workers or default_workers()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_restarts = max_restarts
+        self.restarts = 0
+
+        # Starting processes isn't free, so the size changes at most once per interval.
+        self.resize_interval = resize_interval
+        self.resized = time.monotonic()
+
+        self.size = self.workers
+        # Keep a couple of batches queued per worker, so nobody waits on us.
+        self.limit = self.size * 2
+        self.pending = deque()
+        self.executor = self.start()
+
+    def start(self):
+        return ProcessPoolExecutor(
+            max_workers=self.size,
+            initializer=ignore_interrupts,
+            initargs=(self.initializer,) + tuple(self.initargs)
+        )
+
+    def restart(self):
+        self.restarts += 1
+        if self.restarts > self.max_restarts:
+            raise BrokenProcessPool('Worker processes died {} times, giving up'.format(self.restarts))
+
+        self.executor.shutdown(wait=False)
+        self.executor = self.start()
+        batches = [batch for batch, _ in self.pending]
+        self.pending = deque()
+        for batch in batches:
+            # Submit first: submitting can restart the pool again, which replaces ``pending``.
+            future = self.submit(batch)
+            self.pending.append((batch, future))
+
+    def submit(self, batch):
+        while True:
+            try:
+                return self.executor.submit(self.function, batch)
+            except BrokenProcessPool:
+                # A worker died since the last submit; that's only noticed here.
+                self.restart()
+
+    def map(self, batches):
+        for _, result in self.map_batches(batches):
+            yield result
+
+    def map_batches(self, batches):
+        '''Like ``map()``, but yields ``(batch, result)`` pairs.'''
+        for batch in batches:
+            future = self.submit(batch)
+            self.pending.append((batch, future))
+            while len(self.pending) >= self.limit:
+                yield self.next_done()
+        while self.pending:
+            yield self.next_done()
+
+    def drain(self):
+        '''Yields the results of every batch still in flight.'''
+        while self.pending:
+            yield self.next_result()
+
+    def next_result(self):
+        return self.next_done()[1]
+
+    def next_done(self):
+        '''Waits for the next batch to finish, returning it and its result.'''
+        while True:
+            index = 0
+            if not self.ordered:
+                done, _ = wait([future for _, future in self.pending], return_when=FIRST_COMPLETED)
+                index = next(i for i, (_, future) in enumerate(self.pending) if future in done)
+            batch, future = self.pending[index]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                self.restart()
+                continue
+            del self.pending[index]
+            return batch, result
+
+    def scale(self, backlog):
+        '''Adds or removes a worker, given how full (0 to 1) the next stage's queue is.
+
+        A full queue means the next stage can't keep up, so there's no point in
+        tagging faster, and a worker fewer leaves it a core; an empty one means
+        it's waiting on us.
+        '''
+        if time.monotonic() - self.resized < self.resize_interval:
+            return
+        if backlog > 0.75 and self.size > 1:
+            self.resize(self.size - 1)
+        elif backlog < 0.25 and self.size < self.workers:
+            self.resize(self.size + 1)
+
+    def resize(self, size):
+        '''Replaces the executor with one of ``size`` processes; batches in flight finish on the old one.'''
+        old = self.executor
+        self.size = size
+        self.limit = size * 2
+        self.executor = self.start()
+        old.shutdown(wait=False)
+        self.resized = time.monotonic()
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            # Some may be queued on executors that resize() replaced.
+            for _, future in self.pending:
+                future.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
@@ -0,0 +1,51 @@
+from urllib.parse import urlparse
+import threading
+import time
+
+
+class RateLimiter:
+    '''A thread-safe, per-host token bucket.
+
+    ``rate`` is the number of requests per second allowed to each host, with
+    bursts of up to ``burst`` requests. A rate of None disables limiting.
+    '''
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def reserve(self, url):
+        '''Takes a token for the host of ``url``, returning how long to wait before using it.
+
+        Callers that can't block (e.g. coroutines) can sleep for the returned
+        delay themselves.
+        '''
+        if not self.rate:
+            return 0
+
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            tokens, last = self.hosts.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self.hosts[host] = (tokens, now)
+
+        if tokens >= 0:
+            return 0
+        return -tokens / self.rate
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay:
+            time.sleep(delay)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
@@ -0,0 +1,89 @@
+import sys
+
+ADDRESS_FIELDS = ('address_line_1', 'city', 'state', 'zip_code')
+
+# Filings only have a handful of distinct proceeding shapes, so they're shared.
+_PROCEEDINGS = {}
+
+
+def intern_proceedings(proceedings):
+    '''Returns the shared tuple of each proceeding's sorted keys.'''
+    shape = tuple(tuple(sorted(proceeding)) for proceeding in proceedings)
+    return _PROCEEDINGS.setdefault(shape, shape)
+
+
+class Comment:
+    '''The parts of a filing that the analyzers look at, and nothing else.
+
+    A filing dict holds every ECFS field, with the address and each proceeding
+    as nested dicts. A Comment keeps the text and email, the four address
+    fields as a tuple, the key names of each proceeding (shared between every
+    comment with the same shape), the interned browser string and the first
+    filer's name, in slots.
+
+    ``address`` and ``proceedings`` are None when the filing didn't have them,
+    and ``name`` when it had no filers (or they weren't fetched).
+    '''
+
+    __slots__ = ('id_submission', 'text_data', 'contact_email', 'address', 'proceedings', 'browser', 'name')
+
+    def __init__(self, id_submission=None, text_data=None, contact_email=None, address=None, proceedings=None,
+                 browser=None, name=None):
+        self.id_submission = id_submission
+        self.text_data = text_data
+        self.contact_email = contact_email
+        self.address = address
+        self.proceedings = proceedings
+        self.browser = browser
+        self.name = name
+
+    @classmethod
+    def from_filing(cls, filing):
+        address = filing.get('addressentity')
+        if address is not None:
+            address = tuple(address.get(field) for field in ADDRESS_FIELDS)
+
+        proceedings = filing.get('proceedings')
+        if proceedings is not None:
+            proceedings = intern_proceedings(proceedings)
+
+        browser = filing.get('browser')
+        if browser is not None:
+            browser = sys.intern(browser)
+
+        filers = filing.get('filers')
+        name = filers[0].get('name') if filers else None
+
+        return cls(filing.get('id_submission'), filing.get('text_data'), filing.get('contact_email'),
+                   address, proceedings, browser, name)
+
+    @classmethod
+    def from_row(cls, row):
+        '''The inverse of ``to_row()``.'''
+        id_submission, text_data, contact_email, address, proceedings, browser, name = row
+        if address is not None:
+            address = tuple(address)
+        if proceedings is not None:
+            proceedings = tuple(tuple(keys) for keys in proceedings)
+            proceedings = _PROCEEDINGS.setdefault(proceedings, proceedings)
+        if browser is not None:
+            browser = sys.intern(browser)
+        return cls(id_submission, text_data, contact_email, address, proceedings, browser, name)
+
+    def to_row(self):
+        '''Returns the fields as a list that can be encoded as JSON.'''
+        return [self.id_submission, self.text_data, self.contact_email, self.address, self.proceedings, self.browser,
+                self.name]
+
+    def __eq__(self, other):
+        return isinstance(other, Comment) and self.to_row() == other.to_row()
+
+    def __repr__(self):
+        return '<Comment {}>'.format(self.id_submission)
+
+
+def as_comment(comment):
+    '''Returns a Comment for either a filing dict or a Comment.'''
+    if isinstance(comment, Comment):
+        return comment
+    return Comment.from_filing(comment)
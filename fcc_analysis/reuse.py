@@ -0,0 +1,101 @@
+'''Signals that need the whole corpus: how often each comment's address, name and email turn up.
+
+The analyzers only see one comment at a time. ``fcc analyze --reuse`` first
+streams the submitter fields of every comment into a ReuseSketch, then adds
+its estimates to each analysis:
+
+- ``address_reuse_count``: comments with the same full address
+- ``address_name_count``: different names at that address
+- ``name_reuse_count``: comments with the same name
+- ``email_reuse_count``: comments with the same email
+- ``email_domain_count``: comments with an email at the same domain
+- ``email_pattern_count``: different emails at that domain whose local parts are
+  the same once digits and punctuation are dropped (``jsmith1@``, ``j.smith22@``...)
+
+A field is None when the comment has nothing to count. Counts come from a
+count-min sketch, and different values are counted the first time a Bloom
+filter sees them, so memory is fixed (about 190MB at the defaults, sized for
+the full 20M comment corpus) rather than growing with the number of distinct
+addresses. Counts can be slightly high; counts of different values can be
+slightly low, when the Bloom filter takes a new value for one it has seen.
+'''
+import re
+
+from .lookup import normalize
+from .records import as_comment
+from .sketches import BloomFilter, CountMinSketch
+
+# What the first pass reads of each filing.
+REUSE_FIELDS = ('id_submission', 'contact_email', 'addressentity', 'filers')
+
+SIGNALS = (
+    'address_reuse_count', 'address_name_count', 'name_reuse_count',
+    'email_reuse_count', 'email_domain_count', 'email_pattern_count',
+)
+
+NAME_PUNCTUATION = re.compile(r'[^\w\s]+', re.UNICODE)
+LOCAL_PART_NOISE = re.compile(r'[\W\d_]+', re.UNICODE)
+
+
+def normalize_name(name):
+    '''Lowercases a name, dropping punctuation and collapsing whitespace.'''
+    if not name:
+        return None
+    return normalize('name', NAME_PUNCTUATION.sub('', name).lower())
+
+
+def submitter_keys(comment):
+    '''Returns the normalized ``(address, name, email, email domain, email pattern)`` of a records.Comment.'''
+    email = normalize('email', comment.contact_email)
+    domain = pattern = None
+    if email is not None and '@' in email:
+        local, _, domain = email.rpartition('@')
+        local = LOCAL_PART_NOISE.sub('', local)
+        if local:
+            pattern = '{}@{}'.format(local, domain)
+    return normalize('address', comment.address), normalize_name(comment.name), email, domain or None, pattern
+
+
+class ReuseSketch:
+    '''Counts submitter fields across comments, in fixed memory.
+
+    ``width`` and ``depth`` size the count-min sketch, and ``capacity`` and
+    ``error`` the Bloom filter of (address, name) pairs and emails already
+    counted; see sketches.CountMinSketch and sketches.BloomFilter.
+    '''
+
+    def __init__(self, width=1 << 23, depth=4, capacity=50000000, error=0.01):
+        self.counts = CountMinSketch(width, depth)
+        self.seen = BloomFilter(capacity, error)
+        self.total = 0
+
+    def add(self, comment):
+        '''Counts a filing dict or records.Comment.'''
+        address, name, email, domain, pattern = submitter_keys(as_comment(comment))
+        counts, seen = self.counts, self.seen
+        if address is not None:
+            counts.add('address\0' + address)
+            if name is not None and seen.add('address name\0{}\0{}'.format(address, name)):
+                counts.add('address names\0' + address)
+        if name is not None:
+            counts.add('name\0' + name)
+        if email is not None:
+            counts.add('email\0' + email)
+            if pattern is not None and seen.add('email\0' + email):
+                counts.add('email pattern\0' + pattern)
+        if domain is not None:
+            counts.add('email domain\0' + domain)
+        self.total += 1
+
+    def signals(self, comment):
+        '''Returns the SIGNALS of a filing dict or records.Comment, as a dict.'''
+        address, name, email, domain, pattern = submitter_keys(as_comment(comment))
+        count = self.counts.count
+        return {
+            'address_reuse_count': count('address\0' + address) if address is not None else None,
+            'address_name_count': count('address names\0' + address) if address is not None else None,
+            'name_reuse_count': count('name\0' + name) if name is not None else None,
+            'email_reuse_count': count('email\0' + email) if email is not None else None,
+            'email_domain_count': count('email domain\0' + domain) if domain is not None else None,
+            'email_pattern_count': count('email pattern\0' + pattern) if pattern is not None else None,
+        }
@@ -0,0 +1,183 @@
+'''Fixed-size, mergeable summaries of a stream.
+
+Each sketch can be built in a separate process and merged afterwards; memory
+depends on the sketch's parameters, never on the length of the stream.
+'''
+from array import array
+import hashlib
+import math
+
+
+def hash64(value):
+    '''A stable 64-bit hash, so sketches built in different processes agree.'''
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    '''Estimates the number of distinct values added.
+
+    Uses ``2 ** precision`` one-byte registers (16KB at the default); the
+    standard error is about ``1.04 / sqrt(2 ** precision)``, so under 1%.
+    '''
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision must be between 4 and 18')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = hash64(value)
+        bits = 64 - self.precision
+        register = hashed >> bits
+        remainder = hashed & ((1 << bits) - 1)
+        rank = bits - remainder.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Can\'t merge HyperLogLogs with different precisions')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+
+        # Linear counting is more accurate while most registers are still empty.
+        empty = self.registers.count(0)
+        if empty and estimate <= 2.5 * size:
+            estimate = size * math.log(size / empty)
+        return int(round(estimate))
+
+
+def probes(value, count, size):
+    '''Returns ``count`` positions in ``range(size)`` for a value, by double hashing one 64-bit hash.'''
+    hashed = hash64(value)
+    first, step = hashed & 0xffffffff, (hashed >> 32) | 1
+    return [(first + i * step) % size for i in range(count)]
+
+
+class CountMinSketch:
+    '''Estimates how many times each value was added.
+
+    Keeps ``depth`` rows of ``width`` 32-bit counters (128MB at the default);
+    a value's count is the smallest of its counters, so it's never an
+    underestimate. Adds are conservative, only raising the counters that are
+    below the new count, which keeps estimates for rare values close even
+    when common ones share their counters.
+    '''
+
+    def __init__(self, width=1 << 23, depth=4):
+        self.width = width
+        self.depth = depth
+        self.counters = array('I', bytes(4 * width * depth))
+
+    def positions(self, value):
+        return [row * self.width + column for row, column in enumerate(probes(value, self.depth, self.width))]
+
+    def add(self, value, count=1):
+        '''Adds ``count`` to a value, returning its new estimate.'''
+        counters = self.counters
+        positions = self.positions(value)
+        estimate = min(min([counters[position] for position in positions]) + count, 0xffffffff)
+        for position in positions:
+            if counters[position] < estimate:
+                counters[position] = estimate
+        return estimate
+
+    def count(self, value):
+        counters = self.counters
+        return min([counters[position] for position in self.positions(value)])
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('Can\'t merge CountMinSketches with different dimensions')
+        self.counters = array('I', (min(a + b, 0xffffffff) for a, b in zip(self.counters, other.counters)))
+        return self
+
+
+class BloomFilter:
+    '''Remembers which values were added, with no false negatives.
+
+    Sized for ``capacity`` values at a false positive rate of ``error``:
+    about 1.2 bytes per value at 1%, so 60MB at the default.
+    '''
+
+    def __init__(self, capacity=50000000, error=0.01):
+        self.size = max(int(-capacity * math.log(error) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, value):
+        '''Adds a value, returning whether it was (probably) new.'''
+        bits = self.bits
+        new = False
+        for position in probes(value, self.hashes, self.size):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        return new
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in probes(value, self.hashes, self.size))
+
+    def merge(self, other):
+        if (other.size, other.hashes) != (self.size, self.hashes):
+            raise ValueError('Can\'t merge BloomFilters with different dimensions')
+        self.bits = bytearray((int.from_bytes(self.bits, 'little') | int.from_bytes(other.bits, 'little')).to_bytes(
+            len(self.bits), 'little'))
+        return self
+
+
+class SpaceSaving:
+    '''Tracks the (approximately) ``k`` most frequent values.
+
+    Any value seen more than ``n / k`` times out of ``n`` is guaranteed to be
+    tracked. Each count overestimates the true count by at most its ``error``.
+    '''
+
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, value, count=1):
+        if value in self.counts:
+            self.counts[value] += count
+            return
+
+        error = 0
+        if len(self.counts) >= self.k:
+            # Evict the smallest counter, and inherit its count as our error.
+            evicted = min(self.counts, key=self.counts.get)
+            error = self.counts.pop(evicted)
+            del self.errors[evicted]
+
+        self.counts[value] = error + count
+        self.errors[value] = error
+
+    def floor(self):
+        '''The most that any untracked value could have been seen.'''
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def merge(self, other):
+        own_floor, other_floor = self.floor(), other.floor()
+        counts, errors = {}, {}
+        for value in set(self.counts) | set(other.counts):
+            counts[value] = self.counts.get(value, own_floor) + other.counts.get(value, other_floor)
+            errors[value] = self.errors.get(value, own_floor) + other.errors.get(value, other_floor)
+
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.k]
+        self.counts = {value: counts[value] for value in kept}
+        self.errors = {value: errors[value] for value in kept}
+        return self
+
+    def top(self, n=None):
+        '''Returns ``(value, count, error)`` tuples, most frequent first.'''
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return [(value, count, self.errors[value]) for value, count in ranked]
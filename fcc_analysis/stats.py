@@ -0,0 +1,134 @@
+from collections import Counter
+import csv
+import json
+import multiprocessing
+
+from .analyzers import analyze_batch, ANALYZED_FIELDS
+from .cache import AnalysisCache
+from .sketches import HyperLogLog, SpaceSaving
+from .storage import ElasticsearchBackend, LocalBackend
+
+COUNTED_FIELDS = ('source', 'titleii', 'ingestion_method', 'onsite', 'capsemail')
+
+
+class CommentStats:
+    '''Summary statistics for a set of comments, built in one pass.
+
+    Keeps exact counts of the low-cardinality analysis fields, comments per
+    ``date_received`` day, a HyperLogLog of distinct fingerprints and the
+    ``top`` most common fingerprints. Memory doesn't grow with the number of
+    comments, and stats built separately can be merged.
+    '''
+
+    def __init__(self, top=100, precision=14):
+        self.total = 0
+        self.counts = {field: Counter() for field in COUNTED_FIELDS}
+        self.days = Counter()
+        self.fingerprints = HyperLogLog(precision)
+        self.top_fingerprints = SpaceSaving(top)
+
+    def add(self, comment, analysis):
+        self.total += 1
+        for field in COUNTED_FIELDS:
+            self.counts[field][json.dumps(analysis.get(field))] += 1
+        if comment.get('date_received'):
+            self.days[comment['date_received'][:10]] += 1
+        if analysis['fingerprint']:
+            self.fingerprints.add(analysis['fingerprint'])
+            self.top_fingerprints.add(analysis['fingerprint'])
+
+    def merge(self, other):
+        self.total += other.total
+        for field in COUNTED_FIELDS:
+            self.counts[field].update(other.counts[field])
+        self.days.update(other.days)
+        self.fingerprints.merge(other.fingerprints)
+        self.top_fingerprints.merge(other.top_fingerprints)
+        return self
+
+    def report(self):
+        return {
+            'total': self.total,
+            # Values are JSON-encoded, so ``null`` and ``true`` stay distinct from strings.
+            'counts': {field: dict(counter.most_common()) for field, counter in self.counts.items()},
+            'days': dict(sorted(self.days.items())),
+            'distinct_fingerprints': self.fingerprints.count(),
+            'top_fingerprints': [
+                {'fingerprint': fingerprint, 'count': count, 'error': error}
+                for fingerprint, count, error in self.top_fingerprints.top()
+            ],
+        }
+
+    def write_json(self, f):
+        json.dump(self.report(), f, indent=2)
+        f.write('\n')
+
+    def write_csv(self, f):
+        report = self.report()
+        writer = csv.writer(f)
+        writer.writerow(['metric', 'key', 'value'])
+        writer.writerow(['total', '', report['total']])
+        writer.writerow(['distinct_fingerprints', '', report['distinct_fingerprints']])
+        for field, counts in report['counts'].items():
+            for value, count in counts.items():
+                decoded = json.loads(value)
+                writer.writerow([field, decoded if isinstance(decoded, str) else value, count])
+        for day, count in report['days'].items():
+            writer.writerow(['day', day, count])
+        for item in report['top_fingerprints']:
+            writer.writerow(['fingerprint', item['fingerprint'], item['count']])
+
+
+class StatsRunner:
+    '''Streams comments from a backend through ``analyze()`` into CommentStats.
+
+    With ``slices``, one process reads and summarizes each slice, and their
+    stats are merged at the end. Nothing is written back to the backend.
+    '''
+
+    def __init__(self, endpoint='http://localhost:9200/', verify=True, store=None, compression='gzip', backend=None,
+                 slices=1, page_size=1000, batch_size=100, top=100, cache_size=100000):
+        if backend is None and store:
+            backend = LocalBackend(store, compression=compression)
+        elif backend is None:
+            backend = ElasticsearchBackend(endpoint, verify=verify)
+        self.backend = backend
+        self.slices = slices
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.top = top
+        self.cache_size = cache_size
+
+    def run(self):
+        if self.slices == 1:
+            return self.slice_stats(None)
+
+        with multiprocessing.Pool(self.slices) as pool:
+            results = pool.map(self.slice_stats, range(self.slices))
+        stats = results[0]
+        for other in results[1:]:
+            stats.merge(other)
+        return stats
+
+    def slice_stats(self, slice_id):
+        stats = CommentStats(top=self.top)
+        cache = AnalysisCache(maxsize=self.cache_size) if self.cache_size else None
+        comments = self.backend.iter_comments(
+            fields=list(ANALYZED_FIELDS) + ['date_received'],
+            slice_id=slice_id,
+            slices=self.slices,
+            size=self.page_size
+        )
+
+        batch = []
+        for comment in comments:
+            batch.append(comment)
+            if len(batch) == self.batch_size:
+                self.add_batch(stats, batch, cache)
+                batch = []
+        self.add_batch(stats, batch, cache)
+        return stats
+
+    def add_batch(self, stats, batch, cache):
+        for comment, analysis in zip(batch, analyze_batch(batch, cache=cache)):
+            stats.add(comment, analysis)
@@ -0,0 +1,367 @@
+import glob
+import gzip
+import io
+import json
+import mmap
+import os
+import uuid
+import warnings
+import zlib
+
+from tqdm import tqdm
+import requests
+
+from . import codec
+from .bulk import BulkWriter
+from .metrics import METRICS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'none': '',
+}
+
+
+class ElasticsearchBackend:
+    '''Reads and writes filings in the ``fcc-comments`` Elasticsearch index.'''
+
+    def __init__(self, endpoint='http://localhost:9200/', verify=True, bulk_concurrency=2, index='fcc-comments'):
+        self.endpoint = endpoint
+        self.verify = verify
+        self.bulk_concurrency = bulk_concurrency
+        self.index = index
+
+    @property
+    def bulk_url(self):
+        return '{}{}/filing/{}'.format(
+            self.endpoint,
+            self.index,
+            '_bulk'
+        )
+
+    def build_query(self, stale_version=None):
+        if stale_version is None:
+            return {'match_all': {}}
+
+        # Matches documents that were never analyzed, too.
+        return {
+            'bool': {
+                'must_not': {
+                    'term': {'analysis.version': stale_version}
+                }
+            }
+        }
+
+    def iter_comments(self, fields=None, stale_version=None, slice_id=None, slices=1, size=1000, timeout='5m', progress=True):
+        '''Scrolls through the index, yielding each document's ``_source``.
+
+        Only ``fields`` are fetched, if given. With ``stale_version``, documents
+        already analyzed with that version are skipped. With ``slice_id``, only
+        that slice (out of ``slices``) is read.
+        '''
+        start_url = '{}{}/filing/_search?scroll={}'.format(
+            self.endpoint, self.index, timeout
+        )
+        scroll_url = '{}_search/scroll'.format(self.endpoint)
+        headers = {'Content-Type': 'application/json'}
+
+        body = {
+            'size': size,
+            'query': self.build_query(stale_version),
+            'sort': [
+                '_doc'
+            ]
+        }
+        if fields is not None:
+            body['_source'] = list(fields)
+        if slice_id is not None:
+            body['slice'] = {'id': slice_id, 'max': slices}
+
+        with warnings.catch_warnings(), METRICS.timer('fcc_scroll_seconds'):
+            warnings.simplefilter("ignore")
+            response = requests.post(start_url, verify=self.verify, headers=headers, data=codec.dumps(body))
+        data = codec.loads(response.content)
+        scroll_id = data['_scroll_id']
+        progress = tqdm(total=data['hits']['total'], position=slice_id, disable=not progress)
+        hits = data['hits']['hits']
+
+        while hits:
+            METRICS.incr('fcc_documents_read', len(hits))
+
+            for hit in hits:
+                yield hit['_source']
+                progress.update(1)
+
+            with warnings.catch_warnings(), METRICS.timer('fcc_scroll_seconds'):
+                warnings.simplefilter("ignore")
+                response = requests.post(scroll_url, headers=headers, verify=self.verify, data=codec.dumps({
+                    'scroll': timeout,
+                    'scroll_id': scroll_id
+                }))
+
+            data = codec.loads(response.content)
+            scroll_id = data['_scroll_id']
+            hits = data['hits']['hits']
+
+        progress.close()
+
+    def document_writer(self, on_items=None):
+        writer = BulkWriter(self.bulk_url, verify=self.verify, concurrency=self.bulk_concurrency, on_items=on_items)
+        return ElasticsearchDocumentWriter(writer)
+
+    def compact_analyses(self):
+        # Documents are updated in place, so there's nothing to compact.
+        pass
+
+    def analysis_writer(self, size=250):
+        writer = BulkWriter(
+            self.bulk_url, verify=self.verify, max_docs=size, concurrency=self.bulk_concurrency,
+            on_items=check_updated
+        )
+        return ElasticsearchAnalysisWriter(writer)
+
+
+def check_updated(items):
+    for item in items:
+        if 'update' in item and item['update'].get('result') not in ('updated', 'noop'):
+            print(json.dumps(item, indent=2))
+            raise Exception('Failure!')
+
+
+def create_lines(id_submission, source):
+    '''Returns the bulk lines that create a document from its already encoded source.'''
+    return codec.dumps({"create": {"_id": id_submission}}) + b'\n' + source + b'\n'
+
+
+class ElasticsearchDocumentWriter:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def add(self, document):
+        index = {"create": {"_id": document['id_submission']}}
+        self.writer.add(index, document)
+
+    def add_encoded(self, id_submission, source):
+        '''Adds a document that's already been encoded, without decoding it again.'''
+        self.writer.add_lines(create_lines(id_submission, source))
+
+    def after_pending(self, callback):
+        self.writer.after_pending(callback)
+
+    def close(self):
+        self.writer.close()
+
+
+class ElasticsearchAnalysisWriter:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def add(self, id_submission, analysis):
+        index = {"update": {"_id": id_submission}}
+        self.writer.add(index, {'doc': {'analysis': analysis}})
+
+    def close(self):
+        self.writer.close()
+
+
+class LocalBackend:
+    '''Stores filings on disk, as sharded and compressed JSON lines.
+
+    Layout::
+
+        <path>/manifest.json
+        <path>/filings/part-00000.jsonl.gz
+        <path>/analysis/part-00000-<writer>.jsonl.gz
+
+    Filings are assigned to one of ``shards`` shards by a hash of their id, so
+    the analysis of a filing always lands in the shard with the same number.
+    Each writer appends to its own analysis files, and later files win when
+    they're read back; reading a shard only needs that shard's analyses in
+    memory. ``compact_analyses()`` merges each shard's files back into one.
+    Shards are read sequentially (memory-mapped when uncompressed), and each
+    slice of a sliced read gets whole shards.
+
+    ``compression`` is one of gzip, zstd (needs the ``zstandard`` package) or
+    none. The shard count and compression of an existing store always win.
+    '''
+
+    def __init__(self, path, shards=64, compression='gzip'):
+        self.path = path
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            shards, compression = manifest['shards'], manifest['compression']
+
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError('Unknown compression: {}'.format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression needs the zstandard package')
+
+        self.shards = shards
+        self.compression = compression
+
+        if not os.path.exists(manifest_path):
+            os.makedirs(os.path.join(path, 'filings'), exist_ok=True)
+            os.makedirs(os.path.join(path, 'analysis'), exist_ok=True)
+            with open(manifest_path, 'w') as f:
+                json.dump({'shards': shards, 'compression': compression}, f)
+
+    def shard_for(self, id_submission):
+        return zlib.crc32(id_submission.encode('utf-8')) % self.shards
+
+    def shard_path(self, kind, shard, suffix=''):
+        return os.path.join(self.path, kind, 'part-{:05d}{}.jsonl{}'.format(
+            shard, suffix, COMPRESSION_EXTENSIONS[self.compression]
+        ))
+
+    def open(self, path, mode):
+        if self.compression == 'gzip':
+            return gzip.open(path, mode)
+        if self.compression == 'zstd':
+            if 'r' in mode:
+                return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, mode), read_across_frames=True))
+            return zstandard.ZstdCompressor().stream_writer(open(path, mode))
+        return open(path, mode)
+
+    def iter_lines(self, path):
+        if not os.path.exists(path):
+            return
+
+        if self.compression != 'none':
+            with self.open(path, 'rb') as f:
+                for line in f:
+                    yield line
+            return
+
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for line in iter(mapped.readline, b''):
+                    yield line
+
+    def load_analyses(self, shard):
+        pattern = self.shard_path('analysis', shard, suffix='-*')
+        analyses = {}
+        for path in sorted(glob.glob(pattern), key=os.path.getmtime):
+            for line in self.iter_lines(path):
+                record = codec.loads(line)
+                analyses[record['id_submission']] = record['analysis']
+        return analyses
+
+    def compact_analyses(self):
+        '''Rewrites each shard's analysis files as one, with just the latest analysis of each filing.
+
+        Nothing else should be writing analyses meanwhile; ``fcc analyze`` does
+        this at the end of a run.
+        '''
+        for shard in range(self.shards):
+            paths = glob.glob(self.shard_path('analysis', shard, suffix='-*'))
+            if len(paths) < 2:
+                continue
+            # The new file is written last, so it wins over the old ones until they're gone.
+            writer = LocalAnalysisWriter(self)
+            for id_submission, analysis in self.load_analyses(shard).items():
+                writer.write(shard, {'id_submission': id_submission, 'analysis': analysis})
+            writer.close()
+            for path in paths:
+                os.remove(path)
+
+    def iter_comments(self, fields=None, stale_version=None, slice_id=None, slices=1, size=None, progress=True):
+        '''Yields filings shard by shard, with the same options as ElasticsearchBackend.
+
+        Filings that were written more than once are only yielded once.
+        '''
+        shards = [shard for shard in range(self.shards) if slice_id is None or shard % slices == slice_id]
+        progress = tqdm(position=slice_id, disable=not progress)
+
+        for shard in shards:
+            analyses = self.load_analyses(shard) if stale_version is not None else {}
+            seen = set()
+            for line in self.iter_lines(self.shard_path('filings', shard)):
+                document = codec.loads(line)
+                if document['id_submission'] in seen:
+                    continue
+                seen.add(document['id_submission'])
+
+                if stale_version is not None and analyses.get(document['id_submission'], {}).get('version') == stale_version:
+                    continue
+
+                if fields is not None:
+                    document = {key: value for key, value in document.items() if key in fields}
+                METRICS.incr('fcc_documents_read')
+                yield document
+                progress.update(1)
+
+        progress.close()
+
+    def document_writer(self, on_items=None):
+        return LocalDocumentWriter(self)
+
+    def analysis_writer(self, size=None):
+        return LocalAnalysisWriter(self)
+
+
+class LocalWriter:
+    '''Appends JSON lines to per-shard files, opening them as needed.'''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.files = {}
+
+    def path(self, shard):
+        raise NotImplementedError
+
+    def write(self, shard, record):
+        self.write_encoded(shard, codec.dumps(record))
+
+    def write_encoded(self, shard, line):
+        if shard not in self.files:
+            self.files[shard] = self.backend.open(self.path(shard), 'ab')
+        self.files[shard].write(line)
+        self.files[shard].write(b'\n')
+
+    def after_pending(self, callback):
+        for f in self.files.values():
+            f.flush()
+        callback()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class LocalDocumentWriter(LocalWriter):
+
+    def path(self, shard):
+        return self.backend.shard_path('filings', shard)
+
+    def add(self, document):
+        self.write(self.backend.shard_for(document['id_submission']), document)
+
+    def add_encoded(self, id_submission, source):
+        self.write_encoded(self.backend.shard_for(id_submission), source)
+
+
+class LocalAnalysisWriter(LocalWriter):
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        # Every writer gets its own files, so parallel writers never share a stream.
+        self.token = '{}-{}'.format(os.getpid(), uuid.uuid4().hex[:8])
+
+    def path(self, shard):
+        return self.backend.shard_path('analysis', shard, suffix='-{}'.format(self.token))
+
+    def add(self, id_submission, analysis):
+        self.write(self.backend.shard_for(id_submission), {'id_submission': id_submission, 'analysis': analysis})
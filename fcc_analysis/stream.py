@@ -0,0 +1,109 @@
+'''Analyzing any iterable of comments, without Elasticsearch or a local store.
+
+::
+
+    from fcc_analysis.stream import analyze_stream
+
+    for comment, analysis in analyze_stream(comments, workers=4):
+        ...
+
+Comments are handed to a pool of processes ``chunksize`` at a time, as
+records with just the fields the analyzers use, and only a couple of chunks
+per worker are in flight at once, so the iterable can be much bigger than
+memory. Rules changed in this process before the call (say, an extra entry
+in ``analyzers.SOURCE_RULES`` from a notebook, followed by
+``analyzers.compiled_rules.cache_clear()``) are seen by workers where
+processes are forked, which is the default on Linux.
+'''
+from . import codec
+from .analyzers import analyze_batch, FINGERPRINTS, warm
+from .cache import AnalysisCache
+from .pool import WorkerPool
+from .records import Comment, as_comment
+
+# Set in each worker process by init_worker().
+_worker_cache = None
+_worker_fingerprint = 'string'
+
+
+def init_worker(cache_size, cache_path, fingerprint):
+    global _worker_cache, _worker_fingerprint
+    _worker_cache = make_cache(cache_size, cache_path, fingerprint)
+    _worker_fingerprint = fingerprint
+    warm()
+
+
+def analyze_rows(chunk):
+    '''Analyzes a numbered chunk of ``Comment.to_row()`` rows, returning the analyses in order.'''
+    number, rows = chunk
+    comments = [Comment.from_row(row) for row in rows]
+    return analyze_batch(comments, cache=_worker_cache, fingerprint=_worker_fingerprint)
+
+
+def make_cache(cache_size, cache_path, fingerprint):
+    if not cache_size and not cache_path:
+        return None
+    return AnalysisCache(maxsize=cache_size, path=cache_path, fingerprint=fingerprint)
+
+
+def iter_chunks(comments, chunksize):
+    chunk = []
+    for comment in comments:
+        chunk.append(comment)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze_stream(comments, workers=None, chunksize=100, ordered=True, cache_size=100000, cache_path=None,
+                   fingerprint='string'):
+    '''Yields a ``(comment, analysis)`` pair for each of ``comments``.
+
+    ``comments`` may be any iterable of filing dicts or records.Comment. Pairs
+    come out in the order the comments went in or, if ``ordered`` is False, a
+    chunk at a time as they're done. ``workers`` defaults to one less than
+    the number of cores; 0 analyzes in this process, which is easiest to
+    debug. Each worker keeps the text analyses of its last ``cache_size``
+    distinct texts, and shares them with the others, and later runs, through
+    the SQLite file at ``cache_path`` if one is given. ``fingerprint`` is one
+    of analyzers.FINGERPRINTS.
+    '''
+    if fingerprint not in FINGERPRINTS:
+        raise ValueError('Unknown fingerprint: {}'.format(fingerprint))
+
+    if workers == 0:
+        cache = make_cache(cache_size, cache_path, fingerprint)
+        for chunk in iter_chunks(comments, chunksize):
+            for pair in zip(chunk, analyze_batch(chunk, cache=cache, fingerprint=fingerprint)):
+                yield pair
+        return
+
+    # The comments stay here; workers get numbered rows, and send back analyses.
+    chunks = {}
+
+    def iter_numbered(comments):
+        for number, chunk in enumerate(iter_chunks(comments, chunksize)):
+            chunks[number] = chunk
+            yield number, [as_comment(comment).to_row() for comment in chunk]
+
+    pool = WorkerPool(analyze_rows, workers=workers, initializer=init_worker,
+                      initargs=(cache_size, cache_path, fingerprint), ordered=ordered)
+    try:
+        for (number, _), analyses in pool.map_batches(iter_numbered(comments)):
+            for pair in zip(chunks.pop(number), analyses):
+                yield pair
+    finally:
+        pool.shutdown(cancel=True)
+
+
+def write_analyses(pairs, f):
+    '''Writes ``(comment, analysis)`` pairs to a binary file, as the JSON lines of a local store's analyses.'''
+    count = 0
+    for comment, analysis in pairs:
+        id_submission = comment.id_submission if isinstance(comment, Comment) else comment.get('id_submission')
+        f.write(codec.dumps({'id_submission': id_submission, 'analysis': analysis}))
+        f.write(b'\n')
+        count += 1
+    return count
@@ -0,0 +1,226 @@
+'''Local stand-ins for the ECFS API, for tests and benchmarks.'''
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+import json
+import threading
+import zlib
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeServer:
+    '''Serves a handler in a background thread, for use as a context manager.'''
+
+    def __init__(self, handler):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.fake = self
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ECFSHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        with fake.lock:
+            fake.requests.append(query)
+            failing = fake.failures > 0
+            fake.failures -= 1
+
+        if failing:
+            body = b'<html>Service Unavailable</html>'
+        else:
+            body = json.dumps(fake.page(query)).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeECFS(FakeServer):
+    '''A canned ``/filings`` endpoint, paginated by ``limit`` and ``offset``.
+
+    The first ``failures`` requests get an HTML error page instead of JSON, like
+    the real API does when it falls over.
+    '''
+
+    def __init__(self, filings, failures=0):
+        super().__init__(ECFSHandler)
+        self.filings = filings
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.requests = []
+
+    @property
+    def url(self):
+        return super().url + 'filings'
+
+    def page(self, query):
+        filings = self.filings
+        if 'date_received' in query:
+            gte, lte = query['date_received'][len('[gte]'):].split('[lte]')
+            filings = [f for f in filings if gte <= f['date_received'].rstrip('Z') <= lte]
+
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 25))
+        return {
+            'filings': filings[offset:offset + limit],
+            'aggregations': {
+                'proceedings_name': {
+                    'buckets': [{'key': '17-108', 'doc_count': len(filings)}]
+                }
+            }
+        }
+
+
+class ElasticsearchHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        path = urlparse(self.path).path
+
+        if path.endswith('/_bulk'):
+            status, response = fake.bulk(body.decode('utf-8'))
+        elif path == '/_search/scroll':
+            status, response = fake.scroll(json.loads(body.decode('utf-8')))
+        elif path.endswith('/_search'):
+            status, response = fake.search(json.loads(body.decode('utf-8')))
+        else:
+            status, response = 404, {'error': 'unknown endpoint {}'.format(path)}
+
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeElasticsearch(FakeServer):
+    '''Just enough of Elasticsearch for the indexer and analyzer.
+
+    Documents are kept in ``documents``, keyed by id. The first ``rejections``
+    bulk items are rejected with a 429, like an overloaded cluster would.
+    '''
+
+    def __init__(self, documents=None, rejections=0):
+        super().__init__(ElasticsearchHandler)
+        self.documents = documents if documents is not None else {}
+        self.rejections = rejections
+        self.lock = threading.Lock()
+        self.bulk_requests = []
+        self.searches = []
+        self.scrolls = {}
+
+    def bulk(self, body):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        with self.lock:
+            self.bulk_requests.append(list(lines))
+            while lines:
+                action = lines.pop(0)
+                op, meta = list(action.items())[0]
+                source = lines.pop(0) if op in ('create', 'index', 'update') else None
+
+                if self.rejections > 0:
+                    self.rejections -= 1
+                    items.append({op: {'_id': meta['_id'], 'status': 429}})
+                elif op == 'create' and meta['_id'] in self.documents:
+                    items.append({op: {'_id': meta['_id'], 'status': 409}})
+                elif op in ('create', 'index'):
+                    self.documents[meta['_id']] = source
+                    items.append({op: {'_id': meta['_id'], 'status': 201, 'result': 'created'}})
+                elif op == 'update' and meta['_id'] not in self.documents:
+                    items.append({op: {'_id': meta['_id'], 'status': 404, 'result': 'not_found'}})
+                elif op == 'update':
+                    self.documents[meta['_id']].update(source['doc'])
+                    items.append({op: {'_id': meta['_id'], 'status': 200, 'result': 'updated'}})
+        return 200, {'errors': False, 'items': items}
+
+    def search(self, body):
+        with self.lock:
+            self.searches.append(body)
+            hits = [
+                {'_id': key, '_source': self.filter_source(document, body.get('_source'))}
+                for key, document in sorted(self.documents.items())
+                if self.matches(document, body.get('query', {'match_all': {}}))
+                and self.in_slice(key, body.get('slice'))
+            ]
+            scroll_id = str(len(self.scrolls))
+            self.scrolls[scroll_id] = (hits, body.get('size', 10))
+        return self.scroll({'scroll_id': scroll_id})
+
+    def scroll(self, body):
+        with self.lock:
+            hits, size = self.scrolls[body['scroll_id']]
+            self.scrolls[body['scroll_id']] = (hits[size:], size)
+        return 200, {
+            '_scroll_id': body['scroll_id'],
+            'hits': {'total': len(hits), 'hits': hits[:size]}
+        }
+
+    def in_slice(self, key, slice_spec):
+        if slice_spec is None:
+            return True
+        return zlib.crc32(key.encode('utf-8')) % slice_spec['max'] == slice_spec['id']
+
+    def filter_source(self, document, fields):
+        if fields is None:
+            return document
+        return {key: value for key, value in document.items() if key in fields}
+
+    def matches(self, document, query):
+        if 'match_all' in query:
+            return True
+        if 'bool' in query:
+            must_not = query['bool'].get('must_not', [])
+            if isinstance(must_not, dict):
+                must_not = [must_not]
+            return not any(self.matches(document, clause) for clause in must_not)
+        if 'term' in query:
+            (field, value), = query['term'].items()
+            return self.get_field(document, field) == value
+        raise ValueError('Unsupported query: {}'.format(query))
+
+    def get_field(self, document, field):
+        for key in field.split('.'):
+            if not isinstance(document, dict):
+                return None
+            document = document.get(key)
+        return document
+
+
+def make_filings(count):
+    return [
+        {
+            'id_submission': str(1000 + i),
+            'text_data': 'Comment number {}'.format(i),
+            'proceedings': [{'name': '17-108'}],
+            'date_received': '2017-05-{:02d}T12:00:00.000Z'.format(i % 28 + 1),
+        }
+        for i in range(count)
+    ]
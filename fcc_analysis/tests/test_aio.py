@@ -0,0 +1,54 @@
+from unittest import TestCase
+import asyncio
+import os
+import tempfile
+
+from fcc_analysis.aio import AsyncBulkWriter, AsyncCommentIndexer, ExecutorTransport
+from fcc_analysis.checkpoint import Checkpoint
+from fcc_analysis.tests.fakes import FakeECFS, FakeElasticsearch, make_filings
+
+
+class AsyncIndexerTestCase(TestCase):
+
+    def get_indexer(self, ecfs, es, **kwargs):
+        kwargs.setdefault('limit', 10)
+        return AsyncCommentIndexer(fcc_endpoint=ecfs.url, endpoint=es.url, backoff=0.001, **kwargs)
+
+    def test_run(self):
+        filings = make_filings(95)
+        expected = sorted(filing['id_submission'] for filing in filings)
+
+        for options in ({}, {'concurrency': 4}, {'concurrency': 4, 'ordered': False}):
+            with FakeECFS(filings, failures=2) as ecfs, FakeElasticsearch() as es:
+                self.get_indexer(ecfs, es, **options).run()
+            self.assertEqual(sorted(es.documents), expected)
+
+    def test_checkpoint(self):
+        filings = make_filings(280)
+        path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        with FakeECFS(filings) as ecfs, FakeElasticsearch() as es:
+            indexer = self.get_indexer(
+                ecfs, es, concurrency=3, checkpoint=path, gte='2017-05-01', lte='2017-06-01', max_window=25
+            )
+            indexer.run()
+
+        self.assertEqual(sorted(es.documents), sorted(f['id_submission'] for f in filings))
+        self.assertEqual(list(Checkpoint.load(path).pending()), [])
+
+    def test_bulk_retries(self):
+        async def write(url):
+            transport = ExecutorTransport(concurrency=2)
+            writer = AsyncBulkWriter(transport, url, max_docs=10, backoff=0.001)
+            marks = []
+            for i in range(45):
+                await writer.add({'index': {'_id': str(i)}}, {'id_submission': str(i)})
+                if i % 10 == 0:
+                    writer.after_pending(lambda i=i: marks.append(i))
+            await writer.close()
+            await transport.close()
+            return marks
+
+        with FakeElasticsearch(rejections=3) as es:
+            marks = asyncio.run(write('{}fcc-comments/filing/_bulk'.format(es.url)))
+        self.assertEqual(len(es.documents), 45)
+        self.assertEqual(sorted(marks), [0, 10, 20, 30, 40])
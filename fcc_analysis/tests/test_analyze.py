@@ -0,0 +1,126 @@
+from unittest import TestCase
+import copy
+import json
+import os
+import tempfile
+
+from fcc_analysis.analyze import CommentAnalyzer
+from fcc_analysis.analyzers import analyze, ANALYZER_VERSION
+from fcc_analysis.tests.fakes import FakeElasticsearch, make_filings
+
+
+class FailingAnalyzer(CommentAnalyzer):
+
+    def tag_batch(self, batch):
+        raise ValueError('Bad batch')
+
+
+class CommentAnalyzerTestCase(TestCase):
+
+    def get_documents(self):
+        return {filing['id_submission']: filing for filing in make_filings(120)}
+
+    def assertAnalyzed(self, server, expected, neardup=False, fingerprint='string'):
+        self.assertEqual(sorted(server.documents), sorted(expected))
+        for key, document in server.documents.items():
+            analysis = dict(document['analysis'])
+            if neardup:
+                self.assertIn(analysis.pop('cluster'), expected)
+            self.assertEqual(analysis, analyze(expected[key], fingerprint=fingerprint))
+
+    def test_run(self):
+        expected = self.get_documents()
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, page_size=25).run()
+        self.assertAnalyzed(server, expected)
+
+    def test_run_workers(self):
+        expected = self.get_documents()
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, page_size=25, workers=2, autoscale=True).run()
+        self.assertAnalyzed(server, expected)
+
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, workers=2, shared_memory=False, neardup=True).run()
+        self.assertAnalyzed(server, expected, neardup=True)
+
+    def test_run_simhash(self):
+        expected = self.get_documents()
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, workers=2, fingerprint='simhash', neardup=True).run()
+        self.assertAnalyzed(server, expected, neardup=True, fingerprint='simhash')
+        for document in server.documents.values():
+            self.assertNotIn('fingerprint', document['analysis'])
+
+    def test_run_metrics(self):
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.jsonl')
+        with FakeElasticsearch(self.get_documents()) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, workers=2, metrics=path).run()
+
+        with open(path) as f:
+            snapshots = [json.loads(line) for line in f]
+        counters = {}
+        for snapshot in snapshots:
+            for key, value in snapshot['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+        self.assertEqual(set(snapshot['role'] for snapshot in snapshots), {'analyze', 'tagger', 'writer'})
+        self.assertEqual(counters['fcc_documents_read'], 120)
+        self.assertEqual(counters['fcc_comments_analyzed'], 120)
+        self.assertEqual(counters['fcc_bulk_items'], 120)
+
+    def test_run_errors(self):
+        with FakeElasticsearch(self.get_documents()) as server:
+            with self.assertRaises(ValueError):
+                FailingAnalyzer(endpoint=server.url, batch_size=7, workers=2).run()
+
+    def test_run_sliced(self):
+        expected = self.get_documents()
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, slices=3, page_size=25).run()
+        self.assertAnalyzed(server, expected)
+
+        self.assertEqual(sorted(search['slice']['id'] for search in server.searches), [0, 1, 2])
+        for search in server.searches:
+            self.assertEqual(search['size'], 25)
+            self.assertIn('text_data', search['_source'])
+            self.assertNotIn('date_received', search['_source'])
+
+    def test_run_incremental(self):
+        expected = self.get_documents()
+        documents = copy.deepcopy(expected)
+        for i, document in enumerate(documents.values()):
+            if i % 3 == 0:
+                document['analysis'] = analyze(document)
+            elif i % 3 == 1:
+                document['analysis'] = {'version': 'stale'}
+
+        with FakeElasticsearch(documents) as server:
+            CommentAnalyzer(endpoint=server.url, incremental=True).run()
+        self.assertAnalyzed(server, expected)
+
+        updated = set(line['update']['_id'] for lines in server.bulk_requests for line in lines if 'update' in line)
+        self.assertEqual(len(updated), 80)
+        self.assertEqual(server.searches[0]['query']['bool']['must_not']['term']['analysis.version'], ANALYZER_VERSION)
+
+    def test_incremental_fingerprint_mode(self):
+        expected = self.get_documents()
+        documents = copy.deepcopy(expected)
+        for document in documents.values():
+            document['analysis'] = analyze(document)
+
+        # Comments analyzed with another fingerprint mode are stale, both ways.
+        with FakeElasticsearch(documents) as server:
+            CommentAnalyzer(endpoint=server.url, incremental=True, fingerprint='simhash').run()
+            self.assertAnalyzed(server, expected, fingerprint='simhash')
+            CommentAnalyzer(endpoint=server.url, incremental=True, fingerprint='simhash').run()
+            self.assertEqual(len(server.bulk_requests), 1)
+            CommentAnalyzer(endpoint=server.url, incremental=True).run()
+        self.assertAnalyzed(server, expected)
+
+    def test_neardup_needs_single_reader(self):
+        with self.assertRaises(ValueError):
+            CommentAnalyzer(slices=2, neardup=True)
+
+    def test_unknown_fingerprint(self):
+        with self.assertRaises(ValueError):
+            CommentAnalyzer(fingerprint='md5')
@@ -1,10 +1,15 @@
 import os
 import json
-from unittest import TestCase
+import subprocess
+import sys
+from unittest import TestCase, mock
 
+from fcc_analysis import analyzers
 from fcc_analysis.analyzers import (
-    source, fulladdress, capsemail, fingerprint, titleii, proceeding_keys
+    source, fulladdress, capsemail, fingerprint, titleii, proceeding_keys,
+    analyze, analyze_batch, compiled_rules
 )
+from fcc_analysis.matching import PREFIX
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
@@ -109,3 +114,47 @@ class AnalyzerTestCase(TestCase):
             proceeding_keys({'proceedings': [{'bar': 'qux', 'foo': 'hello', 'qux': 'test'}]})
         )
         self.assertIsInstance(proceeding_keys({'proceedings': [{'bar': 'qux', 'foo': 'hello', 'qux': 'test'}]}), str)
+
+    def test_analyze_batch(self):
+        comments = [
+            self.get_comment('unprecedented-bot'),
+            {'text_data': 'Keep title 2', 'proceedings': [{'name': '17-108'}]},
+            {'proceedings': [{'name': '17-108', '_index': 'foo'}], 'browser': 'OpenCSV'},
+            self.get_comment('unprecedented-bot'),
+        ]
+        expected = [analyze(comment) for comment in comments]
+        self.assertEqual(analyze_batch(comments), expected)
+
+        columns = {
+            'text_data': [comment.get('text_data') for comment in comments],
+            'proceedings': [comment.get('proceedings') for comment in comments],
+            'contact_email': [comment.get('contact_email') for comment in comments],
+            'addressentity': [comment.get('addressentity') for comment in comments],
+            'browser': [comment.get('browser') for comment in comments],
+        }
+        self.assertEqual(analyze_batch(columns), expected)
+
+    def test_compiled_rules(self):
+        self.assertIs(compiled_rules(), compiled_rules())
+
+        comment = {'text_data': 'Zebras for net neutrality!'}
+        rules = [(PREFIX, 'Zebras for', 'form.zebras')] + analyzers.SOURCE_RULES
+        try:
+            with mock.patch.object(analyzers, 'SOURCE_RULES', rules):
+                compiled_rules.cache_clear()
+                self.assertEqual(source(comment), 'form.zebras')
+        finally:
+            compiled_rules.cache_clear()
+        self.assertEqual(source(comment), 'unknown')
+
+    def test_lazy_imports(self):
+        # Nothing is compiled, and no command's dependencies are imported, until they're needed.
+        code = (
+            'import sys\n'
+            'from fcc_analysis import analyzers, bin\n'
+            'print(analyzers.compiled_rules.cache_info().currsize, '
+            'sorted(m for m in ("requests", "tqdm", "asyncio", "multiprocessing") if m in sys.modules))'
+        )
+        root = os.path.join(os.path.dirname(__file__), '..', '..')
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.decode().strip(), '0 []')
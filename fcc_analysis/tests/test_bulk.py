@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from fcc_analysis.bulk import BulkWriter
+from fcc_analysis.tests.fakes import FakeElasticsearch
+
+
+class BulkWriterTestCase(TestCase):
+
+    def get_writer(self, server, **kwargs):
+        return BulkWriter(server.url + 'fcc-comments/filing/_bulk', backoff=0.001, **kwargs)
+
+    def test_flush_policy(self):
+        with FakeElasticsearch() as server:
+            writer = self.get_writer(server, max_docs=10, concurrency=3)
+            for i in range(95):
+                writer.add({'create': {'_id': str(i)}}, {'id_submission': str(i)})
+            writer.close()
+
+        self.assertEqual(len(server.documents), 95)
+        self.assertEqual(len(server.bulk_requests), 10)
+
+        with FakeElasticsearch() as server:
+            writer = self.get_writer(server, max_bytes=250)
+            for i in range(10):
+                writer.add({'create': {'_id': str(i)}}, {'text_data': 'x' * 100})
+            writer.close()
+
+        self.assertEqual(len(server.bulk_requests), 5)
+
+    def test_retries_rejected_items(self):
+        items = []
+        with FakeElasticsearch(rejections=3) as server:
+            writer = self.get_writer(server, max_docs=5, on_items=items.extend)
+            for i in range(5):
+                writer.add({'create': {'_id': str(i)}}, {'id_submission': str(i)})
+            writer.close()
+
+        self.assertEqual(len(server.documents), 5)
+        self.assertEqual([len(lines) // 2 for lines in server.bulk_requests], [5, 3])
+        self.assertEqual(sorted(item['create']['_id'] for item in items), ['0', '1', '2', '3', '4'])
+
+    def test_errors_propagate(self):
+        def check(items):
+            raise ValueError('Failure!')
+
+        with FakeElasticsearch() as server:
+            writer = self.get_writer(server, on_items=check)
+            writer.add({'update': {'_id': 'missing'}}, {'doc': {}})
+            with self.assertRaises(ValueError):
+                writer.close()
+
+    def test_after_pending(self):
+        committed = []
+        with FakeElasticsearch() as server:
+            writer = self.get_writer(server, max_docs=2, concurrency=4)
+            for i in range(9):
+                writer.add({'create': {'_id': str(i)}}, {'id_submission': str(i)})
+                writer.after_pending(lambda i=i: committed.append((i, len(server.documents))))
+            writer.close()
+
+        self.assertEqual([i for i, _ in committed], list(range(9)))
+        for i, written in committed:
+            self.assertGreaterEqual(written, i + 1)
@@ -0,0 +1,49 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from fcc_analysis.analyzers import analyze, analyze_batch, text_analysis
+from fcc_analysis.cache import AnalysisCache, LRUCache, text_key
+
+TEXTS = [
+    'I support strong net neutrality backed by title 2 oversight of isps',
+    'Net Neutrality is not negotiable. Keep it.',
+    'Please roll back the Title II regulations',
+    'I support strong net neutrality backed by title 2 oversight of isps',
+]
+
+
+class AnalysisCacheTestCase(TestCase):
+
+    def test_lru(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_text_key(self):
+        self.assertEqual(text_key(TEXTS[0]), text_key(TEXTS[3]))
+        self.assertNotEqual(text_key(TEXTS[0]), text_key(TEXTS[1]))
+
+    def test_memory(self):
+        cache = AnalysisCache(maxsize=10)
+        comments = [{'text_data': text, 'proceedings': []} for text in TEXTS] + [{'proceedings': []}]
+        expected = [analyze(comment) for comment in comments]
+
+        self.assertEqual(analyze_batch(comments, cache=cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+        self.assertEqual(analyze_batch(comments, cache=cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        self.assertEqual(cache.hit_rate, 0.5)
+
+    def test_disk(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+        AnalysisCache(path=path).analyze_texts(TEXTS[:2])
+
+        cache = AnalysisCache(path=path)
+        results = cache.analyze_texts(TEXTS)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(results, {text: text_analysis(text) for text in TEXTS})
@@ -0,0 +1,18 @@
+from unittest import TestCase
+
+from fcc_analysis import codec
+
+
+class CodecTestCase(TestCase):
+
+    def test_round_trip(self):
+        value = {'text_data': 'Net neutrality — «now»', 'proceedings': [{'name': '17-108'}], 'onsite': False, 'cluster': None}
+        encoded = codec.dumps(value)
+        self.assertIsInstance(encoded, bytes)
+        self.assertNotIn(b'\n', encoded)
+        self.assertEqual(codec.loads(encoded), value)
+        self.assertEqual(codec.loads(encoded.decode('utf-8')), value)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            codec.loads(b'<html>Service Unavailable</html>')
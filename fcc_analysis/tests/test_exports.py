@@ -0,0 +1,107 @@
+from unittest import TestCase
+import bz2
+import copy
+import gzip
+import json
+import os
+import tempfile
+
+from fcc_analysis.exports import ExportIndexer, iter_range, plan_ranges
+from fcc_analysis.storage import LocalBackend
+from fcc_analysis.tests.fakes import FakeElasticsearch, make_filings
+
+
+def make_export_filings(count):
+    filings = make_filings(count)
+    for filing in filings:
+        # Things that look like the start of a filing, inside a filing.
+        filing['filers'] = [{'name': 'Someone'}, {'name': 'Else, {"id_submission": "nope"}'}]
+        filing['text_data'] += ' ], [{"text_data": "quoted"}, ünïcödé'
+    return filings
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filings = make_export_filings(200)
+        self.expected = sorted(filing['id_submission'] for filing in self.filings)
+
+    def write(self, name, content, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        return path
+
+    def array(self, **kwargs):
+        return json.dumps(self.filings, ensure_ascii=False, **kwargs)
+
+    def lines(self):
+        return ''.join(json.dumps(filing) + '\n' for filing in self.filings)
+
+    def read_all(self, paths, readers):
+        ids = []
+        ranges = plan_ranges(paths, readers)
+        for path, start, end, array in ranges:
+            ids.extend(filing['id_submission'] for filing in iter_range(path, start, end, array))
+        return sorted(ids), ranges
+
+    def test_sharded(self):
+        for name, content in [
+            ('export.json', self.array()),
+            ('pretty.json', self.array(indent=2)),
+            ('export.jsonl', self.lines()),
+        ]:
+            path = self.write(name, content)
+            for readers in (1, 3, 7):
+                ids, ranges = self.read_all([path], readers)
+                self.assertEqual(ids, self.expected, msg='{} with {} readers'.format(name, readers))
+                self.assertEqual(len(ranges), readers)
+
+    def test_compressed(self):
+        paths = [
+            self.write('export.json.gz', self.array(), opener=gzip.open),
+            self.write('export.jsonl.bz2', self.lines(), opener=bz2.open),
+        ]
+        for path in paths:
+            ids, ranges = self.read_all([path], 4)
+            self.assertEqual(ids, self.expected)
+            self.assertEqual(ranges, [(path, 0, None, path.endswith('.json.gz'))])
+
+    def test_empty(self):
+        self.assertEqual(self.read_all([self.write('empty.json', '[]')], 4)[0], [])
+        self.assertEqual(self.read_all([self.write('empty.jsonl', '')], 4)[0], [])
+
+    def test_run(self):
+        paths = [
+            self.write('export.json', self.array()),
+            self.write('export.jsonl.gz', self.lines(), opener=gzip.open),
+        ]
+        with FakeElasticsearch() as server:
+            ExportIndexer(paths, readers=3, endpoint=server.url, limit=30).run()
+        self.assertEqual(sorted(server.documents), self.expected)
+        expected = {filing['id_submission']: filing for filing in copy.deepcopy(self.filings)}
+        for key, document in server.documents.items():
+            self.assertEqual(document, expected[key])
+
+    def test_bulk_index_fails(self):
+        # Big enough filings to fill the pipe, so readers block putting pages.
+        for filing in self.filings:
+            filing['text_data'] = 'x' * 100000
+        path = self.write('export.jsonl', self.lines())
+        # Nothing listens on the discard port, so the bulk indexer dies with the queue full.
+        indexer = ExportIndexer([path], readers=2, endpoint='http://127.0.0.1:9/', limit=5, queue_size=10)
+        with self.assertRaisesRegex(Exception, 'Bulk indexing failed'):
+            indexer.run()
+
+    def test_dates(self):
+        path = self.write('export.jsonl', self.lines())
+        store = os.path.join(self.directory, 'store')
+        ExportIndexer([path], readers=2, store=store, gte='2017-05-10', lte='2017-05-20').run()
+        dates = [filing['date_received'][:10] for filing in LocalBackend(store).iter_comments(progress=False)]
+        self.assertTrue(dates)
+        self.assertTrue(all('2017-05-10' <= date < '2017-05-21' for date in dates))
+
+    def test_no_checkpoints(self):
+        with self.assertRaises(ValueError):
+            ExportIndexer(['export.json'], checkpoint='checkpoint.json')
@@ -0,0 +1,145 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from fcc_analysis.checkpoint import Checkpoint, CheckpointMark, split_window
+from fcc_analysis.index import CommentIndexer
+from fcc_analysis.ratelimit import RateLimiter
+from fcc_analysis.tests.fakes import FakeECFS, FakeElasticsearch, make_filings
+
+
+class IndexerTestCase(TestCase):
+
+    def get_indexer(self, server, **kwargs):
+        kwargs.setdefault('limit', 10)
+        return CommentIndexer(fcc_endpoint=server.url, backoff=0.001, **kwargs)
+
+    def test_get_total(self):
+        with FakeECFS(make_filings(42)) as server:
+            self.assertEqual(self.get_indexer(server).get_total(), 42)
+
+    def test_iter_comments(self):
+        filings = make_filings(95)
+        expected = [filing['id_submission'] for filing in filings]
+
+        with FakeECFS(filings) as server:
+            indexer = self.get_indexer(server)
+            self.assertEqual([c['id_submission'] for c in indexer.iter_comments()], expected)
+            self.assertEqual(len(server.requests), 10)
+
+        with FakeECFS(filings) as server:
+            indexer = self.get_indexer(server, concurrency=4)
+            self.assertEqual([c['id_submission'] for c in indexer.iter_comments()], expected)
+
+        with FakeECFS(filings) as server:
+            indexer = self.get_indexer(server, concurrency=4, ordered=False)
+            self.assertEqual(sorted(c['id_submission'] for c in indexer.iter_comments()), expected)
+
+    def test_exact_multiple_of_limit(self):
+        with FakeECFS(make_filings(40)) as server:
+            indexer = self.get_indexer(server, concurrency=3)
+            self.assertEqual(len(list(indexer.iter_comments())), 40)
+
+    def test_retries(self):
+        with FakeECFS(make_filings(25), failures=3) as server:
+            indexer = self.get_indexer(server, concurrency=2)
+            self.assertEqual(len(list(indexer.iter_comments())), 25)
+
+        with FakeECFS(make_filings(25), failures=7) as server:
+            with self.assertRaises(Exception):
+                list(self.get_indexer(server).iter_comments())
+
+    def test_bulk_index_fails(self):
+        # Nothing listens on the discard port, so the bulk indexer dies with the queue full.
+        with FakeECFS(make_filings(500)) as server:
+            indexer = self.get_indexer(server, endpoint='http://127.0.0.1:9/', queue_size=20)
+            with self.assertRaisesRegex(Exception, 'Bulk indexing failed'):
+                indexer.run()
+
+
+class CheckpointTestCase(TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+    def get_indexer(self, server, **kwargs):
+        return CommentIndexer(
+            fcc_endpoint=server.url, backoff=0.001, limit=10, checkpoint=self.path,
+            gte='2017-05-01', lte='2017-06-01', max_window=25, **kwargs
+        )
+
+    def test_split_window(self):
+        self.assertEqual(
+            split_window('2017-05-01', '2017-05-03'),
+            (('2017-05-01', '2017-05-02T00:00:00'), ('2017-05-02T00:00:00', '2017-05-03'))
+        )
+        self.assertIsNone(split_window('2017-05-01T00:00:00', '2017-05-01T00:01:00.000Z'))
+
+    def test_plan_windows(self):
+        filings = make_filings(280)
+        with FakeECFS(filings) as server:
+            indexer = self.get_indexer(server)
+            windows = indexer.plan_windows()
+
+        self.assertTrue(all(0 < window['total'] <= 25 for window in windows))
+        self.assertEqual(windows[0]['lte'], '2017-06-01')
+        self.assertEqual(windows[-1]['gte'], '2017-05-01')
+        self.assertGreaterEqual(sum(window['total'] for window in windows), len(filings))
+
+    def test_resume(self):
+        filings = make_filings(280)
+        expected = set(filing['id_submission'] for filing in filings)
+
+        with FakeECFS(filings) as server:
+            indexer = self.get_indexer(server)
+            indexer.checkpoint = indexer.load_checkpoint()
+
+            # Pretend the first two windows made it into the index, and then we crashed.
+            seen = set()
+            for filings_page, mark in indexer.iter_marked_pages():
+                seen.update(filing['id_submission'] for filing in filings_page)
+                indexer.commit_marks([mark])
+                if mark.window == 1 and mark.done:
+                    break
+            first, second = indexer.checkpoint.windows[:2]
+            self.assertTrue(first['done'] and second['done'])
+            self.assertGreaterEqual(second['offset'], second['total'])
+
+            indexer = self.get_indexer(server, resume=True)
+            indexer.checkpoint = indexer.load_checkpoint()
+            self.assertEqual(len(indexer.checkpoint.windows), len(list(indexer.checkpoint.pending())) + 2)
+            server.requests = []
+            for filings_page, mark in indexer.iter_marked_pages():
+                seen.update(filing['id_submission'] for filing in filings_page)
+
+            self.assertEqual(seen, expected)
+            offsets = [request['offset'] for request in server.requests]
+            self.assertTrue(all(int(offset) < 25 for offset in offsets))
+
+    def test_run(self):
+        filings = make_filings(280)
+        with FakeECFS(filings) as ecfs, FakeElasticsearch() as es:
+            indexer = self.get_indexer(ecfs, endpoint=es.url, concurrency=2)
+            indexer.run()
+
+        self.assertEqual(sorted(es.documents), sorted(f['id_submission'] for f in filings))
+        self.assertEqual(list(Checkpoint.load(self.path).pending()), [])
+
+    def test_commit(self):
+        checkpoint = Checkpoint(self.path, [{'gte': 'a', 'lte': 'b', 'total': 30, 'offset': 0, 'done': False}])
+        checkpoint.commit(CheckpointMark(0, 20, False))
+        checkpoint.commit(CheckpointMark(0, 10, False))
+        checkpoint.save()
+        self.assertEqual(Checkpoint.load(self.path).windows[0]['offset'], 20)
+        self.assertEqual(checkpoint.remaining, 10)
+
+
+class RateLimiterTestCase(TestCase):
+
+    def test_reserve(self):
+        limiter = RateLimiter(rate=10, burst=2)
+        self.assertEqual(limiter.reserve('http://a/'), 0)
+        self.assertEqual(limiter.reserve('http://a/'), 0)
+        self.assertAlmostEqual(limiter.reserve('http://a/'), 0.1, places=2)
+        self.assertEqual(limiter.reserve('http://b/'), 0)
+        self.assertEqual(RateLimiter().reserve('http://a/'), 0)
@@ -0,0 +1,150 @@
+from unittest import TestCase
+from unittest import mock
+import contextlib
+import copy
+import io
+import os
+import tempfile
+
+from fcc_analysis import bin
+from fcc_analysis.analyze import CommentAnalyzer
+from fcc_analysis.analyzers import analyze
+from fcc_analysis.lookup import comment_keys, LookupBuilder, LookupIndex, normalize
+from fcc_analysis.neardup import hamming
+from fcc_analysis.records import Comment
+from fcc_analysis.tests.fakes import FakeElasticsearch, make_filings
+
+
+def make_lookup_filings(count):
+    filings = make_filings(count)
+    for i, filing in enumerate(filings):
+        filing['text_data'] = 'A comment about {}'.format(['cats', 'dogs', 'fish', 'birds', 'frogs'][i % 5])
+        filing['contact_email'] = ' Person{}@Example.com'.format(i % 7)
+        filing['addressentity'] = {
+            'address_line_1': '{}  Main St'.format(i % 3),
+            'city': 'Springfield',
+            'state': 'IL',
+            'zip_code': '62701',
+        }
+    return filings
+
+
+class LookupTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'lookup')
+        self.filings = make_lookup_filings(100)
+
+    def build(self, filings, fingerprint='string', **kwargs):
+        builder = LookupBuilder(self.directory, **kwargs)
+        for filing in filings:
+            comment = Comment.from_filing(filing)
+            builder.add(comment.id_submission, comment_keys(comment, analyze(comment, fingerprint=fingerprint)))
+        builder.close()
+        return LookupIndex(self.directory)
+
+    def expected_ids(self, filings, email):
+        return [filing['id_submission'] for filing in filings if filing['contact_email'].strip().lower() == email]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('email', ' A@B.com\n'), 'a@b.com')
+        self.assertEqual(normalize('address', ('1  Main\tSt', 'Town', 'ST', '00001')), '1 main st | town | st | 00001')
+        self.assertEqual(normalize('address', '1 MAIN st | town | st | 00001'), '1 main st | town | st | 00001')
+        self.assertIsNone(normalize('address', ('1 Main St', None, 'ST', '00001')))
+        self.assertIsNone(normalize('email', '  '))
+        self.assertEqual(normalize('fingerprint', 12345), '12345')
+
+    def test_queries(self):
+        # A small buffer, so the build merges several runs.
+        with self.build(self.filings, buffer_size=37) as index:
+            self.assertEqual(index.ids('email', 'person3@example.com'),
+                             self.expected_ids(self.filings, 'person3@example.com'))
+            self.assertEqual(index.count('email', 'PERSON3@example.com '), 14)
+            self.assertEqual(index.count('address', ('0 Main St', 'Springfield', 'IL', '62701')), 34)
+            self.assertEqual(index.count('fingerprint', analyze(self.filings[2])['fingerprint']), 20)
+            self.assertEqual(index.count('source', 'no such source'), 0)
+            self.assertEqual(index.ids('email', 'nobody@example.com'), [])
+
+            self.assertEqual(sorted(count for _, count in index.groups('address')), [33, 33, 34])
+            self.assertEqual(len(list(index.groups('email', min_count=15))), 2)
+            self.assertEqual(index.manifest['entries']['email'], 100)
+
+            with self.assertRaises(ValueError):
+                index.count('name', 'Someone')
+
+    def test_incremental(self):
+        self.build(self.filings[:60]).close()
+
+        # Re-analyzed comments replace their old entries. A small buffer, so
+        # both the new entries and the existing ones are sorted in several runs.
+        changed = copy.deepcopy(self.filings[50:])
+        for filing in changed:
+            filing['contact_email'] = 'changed@example.com'
+        with self.build(changed, incremental=True, buffer_size=23) as index:
+            self.assertEqual(index.count('email', 'changed@example.com'), 50)
+            self.assertEqual(index.ids('email', 'person3@example.com'),
+                             self.expected_ids(self.filings[:50], 'person3@example.com'))
+            self.assertEqual(index.manifest['entries']['email'], 100)
+
+        with self.build(self.filings[:10]) as index:
+            self.assertEqual(index.manifest['entries']['email'], 10)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('.')], [])
+
+    def test_near(self):
+        signers = ['Chris', 'Amanda', 'Pat', 'Sam', 'Lee']
+        for i, filing in enumerate(self.filings):
+            filing['text_data'] = (
+                'I urge you to protect net neutrality. Cable and phone companies should not control what we see '
+                'online. Thanks, {}'.format(signers[i % 5]) if i % 2 else 'Title II was a mistake {}'.format(i % 3)
+            )
+        simhashes = {
+            filing['id_submission']: analyze(filing, fingerprint='simhash')['simhash'] for filing in self.filings
+        }
+        query = simhashes['1001']
+
+        with self.build(self.filings, fingerprint='both', buffer_size=37) as index:
+            found = []
+            for distance in (0, 3, 6):
+                expected = {}
+                for key, simhash in sorted(simhashes.items()):
+                    if hamming(query, simhash) <= distance:
+                        expected.setdefault(simhash, []).append(key)
+                near = index.near(query, distance)
+                self.assertEqual(near, sorted(expected.items(), key=lambda item: (hamming(query, item[0]), item[0])))
+                found.append(len(near))
+            self.assertLess(found[0], found[-1])
+            with self.assertRaises(ValueError):
+                index.near(query, 7)
+
+        output = io.StringIO()
+        with mock.patch('sys.argv', ['fcc', 'lookup', self.directory, 'simhash', str(query), '--distance', '0',
+                                     '--count']):
+            with contextlib.redirect_stdout(output):
+                bin.main()
+        self.assertEqual(output.getvalue(), '{}\n'.format(list(simhashes.values()).count(query)))
+
+    def test_empty(self):
+        with self.build([]) as index:
+            self.assertEqual(index.ids('email', 'person3@example.com'), [])
+            self.assertEqual(list(index.groups('fingerprint')), [])
+
+    def test_run(self):
+        expected = {filing['id_submission']: filing for filing in self.filings}
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, workers=2, lookup=self.directory).run()
+
+        with LookupIndex(self.directory) as index:
+            self.assertEqual(index.ids('email', 'person3@example.com'),
+                             self.expected_ids(self.filings, 'person3@example.com'))
+            source = server.documents['1000']['analysis']['source']
+            self.assertEqual(index.count('source', source), 100)
+
+        output = io.StringIO()
+        with mock.patch('sys.argv', ['fcc', 'lookup', self.directory, 'address', '--min-count', '34']):
+            with contextlib.redirect_stdout(output):
+                bin.main()
+        self.assertEqual(output.getvalue(), '34\t0 main st | springfield | il | 62701\n')
+
+    def test_needs_single_writer(self):
+        with self.assertRaises(ValueError):
+            CommentAnalyzer(slices=2, lookup=self.directory)
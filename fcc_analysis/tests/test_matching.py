@@ -0,0 +1,115 @@
+from unittest import TestCase, mock
+import re
+
+from fcc_analysis import matching
+from fcc_analysis.analyzers import (
+    SOURCE_RULES, PRO_TITLE_II_PATTERNS, ANTI_TITLE_II_PATTERNS, compile_patterns, compiled_rules
+)
+from fcc_analysis.matching import SourceMatcher, PatternSet, fold, PREFIX, CONTAINS, ICONTAINS
+
+
+def match_sequentially(rules, text):
+    for kind, needle, label in rules:
+        if kind == PREFIX and text.startswith(needle):
+            return label
+        if kind == CONTAINS and needle in text:
+            return label
+        if kind == ICONTAINS and needle.lower() in text.lower():
+            return label
+
+
+class SourceMatcherTestCase(TestCase):
+
+    def test_first_match_wins(self):
+        matcher = SourceMatcher([
+            (CONTAINS, 'title ii', 'contains'),
+            (PREFIX, 'Keep title', 'prefix'),
+            (ICONTAINS, 'KEEP', 'icontains'),
+        ])
+        self.assertEqual(matcher.match('Keep title ii'), 'contains')
+        self.assertEqual(matcher.match('Keep title 2'), 'prefix')
+        self.assertEqual(matcher.match('please keep it'), 'icontains')
+        self.assertIsNone(matcher.match('repeal it'))
+
+    def test_shared_lead(self):
+        matcher = SourceMatcher([
+            (PREFIX, 'Obama’s Title II', 'curly'),
+            (PREFIX, 'Obama\'s Federal', 'straight'),
+            (PREFIX, 'Obama', 'short'),
+        ])
+        self.assertEqual(matcher.match('Obama’s Title II order'), 'curly')
+        self.assertEqual(matcher.match('Obama\'s Federal Communications'), 'straight')
+        self.assertEqual(matcher.match('Obama\'s Title II order'), 'short')
+        self.assertIsNone(matcher.match('Obam'))
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            SourceMatcher([('suffix', 'foo', 'bar')])
+
+    def test_source_rules_precedence(self):
+        matcher = SourceMatcher(SOURCE_RULES)
+        texts = [needle for _, needle, _ in SOURCE_RULES]
+        # Combine templates so that several rules match the same text.
+        texts += [a + ' ' + b for a in texts for b in texts]
+        texts += [text.upper() for text in texts[:len(SOURCE_RULES)]]
+        for text in texts:
+            self.assertEqual(matcher.match(text), match_sequentially(SOURCE_RULES, text))
+
+
+def search_sequentially(families, text):
+    for name, patterns in families:
+        for pattern in patterns:
+            if pattern.search(text):
+                return name
+
+
+class PatternSetTestCase(TestCase):
+
+    families = [
+        ('pro', [re.compile('keep (net )?neutrality', flags=re.IGNORECASE)]),
+        ('anti', [re.compile('roll ?back', flags=re.IGNORECASE), re.compile('Title II', flags=re.IGNORECASE)]),
+    ]
+
+    texts = [
+        'Please roll back Title II and keep neutrality',
+        'KEEP NET NEUTRALITY',
+        'Rollback!',
+        'Nothing to see here',
+        'Please ROLL BACK the rules, İ think',
+        'keep neutrality, ſay no to rollback',
+        '',
+    ]
+
+    def test_precedence(self):
+        patterns = PatternSet(self.families)
+        for text in self.texts:
+            self.assertEqual(patterns.search(text), search_sequentially(self.families, text), msg=text)
+            self.assertEqual(patterns.search(text, lowered=text.lower()), search_sequentially(self.families, text))
+
+    def test_title_ii(self):
+        families = [(True, compile_patterns(PRO_TITLE_II_PATTERNS)), (False, compile_patterns(ANTI_TITLE_II_PATTERNS))]
+        texts = [
+            'Please roll back the Title II regulations, and keep net neutrality',
+            'Rollback Obamas internet takeover.',
+            'I SUPPORT TITLE II',
+        ] + self.texts
+        for text in texts:
+            self.assertEqual(compiled_rules().titleii.search(text), search_sequentially(families, text), msg=text)
+
+    def test_fold(self):
+        self.assertEqual(fold(re.compile('I Support', flags=re.IGNORECASE)).pattern, 'i support')
+        self.assertIsNone(fold(re.compile('I Support')))
+        self.assertIsNone(fold(re.compile(r'\S+ support', flags=re.IGNORECASE)))
+        self.assertIsNone(fold(re.compile('(?P<Name>support)', flags=re.IGNORECASE)))
+
+    def test_combined(self):
+        # Stand in for re2 with re, which can merge case-sensitive patterns just fine.
+        families = [
+            ('pro', [re.compile('keep (net )?neutrality')]),
+            ('anti', [re.compile('roll ?back'), re.compile('title ii')]),
+        ]
+        with mock.patch.object(matching, 're2', re):
+            patterns = PatternSet(families)
+        self.assertIsNotNone(patterns.combined)
+        for text in [text.lower() for text in self.texts]:
+            self.assertEqual(patterns.search(text), search_sequentially(families, text), msg=text)
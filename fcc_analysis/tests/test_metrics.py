@@ -0,0 +1,64 @@
+from unittest import TestCase
+import json
+import os
+import tempfile
+
+from fcc_analysis.metrics import Histogram, Metrics, to_prometheus
+
+
+class MetricsTestCase(TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 2), (10, 3), ('+Inf', 4)])
+        self.assertEqual((histogram.sum, histogram.count), (56.5, 4))
+
+    def test_inactive(self):
+        metrics = Metrics()
+        metrics.incr('requests')
+        with metrics.timer('seconds'):
+            pass
+        self.assertEqual(metrics.snapshot()['counters'], {})
+        self.assertEqual(metrics.snapshot()['histograms'], {})
+
+    def test_jsonl(self):
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.jsonl')
+        metrics = Metrics()
+        metrics.start('test', path=path, interval=60)
+        metrics.incr('requests', 2, stage='fetch')
+        metrics.gauge('depth', 3)
+        metrics.gauge('unknown', None)
+        with metrics.timer('seconds'):
+            pass
+        metrics.stop()
+
+        with open(path) as f:
+            snapshot = json.loads(f.readline())
+        self.assertEqual(snapshot['role'], 'test')
+        self.assertEqual(snapshot['counters'], {'requests{stage="fetch"}': 2})
+        self.assertEqual(snapshot['gauges'], {'depth': 3})
+        self.assertEqual(snapshot['histograms']['seconds']['count'], 1)
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.active = True
+        metrics.role = 'writer'
+        metrics.incr('items', function='a')
+        metrics.incr('items', function='b')
+        metrics.observe('seconds', 0.2, buckets=(0.1, 1))
+
+        snapshot = metrics.snapshot()
+        snapshot['pid'] = 1
+        self.assertEqual(to_prometheus(snapshot).splitlines(), [
+            '# TYPE items counter',
+            'items{function="a",role="writer",pid="1"} 1',
+            'items{function="b",role="writer",pid="1"} 1',
+            '# TYPE seconds histogram',
+            'seconds_bucket{role="writer",pid="1",le="0.1"} 0',
+            'seconds_bucket{role="writer",pid="1",le="1"} 1',
+            'seconds_bucket{role="writer",pid="1",le="+Inf"} 1',
+            'seconds_sum{role="writer",pid="1"} 0.2',
+            'seconds_count{role="writer",pid="1"} 1',
+        ])
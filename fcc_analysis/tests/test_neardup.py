@@ -0,0 +1,95 @@
+from unittest import TestCase
+
+import random
+
+from fcc_analysis.analyzers import fingerprint, simhash, text_analysis
+from fcc_analysis.neardup import LSHIndex, MinHasher, SimHasher, SimHashIndex, hamming, to_signed
+from fcc_analysis.sketches import hash64
+
+TEMPLATE = (
+    'The FCC Open Internet Rules (net neutrality rules) are extremely important to me. '
+    'I urge you to protect them. Cable and phone companies provide access to the internet, '
+    'they should not be allowed to control what we see and do online.'
+)
+
+
+class NearDuplicateTestCase(TestCase):
+
+    def test_signature_is_stable(self):
+        self.assertEqual(
+            MinHasher().signature(fingerprint({'text_data': TEMPLATE})),
+            MinHasher().signature(fingerprint({'text_data': TEMPLATE}))
+        )
+        self.assertIsNone(MinHasher().signature(''))
+
+    def test_clusters(self):
+        lsh = LSHIndex()
+        comments = [
+            ('1', TEMPLATE + ' Thanks, Chris'),
+            ('2', TEMPLATE + ' Sincerely, Amanda'),
+            ('3', 'I support net neutrality backed by Title II oversight of ISPs.'),
+            ('4', TEMPLATE),
+        ]
+        clusters = {
+            id_submission: lsh.cluster(id_submission, fingerprint({'text_data': text}))
+            for id_submission, text in comments
+        }
+        self.assertEqual(clusters, {'1': '1', '2': '1', '3': '3', '4': '1'})
+
+    def test_bounded(self):
+        lsh = LSHIndex(bands=4, rows=2, max_buckets=10)
+        for i in range(100):
+            lsh.cluster(str(i), 'word{} other{}'.format(i, i * 7))
+        self.assertEqual(len(lsh.buckets), 10)
+        self.assertEqual(lsh.cluster('x', ''), 'x')
+
+
+class SimHashTestCase(TestCase):
+
+    def test_matches_bit_counting(self):
+        generator = random.Random(3)
+        for _ in range(50):
+            words = {'w{}'.format(generator.randint(0, 500)) for _ in range(generator.randint(1, 200))}
+            hashes = [hash64(word) for word in words]
+            expected = 0
+            for bit in range(64):
+                if sum(hashed >> bit & 1 for hashed in hashes) > len(hashes) // 2:
+                    expected |= 1 << bit
+            exact = sum(hashes) & ((1 << 64) - 1)
+            self.assertEqual(SimHasher(cache_size=10).hashes(words), (to_signed(exact), to_signed(expected)))
+        self.assertEqual(SimHasher().hashes(set()), (None, None))
+
+    def test_same_words_as_fingerprint(self):
+        text = "It's the FCC's job -- not Comcast's -- to keep the 2015 rules. Re-classify!"
+        analysis = text_analysis(text, fingerprint='both')
+        words = set(analysis['fingerprint'].split())
+        self.assertEqual(analysis['fingerprint_hash'], SimHasher().hashes(words)[0])
+        self.assertEqual(text_analysis(text.upper(), fingerprint='simhash')['simhash'], analysis['simhash'])
+        self.assertNotIn('fingerprint', text_analysis(text, fingerprint='simhash'))
+        self.assertNotIn('simhash', text_analysis(text))
+
+    def test_near_duplicates(self):
+        first = simhash({'text_data': TEMPLATE + ' Thanks, Chris'})
+        second = simhash({'text_data': TEMPLATE + ' Sincerely, Amanda'})
+        other = simhash({'text_data': 'I support net neutrality backed by Title II oversight of ISPs.'})
+        self.assertLessEqual(hamming(first, second), 8)
+        self.assertGreater(hamming(first, other), 16)
+        self.assertIsNone(simhash({}))
+
+    def test_clusters(self):
+        index = SimHashIndex(distance=3)
+        base = simhash({'text_data': TEMPLATE})
+        near = base ^ 0b101
+        far = base ^ 0xFFFF0000FFFF
+        self.assertEqual(index.cluster('1', base), '1')
+        self.assertEqual(index.cluster('2', to_signed(near & ((1 << 64) - 1))), '1')
+        self.assertEqual(index.cluster('3', far), '3')
+        self.assertEqual(index.cluster('4', None), '4')
+        self.assertEqual(sorted(cluster for _, cluster in index.near(base ^ 0b1000)), ['1', '1'])
+
+    def test_bounded(self):
+        index = SimHashIndex(distance=1, max_buckets=10, bucket_size=2)
+        for i in range(100):
+            index.cluster(str(i), i << 40 | i)
+        self.assertEqual(len(index.buckets), 10)
+        self.assertTrue(all(len(bucket) <= 2 for bucket in index.buckets.values()))
@@ -0,0 +1,78 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from fcc_analysis.pool import WorkerPool
+
+
+def double(batch):
+    return [item * 2 for item in batch]
+
+
+def fail_on_three(batch):
+    if 3 in batch:
+        raise ValueError('three')
+    return batch
+
+
+def die_once(batch):
+    # The marker file outlives the worker, so only the first attempt dies.
+    marker = os.path.join(batch[0], 'died')
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return batch[1]
+
+
+class WorkerPoolTestCase(TestCase):
+
+    def test_map(self):
+        pool = WorkerPool(double, workers=3)
+        batches = [[i, i + 1] for i in range(20)]
+        self.assertEqual(list(pool.map(batches)), [double(batch) for batch in batches])
+        pool.shutdown()
+
+    def test_unordered(self):
+        pool = WorkerPool(double, workers=3, ordered=False)
+        batches = [[i, i + 1] for i in range(20)]
+        pairs = list(pool.map_batches(batches))
+        self.assertEqual(sorted(batch for batch, _ in pairs), batches)
+        for batch, result in pairs:
+            self.assertEqual(result, double(batch))
+        pool.shutdown()
+
+    def test_errors(self):
+        pool = WorkerPool(fail_on_three, workers=2)
+        with self.assertRaises(ValueError):
+            list(pool.map([[i] for i in range(10)]))
+        pool.shutdown(cancel=True)
+
+    def test_restart(self):
+        directory = tempfile.mkdtemp()
+        pool = WorkerPool(die_once, workers=2)
+        self.assertEqual(list(pool.map([(directory, i) for i in range(6)])), list(range(6)))
+        self.assertEqual(pool.restarts, 1)
+        pool.shutdown()
+
+    def test_scale(self):
+        pool = WorkerPool(double, workers=2, resize_interval=0)
+        pool.scale(1)
+        pool.scale(0.9)
+        self.assertEqual((pool.size, pool.limit), (1, 2))
+        batches = [[i, i + 1] for i in range(20)]
+        self.assertEqual(list(pool.map(batches)), [double(batch) for batch in batches])
+        for _ in range(10):
+            pool.scale(0)
+        self.assertEqual((pool.size, pool.limit), (2, 4))
+
+        # Batches in flight when the pool shrinks still finish.
+        results = pool.map(batches)
+        self.assertEqual(next(results), double(batches[0]))
+        pool.scale(1)
+        self.assertEqual(list(results), [double(batch) for batch in batches[1:]])
+        pool.shutdown()
+
+        pool = WorkerPool(double, workers=2)
+        pool.scale(1)
+        self.assertEqual(pool.size, 2)
+        pool.shutdown()
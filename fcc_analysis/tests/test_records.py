@@ -0,0 +1,73 @@
+from unittest import TestCase
+import json
+import os
+
+from fcc_analysis import codec
+from fcc_analysis.analyzers import analyze, analyze_batch, ingestion_method, onsite, proceeding_keys
+from fcc_analysis.records import Comment
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+FILINGS = [
+    {
+        'id_submission': '1',
+        'text_data': 'Net Neutrality is not negotiable. Keep it.',
+        'contact_email': 'someone@example.com',
+        'addressentity': {'address_line_1': '1 Main St', 'city': 'Springfield', 'state': 'IL'},
+        'proceedings': [{'name': '17-108', 'id_proceeding': 301759, '_index': 'proceedings'}],
+        'browser': 'Mozilla/5.0',
+        'filers': [{'name': 'Some One'}],
+    },
+    {
+        'id_submission': '2',
+        'text_data': 'Please roll back the Title II regulations',
+        'proceedings': [{'id_proceeding': 301760, 'name': '17-108'}],
+        'browser': 'OpenCSV/1.0',
+    },
+    {'id_submission': '3'},
+]
+
+
+class CommentTestCase(TestCase):
+
+    def setUp(self):
+        with open(os.path.join(DATA_DIR, 'unprecedented-bot.json')) as f:
+            self.filings = FILINGS + [json.load(f)]
+
+    def test_analyze(self):
+        for filing in self.filings:
+            comment = Comment.from_filing(filing)
+            self.assertEqual(analyze(comment), analyze(filing))
+
+        self.assertEqual(
+            analyze_batch([Comment.from_filing(filing) for filing in self.filings]),
+            analyze_batch(self.filings)
+        )
+
+    def test_fields(self):
+        comment = Comment.from_filing(FILINGS[0])
+        self.assertEqual(comment.address, ('1 Main St', 'Springfield', 'IL', None))
+        self.assertEqual(comment.proceedings, (('_index', 'id_proceeding', 'name'),))
+        self.assertEqual(comment.name, 'Some One')
+        self.assertEqual(proceeding_keys(comment), '_index id_proceeding name')
+        self.assertTrue(onsite(comment))
+        self.assertEqual(ingestion_method(comment), 'direct')
+        self.assertEqual(ingestion_method(FILINGS[1]), 'csv')
+
+        empty = Comment.from_filing(FILINGS[2])
+        self.assertIsNone(empty.address)
+        self.assertIsNone(empty.name)
+        self.assertIsNone(proceeding_keys(empty))
+        self.assertEqual(ingestion_method(empty), 'api')
+
+    def test_interning(self):
+        first = Comment.from_filing(FILINGS[1])
+        second = Comment.from_filing(dict(FILINGS[1], proceedings=[{'name': '17-108', 'id_proceeding': 1}]))
+        self.assertIs(first.proceedings, second.proceedings)
+
+        # Rows that went through a process boundary share them too.
+        row = codec.loads(codec.dumps(second.to_row()))
+        copy = Comment.from_row(row)
+        self.assertEqual(copy, second)
+        self.assertIs(copy.proceedings, first.proceedings)
+        self.assertIs(copy.browser, first.browser)
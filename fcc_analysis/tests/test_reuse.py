@@ -0,0 +1,76 @@
+from unittest import TestCase
+import copy
+
+from fcc_analysis.analyze import CommentAnalyzer
+from fcc_analysis.analyzers import analyze
+from fcc_analysis.records import Comment
+from fcc_analysis.reuse import ReuseSketch, SIGNALS, submitter_keys
+from fcc_analysis.tests.fakes import FakeElasticsearch, make_filings
+
+
+def make_reuse_filings(count):
+    filings = make_filings(count)
+    for i, filing in enumerate(filings):
+        # Ten names at each of five addresses, with emails following the names.
+        filing['filers'] = [{'name': 'Person {}.'.format(chr(ord('A') + i % 10))}]
+        filing['contact_email'] = 'person.{}{}@example{}.com'.format(chr(ord('a') + i % 10), i, i % 2)
+        filing['addressentity'] = {
+            'address_line_1': '{} Main St'.format(i % 5),
+            'city': 'Springfield',
+            'state': 'IL',
+            'zip_code': '62701',
+        }
+    return filings
+
+
+class ReuseTestCase(TestCase):
+
+    def setUp(self):
+        self.filings = make_reuse_filings(100)
+
+    def make_sketch(self, filings):
+        sketch = ReuseSketch(width=1 << 12, capacity=10000)
+        for filing in filings:
+            sketch.add(filing)
+        return sketch
+
+    def test_keys(self):
+        comment = Comment(contact_email=' J.Smith_42@Example.COM', address=('1  Main St', 'Town', 'ST', '1'),
+                          name='  Smith, J. ')
+        self.assertEqual(submitter_keys(comment), (
+            '1 main st | town | st | 1', 'smith j', 'j.smith_42@example.com', 'example.com', 'jsmith@example.com'
+        ))
+        self.assertEqual(submitter_keys(Comment(contact_email='no-at-sign')), (None, None, 'no-at-sign', None, None))
+
+    def test_signals(self):
+        sketch = self.make_sketch(self.filings)
+        self.assertEqual(sketch.total, 100)
+        self.assertEqual(sketch.signals(self.filings[3]), {
+            'address_reuse_count': 20,
+            'address_name_count': 2,
+            'name_reuse_count': 10,
+            'email_reuse_count': 1,
+            'email_domain_count': 50,
+            'email_pattern_count': 10,
+        })
+
+        # Seeing the same comments again doesn't add different names or emails.
+        for filing in self.filings:
+            sketch.add(filing)
+        signals = sketch.signals(Comment.from_filing(self.filings[3]))
+        self.assertEqual((signals['address_reuse_count'], signals['address_name_count']), (40, 2))
+        self.assertEqual(signals['email_pattern_count'], 10)
+
+        self.assertEqual(sketch.signals({'id_submission': '1'}), dict.fromkeys(SIGNALS))
+
+    def test_run(self):
+        expected = {filing['id_submission']: filing for filing in self.filings}
+        with FakeElasticsearch(copy.deepcopy(expected)) as server:
+            CommentAnalyzer(endpoint=server.url, batch_size=7, workers=2,
+                            reuse=ReuseSketch(width=1 << 12, capacity=10000)).run()
+
+        sketch = self.make_sketch(self.filings)
+        for key, document in server.documents.items():
+            expected_analysis = analyze(expected[key])
+            expected_analysis.update(sketch.signals(expected[key]))
+            self.assertEqual(document['analysis'], expected_analysis)
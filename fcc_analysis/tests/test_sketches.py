@@ -0,0 +1,109 @@
+from unittest import TestCase
+
+from fcc_analysis.sketches import BloomFilter, CountMinSketch, HyperLogLog, SpaceSaving
+
+
+class HyperLogLogTestCase(TestCase):
+
+    def test_count(self):
+        for total in (0, 100, 50000):
+            sketch = HyperLogLog()
+            for i in range(total):
+                sketch.add('value {}'.format(i))
+                sketch.add('value {}'.format(i))
+            self.assertAlmostEqual(sketch.count(), total, delta=total * 0.03)
+
+    def test_merge(self):
+        a, b, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+        for i in range(3000):
+            (a if i % 2 else b).add(str(i))
+            union.add(str(i))
+        self.assertEqual(a.merge(b).count(), union.count())
+
+        with self.assertRaises(ValueError):
+            a.merge(HyperLogLog(10))
+
+
+class SpaceSavingTestCase(TestCase):
+
+    def get_stream(self):
+        stream = []
+        for i in range(2000):
+            stream.append('rare {}'.format(i))
+            if i % 2 == 0:
+                stream.append('common')
+            if i % 5 == 0:
+                stream.append('less common')
+        return stream
+
+    def test_top(self):
+        sketch = SpaceSaving(k=20)
+        for value in self.get_stream():
+            sketch.add(value)
+
+        top = sketch.top(2)
+        self.assertEqual([value for value, count, error in top], ['common', 'less common'])
+        for value, count, error in top:
+            self.assertLessEqual(count - error, {'common': 1000, 'less common': 400}[value])
+            self.assertGreaterEqual(count, {'common': 1000, 'less common': 400}[value])
+
+    def test_merge(self):
+        stream = self.get_stream()
+        a, b = SpaceSaving(k=20), SpaceSaving(k=20)
+        for i, value in enumerate(stream):
+            (a if i % 3 else b).add(value)
+
+        merged = a.merge(b)
+        self.assertEqual(len(merged.counts), 20)
+        self.assertEqual([value for value, count, error in merged.top(2)], ['common', 'less common'])
+        self.assertGreaterEqual(merged.counts['common'], 1000)
+
+
+class CountMinSketchTestCase(TestCase):
+
+    def test_count(self):
+        sketch = CountMinSketch(width=8192, depth=4)
+        for i in range(5000):
+            sketch.add('rare {}'.format(i))
+            if i % 5 == 0:
+                self.assertEqual(sketch.add('common'), i // 5 + 1)
+
+        self.assertEqual(sketch.count('common'), 1000)
+        self.assertEqual(sketch.count('never added'), 0)
+        estimates = [sketch.count('rare {}'.format(i)) for i in range(5000)]
+        self.assertGreaterEqual(min(estimates), 1)
+        # Conservative adds keep most rare counts exact, though the common value shares their counters.
+        self.assertGreater(estimates.count(1), 4500)
+
+    def test_merge(self):
+        a, b = CountMinSketch(width=256, depth=3), CountMinSketch(width=256, depth=3)
+        for i in range(300):
+            (a if i % 2 else b).add('value', 2)
+        self.assertEqual(a.merge(b).count('value'), 600)
+
+        with self.assertRaises(ValueError):
+            a.merge(CountMinSketch(width=128, depth=3))
+
+
+class BloomFilterTestCase(TestCase):
+
+    def test_add(self):
+        bloom = BloomFilter(capacity=10000, error=0.01)
+        self.assertEqual(bloom.hashes, 7)
+        self.assertTrue(all(bloom.add('value {}'.format(i)) for i in range(0, 10000, 2)))
+        self.assertFalse(bloom.add('value 0'))
+        self.assertTrue(all('value {}'.format(i) in bloom for i in range(0, 10000, 2)))
+
+        false_positives = sum('value {}'.format(i) in bloom for i in range(1, 10000, 2))
+        self.assertLess(false_positives, 50)
+
+    def test_merge(self):
+        a, b = BloomFilter(capacity=1000), BloomFilter(capacity=1000)
+        a.add('a')
+        b.add('b')
+        a.merge(b)
+        self.assertIn('a', a)
+        self.assertIn('b', a)
+
+        with self.assertRaises(ValueError):
+            a.merge(BloomFilter(capacity=100))
@@ -0,0 +1,54 @@
+from unittest import TestCase
+import io
+import json
+import tempfile
+
+from fcc_analysis.analyzers import analyze
+from fcc_analysis.stats import CommentStats, StatsRunner
+from fcc_analysis.storage import LocalBackend
+from fcc_analysis.tests.fakes import make_filings
+
+
+class StatsTestCase(TestCase):
+
+    def get_filings(self):
+        filings = make_filings(90)
+        for filing in filings[30:]:
+            # Digits don't survive fingerprinting, so spell the number out in letters.
+            filing['text_data'] = 'Comment number {}'.format(''.join(chr(97 + int(d)) for d in filing['id_submission']))
+        for filing in filings[:30]:
+            filing['text_data'] = 'I want to keep net neutrality. Keep Title II.'
+        filings[-1].pop('text_data')
+        return filings
+
+    def test_report(self):
+        filings = self.get_filings()
+        stats = CommentStats(top=5)
+        for filing in filings:
+            stats.add(filing, analyze(filing))
+        report = stats.report()
+
+        self.assertEqual(report['total'], 90)
+        self.assertEqual(sum(report['counts']['source'].values()), 90)
+        self.assertEqual(report['counts']['titleii']['true'], 30)
+        self.assertEqual(report['counts']['titleii']['null'], 60)
+        self.assertEqual(report['days']['2017-05-01'], 4)
+        self.assertAlmostEqual(report['distinct_fingerprints'], 59, delta=2)
+        self.assertEqual(report['top_fingerprints'][0]['count'], 30)
+
+        output = io.StringIO()
+        stats.write_csv(output)
+        self.assertIn('titleii,true,30', output.getvalue().splitlines())
+
+    def test_runner(self):
+        backend = LocalBackend(tempfile.mkdtemp(), shards=4)
+        writer = backend.document_writer()
+        for filing in self.get_filings():
+            writer.add(filing)
+        writer.close()
+
+        single = StatsRunner(backend=backend).run().report()
+        sliced = StatsRunner(backend=backend, slices=3, batch_size=7).run().report()
+        self.assertEqual(single, sliced)
+        self.assertEqual(single['total'], 90)
+        json.dumps(single)
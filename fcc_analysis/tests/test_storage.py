@@ -0,0 +1,107 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from fcc_analysis.analyze import CommentAnalyzer
+from fcc_analysis.analyzers import analyze, ANALYZER_VERSION
+from fcc_analysis.index import CommentIndexer
+from fcc_analysis.storage import LocalBackend
+from fcc_analysis.tests.fakes import FakeECFS, make_filings
+
+
+class LocalBackendTestCase(TestCase):
+
+    def get_backend(self, **kwargs):
+        return LocalBackend(tempfile.mkdtemp(), shards=4, **kwargs)
+
+    def write(self, backend, filings):
+        writer = backend.document_writer()
+        for filing in filings:
+            writer.add(filing)
+        writer.close()
+
+    def test_round_trip(self):
+        filings = make_filings(50)
+        for compression in ('gzip', 'none'):
+            backend = self.get_backend(compression=compression)
+            self.write(backend, filings[:30])
+            self.write(backend, filings[20:])
+
+            comments = list(backend.iter_comments(progress=False))
+            self.assertEqual(sorted(comments, key=lambda c: c['id_submission']), filings)
+
+            sliced = []
+            for slice_id in range(3):
+                sliced.extend(backend.iter_comments(fields=['id_submission'], slice_id=slice_id, slices=3, progress=False))
+            self.assertEqual(sorted(c['id_submission'] for c in sliced), [f['id_submission'] for f in filings])
+            self.assertEqual(set(len(comment) for comment in sliced), {1})
+
+    def test_manifest(self):
+        backend = self.get_backend(compression='none')
+        reopened = LocalBackend(backend.path, shards=16)
+        self.assertEqual((reopened.shards, reopened.compression), (4, 'none'))
+        with self.assertRaises(ValueError):
+            LocalBackend(tempfile.mkdtemp(), compression='lz4')
+
+    def test_stale_version(self):
+        backend = self.get_backend()
+        filings = make_filings(20)
+        self.write(backend, filings)
+
+        writer = backend.analysis_writer()
+        for filing in filings[:10]:
+            writer.add(filing['id_submission'], {'version': 'old'})
+        writer.close()
+        writer = backend.analysis_writer()
+        for filing in filings[5:15]:
+            writer.add(filing['id_submission'], {'version': 'new'})
+        writer.close()
+
+        stale = list(backend.iter_comments(stale_version='new', progress=False))
+        self.assertEqual(
+            sorted(c['id_submission'] for c in stale),
+            [f['id_submission'] for f in filings[:5] + filings[15:]]
+        )
+
+    def test_compact_analyses(self):
+        backend = self.get_backend()
+        filings = make_filings(20)
+        self.write(backend, filings)
+        for version, written in (('old', filings[:10]), ('new', filings[5:15])):
+            writer = backend.analysis_writer()
+            for filing in written:
+                writer.add(filing['id_submission'], {'version': version})
+            writer.close()
+        analyses = [backend.load_analyses(shard) for shard in range(backend.shards)]
+
+        backend.compact_analyses()
+        self.assertEqual([backend.load_analyses(shard) for shard in range(backend.shards)], analyses)
+        self.assertEqual(len(os.listdir(os.path.join(backend.path, 'analysis'))), backend.shards)
+
+        # Later writers still win over the compacted files.
+        writer = backend.analysis_writer()
+        writer.add(filings[0]['id_submission'], {'version': 'newer'})
+        writer.close()
+        shard = backend.shard_for(filings[0]['id_submission'])
+        self.assertEqual(backend.load_analyses(shard)[filings[0]['id_submission']], {'version': 'newer'})
+
+
+class OfflinePipelineTestCase(TestCase):
+
+    def test_index_and_analyze(self):
+        path = tempfile.mkdtemp()
+        filings = make_filings(120)
+        with FakeECFS(filings) as server:
+            CommentIndexer(fcc_endpoint=server.url, limit=25, concurrency=2, store=path).run()
+
+        CommentAnalyzer(store=path, batch_size=10).run()
+        CommentAnalyzer(store=path, slices=2, incremental=True).run()
+
+        backend = LocalBackend(path)
+        self.assertEqual(len(list(backend.iter_comments(progress=False))), 120)
+        self.assertEqual(list(backend.iter_comments(stale_version=ANALYZER_VERSION, progress=False)), [])
+
+        analyses = {}
+        for shard in range(backend.shards):
+            analyses.update(backend.load_analyses(shard))
+        self.assertEqual(analyses, {f['id_submission']: analyze(f) for f in filings})
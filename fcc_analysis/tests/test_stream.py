@@ -0,0 +1,78 @@
+from unittest import TestCase
+from unittest import mock
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+
+from fcc_analysis import bin
+from fcc_analysis.analyzers import analyze
+from fcc_analysis.records import Comment
+from fcc_analysis.stream import analyze_stream
+from fcc_analysis.tests.fakes import make_filings
+
+
+class AnalyzeStreamTestCase(TestCase):
+
+    def setUp(self):
+        self.filings = make_filings(95)
+
+    def test_ordered(self):
+        for workers in (0, 2):
+            pairs = list(analyze_stream(iter(self.filings), workers=workers, chunksize=10))
+            self.assertEqual([comment for comment, _ in pairs], self.filings)
+            self.assertEqual([analysis for _, analysis in pairs], [analyze(filing) for filing in self.filings])
+
+    def test_unordered(self):
+        pairs = list(analyze_stream(self.filings, workers=3, chunksize=7, ordered=False, fingerprint='simhash'))
+        self.assertEqual(sorted(comment['id_submission'] for comment, _ in pairs),
+                         [filing['id_submission'] for filing in self.filings])
+        for comment, analysis in pairs:
+            self.assertEqual(analysis, analyze(comment, fingerprint='simhash'))
+
+    def test_records(self):
+        comments = [Comment.from_filing(filing) for filing in self.filings]
+        pairs = list(analyze_stream(comments, workers=2, cache_size=0))
+        self.assertIs(pairs[0][0], comments[0])
+        self.assertEqual(pairs[0][1], analyze(self.filings[0]))
+
+    def test_bounded(self):
+        consumed = []
+
+        def comments():
+            for filing in self.filings:
+                consumed.append(filing)
+                yield filing
+
+        stream = analyze_stream(comments(), workers=2, chunksize=5)
+        next(stream)
+        # Two chunks per worker in flight, and the one that's being yielded from.
+        self.assertLessEqual(len(consumed), 5 * 5)
+        stream.close()
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'filings.json')
+        output = os.path.join(directory, 'analyses.jsonl.gz')
+        with open(path, 'w') as f:
+            json.dump(self.filings, f)
+
+        cache = os.path.join(directory, 'cache.sqlite')
+        with mock.patch('sys.argv', ['fcc', 'analyze', '--input', path, '--output', output, '-w', '2',
+                                     '--cache', cache]):
+            bin.main()
+        with gzip.open(output, 'rt') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [
+            {'id_submission': filing['id_submission'], 'analysis': analyze(filing)} for filing in self.filings
+        ])
+        with sqlite3.connect(cache) as connection:
+            self.assertGreater(connection.execute('SELECT COUNT(*) FROM analyses').fetchone()[0], 0)
+
+        # Options for reading from an index or store aren't silently ignored.
+        for option in (['--near-duplicates'], ['--autoscale'], ['--no-shared-memory'], ['--page-size', '10'],
+                       ['--endpoint', 'http://localhost:9201/'], ['--compression', 'none']):
+            with mock.patch('sys.argv', ['fcc', 'analyze', '--input', path] + option):
+                with mock.patch('sys.stderr'), self.assertRaises(SystemExit):
+                    bin.main()
@@ -0,0 +1,47 @@
+from unittest import TestCase
+import multiprocessing
+
+from fcc_analysis.transport import SharedSlots
+
+
+def echo(slots, handle, results):
+    results.put(slots.take(handle))
+
+
+class SharedSlotsTestCase(TestCase):
+
+    def test_slots(self):
+        slots = SharedSlots(slots=2, slot_size=16)
+        try:
+            first, second = slots.put(b'first'), slots.put(b'second')
+            self.assertIsNotNone(first[0])
+            self.assertIsNotNone(second[0])
+
+            # Too big, or out of slots: the payload goes in the handle.
+            self.assertEqual(slots.put(b'x' * 17), (None, b'x' * 17))
+            self.assertEqual(slots.put(b'third'), (None, b'third'))
+
+            self.assertEqual(slots.read(first), b'first')
+            slots.release(first)
+            self.assertEqual(slots.take(second), b'second')
+            self.assertEqual(slots.take(slots.put(b'fourth')), b'fourth')
+        finally:
+            slots.close()
+
+    def test_processes(self):
+        slots = SharedSlots(slots=4, slot_size=1024)
+        results = multiprocessing.Queue()
+        try:
+            handle = slots.put(b'across processes')
+            process = multiprocessing.Process(target=echo, args=(slots, handle, results))
+            process.start()
+            self.assertEqual(results.get(timeout=5), b'across processes')
+            process.join()
+        finally:
+            slots.close()
+
+    def test_disabled(self):
+        slots = SharedSlots(slots=0)
+        self.assertEqual(slots.put(b'data'), (None, b'data'))
+        self.assertEqual(slots.take((None, b'data')), b'data')
+        slots.close()
@@ -0,0 +1,82 @@
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+
+class SharedSlots:
+    '''Hands bytes between processes through a block of shared memory.
+
+    The block is cut into ``slots`` slots of ``slot_size`` bytes. ``put()``
+    copies a payload into a free slot and returns a small handle, which is all
+    that has to go through a queue or pipe; ``read()`` copies it back out in
+    another process, and ``release()`` frees the slot. ``take()`` does both.
+
+    Payloads that don't fit in a slot, or that arrive while every slot is in
+    use, travel inside the handle instead. A full buffer never blocks anyone,
+    so it can't deadlock a pipeline that already has its own backpressure.
+    With no slots at all, every payload travels that way.
+    '''
+
+    def __init__(self, slots=16, slot_size=1 << 20):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.memory = None
+        self.owner = True
+        # The block starts with a byte per slot, set while the slot is in use.
+        # Any process can take or free a slot, so the table is locked.
+        self.lock = multiprocessing.Lock()
+        if slots:
+            self.memory = shared_memory.SharedMemory(create=True, size=slots + slots * slot_size)
+            self.memory.buf[:slots] = bytes(slots)
+
+    def put(self, data):
+        if self.memory is None or len(data) > self.slot_size:
+            return (None, data)
+
+        with self.lock:
+            slot = bytes(self.memory.buf[:self.slots]).find(0)
+            if slot == -1:
+                return (None, data)
+            self.memory.buf[slot] = 1
+
+        start = self.slots + slot * self.slot_size
+        self.memory.buf[start:start + len(data)] = data
+        return (slot, len(data))
+
+    def read(self, handle):
+        slot, data = handle
+        if slot is None:
+            return data
+        start = self.slots + slot * self.slot_size
+        return bytes(self.memory.buf[start:start + data])
+
+    def release(self, handle):
+        if handle[0] is not None:
+            with self.lock:
+                self.memory.buf[handle[0]] = 0
+
+    def take(self, handle):
+        data = self.read(handle)
+        self.release(handle)
+        return data
+
+    def close(self):
+        if self.memory is None:
+            return
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
+
+    def __getstate__(self):
+        # Only used where workers are spawned rather than forked.
+        state = self.__dict__.copy()
+        state['memory'] = self.memory.name if self.memory is not None else None
+        state['owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.memory is not None:
+            self.memory = shared_memory.SharedMemory(name=self.memory)
+            # Otherwise the resource tracker unlinks the block when this process exits.
+            resource_tracker.unregister(self.memory._name, 'shared_memory')